@@ -0,0 +1,246 @@
+"""
+Activity counters of an alias: nb_forward, nb_blocked, nb_reply and last_activity_at on GenEmail.
+They are incremented when the email handler writes the ForwardEmailLog, in the same transaction,
+so the dashboard doesn't have to count the logs.
+
+backfill() sets them from the logs, check() finds (and fixes) the aliases whose counters
+don't match their logs, both while the email handler is running. The logs compacted into
+AliasActivityDaily (forward_log_compaction.py) are counted too.
+
+The counters of the existing aliases are set by the migration that adds them (b7d2e4a1c9f3).
+The scheduled check (cron.py) only looks at the aliases with logs written since the previous
+run, found via the created_at index of ForwardEmailLog, instead of counting all the logs.
+"""
+from typing import Dict, Iterable, List, Optional
+
+import arrow
+from sqlalchemy import and_, bindparam, case, func, not_, or_, select
+
+from app.extensions import db
+from app.log import LOG
+from app.models import GenEmail, ForwardEmail, ForwardEmailLog, AliasActivityDaily
+
+_is_reply = ForwardEmailLog.is_reply
+_is_blocked = and_(not_(ForwardEmailLog.is_reply), ForwardEmailLog.blocked)
+_is_forward = and_(not_(ForwardEmailLog.is_reply), not_(ForwardEmailLog.blocked))
+
+
+def increment(rows: List[dict]):
+    """increment the counters with the ForwardEmailLog rows being inserted.
+    Each row has gen_email_id, is_reply, blocked and created_at. Doesn't commit"""
+    deltas: Dict[int, dict] = {}
+    for row in rows:
+        delta = deltas.setdefault(
+            row["gen_email_id"],
+            {
+                "b_gen_email_id": row["gen_email_id"],
+                "b_nb_forward": 0,
+                "b_nb_blocked": 0,
+                "b_nb_reply": 0,
+                "b_last_activity_at": row["created_at"],
+            },
+        )
+        if row["is_reply"]:
+            delta["b_nb_reply"] += 1
+        elif row["blocked"]:
+            delta["b_nb_blocked"] += 1
+        else:
+            delta["b_nb_forward"] += 1
+
+        delta["b_last_activity_at"] = max(
+            delta["b_last_activity_at"], row["created_at"]
+        )
+
+    _add(deltas.values())
+
+
+def decrement_contact(forward_email: ForwardEmail):
+    """remove the activity of a contact that is going to be deleted, with its logs.
+    Doesn't commit"""
+    nb_forward, nb_blocked, nb_reply = (
+        db.session.query(*log_counts())
+        .filter(ForwardEmailLog.forward_id == forward_email.id)
+        .one()
+    )
+
+    if nb_forward or nb_blocked or nb_reply:
+        GenEmail.query.filter(GenEmail.id == forward_email.gen_email_id).update(
+            {
+                GenEmail.nb_forward: GenEmail.nb_forward - (nb_forward or 0),
+                GenEmail.nb_blocked: GenEmail.nb_blocked - (nb_blocked or 0),
+                GenEmail.nb_reply: GenEmail.nb_reply - (nb_reply or 0),
+                GenEmail.updated_at: GenEmail.updated_at,
+            },
+            synchronize_session=False,
+        )
+
+
+def backfill():
+    """set the counters of all aliases from their logs.
+    Safe to run while the email handler increments the counters, see _deltas()"""
+    deltas = _deltas()
+    _add(deltas)
+    db.session.commit()
+
+    LOG.d("set activity counters of %s aliases", len(deltas))
+
+
+def check(fix=False, since: Optional[arrow.Arrow] = None) -> List[int]:
+    """return the id of the aliases whose counters don't match their logs.
+    Their counters are corrected if fix.
+    If since, only the aliases with logs created since are checked"""
+    deltas = _deltas(since)
+    for delta in deltas:
+        LOG.warning(
+            "alias %s counters are off by %s",
+            delta["b_gen_email_id"],
+            (delta["b_nb_forward"], delta["b_nb_blocked"], delta["b_nb_reply"]),
+        )
+
+    if fix and deltas:
+        _add(deltas)
+        db.session.commit()
+
+    return [delta["b_gen_email_id"] for delta in deltas]
+
+
+def log_counts():
+    """nb_forward, nb_blocked, nb_reply of the selected ForwardEmailLog"""
+    return _count(_is_forward), _count(_is_blocked), _count(_is_reply)
+
+
+def _count(condition):
+    return func.sum(case([(condition, 1)], else_=0))
+
+
+def _deltas(since: Optional[arrow.Arrow] = None) -> List[dict]:
+    """what must be added to the counters of each alias to match its logs
+    and compacted logs, for the aliases whose counters are wrong.
+    If since, only for the aliases with logs created since.
+
+    The counters and the logs are read by the same statement, i.e. from the same snapshot:
+    a log written later by the email handler increments the counter in the same transaction,
+    so adding the deltas (instead of setting the counters) doesn't lose it."""
+    aliases = None
+    if since:
+        aliases = (
+            db.session.query(ForwardEmail.gen_email_id)
+            .filter(
+                ForwardEmailLog.forward_id == ForwardEmail.id,
+                ForwardEmailLog.created_at >= since,
+            )
+            .distinct()
+            .subquery()
+        )
+        # from the subquery: not correlated with the log tables of the queries below
+        aliases = select([aliases.c.gen_email_id])
+
+    logs = (
+        db.session.query(
+            ForwardEmail.gen_email_id.label("gen_email_id"),
+            *[
+                count.label(name)
+                for count, name in zip(
+                    log_counts(), ("nb_forward", "nb_blocked", "nb_reply")
+                )
+            ],
+            func.max(ForwardEmailLog.created_at).label("last_activity_at"),
+        )
+        .filter(ForwardEmailLog.forward_id == ForwardEmail.id)
+        .group_by(ForwardEmail.gen_email_id)
+    )
+    if since:
+        logs = logs.filter(ForwardEmail.gen_email_id.in_(aliases))
+    logs = logs.subquery()
+
+    daily = db.session.query(
+        AliasActivityDaily.gen_email_id.label("gen_email_id"),
+        func.sum(AliasActivityDaily.nb_forward).label("nb_forward"),
+        func.sum(AliasActivityDaily.nb_blocked).label("nb_blocked"),
+        func.sum(AliasActivityDaily.nb_reply).label("nb_reply"),
+        func.max(AliasActivityDaily.date).label("last_date"),
+    ).group_by(AliasActivityDaily.gen_email_id)
+    if since:
+        daily = daily.filter(AliasActivityDaily.gen_email_id.in_(aliases))
+    daily = daily.subquery()
+
+    q = db.session.query(
+        GenEmail.id,
+        GenEmail.nb_forward,
+        GenEmail.nb_blocked,
+        GenEmail.nb_reply,
+        logs.c.nb_forward,
+        logs.c.nb_blocked,
+        logs.c.nb_reply,
+        logs.c.last_activity_at,
+        daily.c.nb_forward,
+        daily.c.nb_blocked,
+        daily.c.nb_reply,
+        daily.c.last_date,
+    )
+    if since:
+        q = q.filter(GenEmail.id.in_(aliases))
+
+    deltas = []
+    # also look at aliases without logs: their counters must be 0
+    for r in (
+        q.outerjoin(logs, logs.c.gen_email_id == GenEmail.id)
+        .outerjoin(daily, daily.c.gen_email_id == GenEmail.id)
+        .yield_per(1000)
+    ):
+        expected = [(r[4 + i] or 0) + (r[8 + i] or 0) for i in range(3)]
+        if tuple(expected) == tuple(r[1:4]):
+            continue
+
+        # the time of the last compacted log is lost, only its day is known
+        last_activity_at = r[7] or (arrow.get(r[11]) if r[11] else None)
+        deltas.append(
+            {
+                "b_gen_email_id": r[0],
+                "b_nb_forward": expected[0] - r[1],
+                "b_nb_blocked": expected[1] - r[2],
+                "b_nb_reply": expected[2] - r[3],
+                "b_last_activity_at": last_activity_at,
+            }
+        )
+
+    return deltas
+
+
+def _add(deltas: Iterable[dict]):
+    """add the deltas to the counters. Doesn't commit"""
+    # always update the rows in the same order to avoid deadlocks between email handlers
+    deltas = sorted(deltas, key=lambda delta: delta["b_gen_email_id"])
+    if not deltas:
+        return
+
+    table = GenEmail.__table__
+    last_activity_at = bindparam(
+        "b_last_activity_at", type_=table.c.last_activity_at.type
+    )
+    stmt = (
+        table.update()
+        .where(table.c.id == bindparam("b_gen_email_id"))
+        .values(
+            nb_forward=table.c.nb_forward + bindparam("b_nb_forward"),
+            nb_blocked=table.c.nb_blocked + bindparam("b_nb_blocked"),
+            nb_reply=table.c.nb_reply + bindparam("b_nb_reply"),
+            # logs recovered after a crash can be older than the last activity
+            last_activity_at=case(
+                [
+                    (
+                        or_(
+                            table.c.last_activity_at.is_(None),
+                            table.c.last_activity_at < last_activity_at,
+                        ),
+                        last_activity_at,
+                    )
+                ],
+                else_=table.c.last_activity_at,
+            ),
+            # the alias itself doesn't change
+            updated_at=table.c.updated_at,
+        )
+    )
+
+    db.session.execute(stmt, deltas)
@@ -0,0 +1,160 @@
+"""
+In-memory directory of aliases used by the email handler so that forwarding an email
+does not need to look up the alias and its user in the database.
+
+The directory is loaded at startup and then refreshed incrementally: only aliases and
+users changed since the last refresh are queried, deleted aliases are found via DeletedAlias.
+A full reload is done every ALIAS_DIRECTORY_TTL seconds to catch what the incremental
+refresh can't see, for ex. aliases removed when their user or custom domain is deleted.
+Until then the email handler checks that the alias still exists before creating a contact,
+and forgets it if not.
+"""
+import threading
+import time
+from typing import NamedTuple, Optional, Dict
+
+import arrow
+from sqlalchemy import or_
+
+from app.config import ALIAS_DIRECTORY_REFRESH, ALIAS_DIRECTORY_TTL
+from app.extensions import db
+from app.log import LOG
+from app.models import GenEmail, User, DeletedAlias
+
+# the incremental refresh also looks at changes made slightly before the previous refresh
+# in case the clocks of the servers writing to the database are not exactly in sync
+_REFRESH_OVERLAP = 10  # in seconds
+
+
+class AliasEntry(NamedTuple):
+    gen_email_id: int
+    user_id: int
+    user_email: str
+    enabled: bool
+    custom_domain_id: Optional[int]
+
+
+class AliasDirectory:
+    def __init__(
+        self, refresh_interval=ALIAS_DIRECTORY_REFRESH, ttl=ALIAS_DIRECTORY_TTL
+    ):
+        self.refresh_interval = refresh_interval
+        self.ttl = ttl
+
+        self._entries: Dict[str, AliasEntry] = {}
+        self._lock = threading.Lock()
+        # changes made after this time are not in the directory yet
+        self._watermark: Optional[arrow.Arrow] = None
+        self._last_refresh = 0
+        self._last_load = 0
+
+    def get(self, email) -> Optional[AliasEntry]:
+        """return the alias entry, None if the alias does not exist.
+        Must be called inside an app context"""
+        self._refresh_if_needed()
+
+        entry = self._entries.get(email)
+        if entry:
+            return entry
+
+        # the alias might have been created after the last refresh
+        row = self._query().filter(GenEmail.email == email).first()
+        if not row:
+            return None
+
+        LOG.d("alias %s not in directory yet", email)
+        return self._add(row)
+
+    def forget(self, email):
+        """remove an alias that doesn't exist anymore"""
+        self._entries.pop(email, None)
+
+    def load(self):
+        """(re)load all aliases"""
+        start = arrow.utcnow()
+        entries = {}
+        for row in self._query().yield_per(1000):
+            entries[row[0]] = _to_entry(row)
+
+        self._entries = entries
+        self._watermark = start
+        self._last_load = self._last_refresh = time.time()
+        LOG.d("load %s aliases in directory", len(entries))
+
+    def refresh(self):
+        """apply the changes made since the last refresh"""
+        if self._watermark is None:
+            return self.load()
+
+        start = arrow.utcnow()
+        since = self._watermark.shift(seconds=-_REFRESH_OVERLAP)
+
+        q = self._query().filter(
+            or_(
+                GenEmail.created_at > since,
+                GenEmail.updated_at > since,
+                User.updated_at > since,
+            )
+        )
+        nb_change = 0
+        for row in q:
+            self._add(row)
+            nb_change += 1
+
+        for (email,) in db.session.query(DeletedAlias.email).filter(
+            DeletedAlias.created_at > since
+        ):
+            if self._entries.pop(email, None):
+                nb_change += 1
+
+        self._watermark = start
+        self._last_refresh = time.time()
+        if nb_change:
+            LOG.d("apply %s changes to alias directory", nb_change)
+
+    def _refresh_if_needed(self):
+        now = time.time()
+        if now - self._last_refresh < self.refresh_interval:
+            return
+
+        # only one thread refreshes, the others keep using the current entries
+        if not self._lock.acquire(blocking=False):
+            return
+
+        try:
+            if now - self._last_load >= self.ttl:
+                self.load()
+            else:
+                self.refresh()
+        finally:
+            self._lock.release()
+
+    def _add(self, row) -> AliasEntry:
+        entry = _to_entry(row)
+        self._entries[row[0]] = entry
+        return entry
+
+    @staticmethod
+    def _query():
+        return db.session.query(
+            GenEmail.email,
+            GenEmail.id,
+            User.id,
+            User.email,
+            GenEmail.enabled,
+            GenEmail.custom_domain_id,
+        ).filter(GenEmail.user_id == User.id)
+
+
+def _to_entry(row) -> AliasEntry:
+    _, gen_email_id, user_id, user_email, enabled, custom_domain_id = row
+    return AliasEntry(
+        gen_email_id=gen_email_id,
+        user_id=user_id,
+        user_email=user_email,
+        enabled=enabled,
+        custom_domain_id=custom_domain_id,
+    )
+
+
+alias_directory = AliasDirectory()
@@ -0,0 +1,142 @@
+"""
+Search the aliases of a user by their email, record where they are used,
+and enable, disable or delete many aliases at once.
+
+The search is a substring match: LIKE '%query%'. On Postgres it's served by the
+pg_trgm GIN index ix_gen_email_email_trgm for queries of 3 characters or more,
+so the latency doesn't depend on the size of gen_email.
+Elsewhere (SQLite) the aliases of the user are scanned via the user_id index.
+"""
+from typing import List, Optional
+
+import arrow
+from sqlalchemy import case
+from sqlalchemy.dialects.postgresql import insert
+
+from app.extensions import db
+from app.models import GenEmail, AliasUsedOn, LastAliasUsedOn, DeletedAlias
+
+# maximum number of aliases returned by a search
+MAX_SEARCH_LIMIT = 100
+
+BULK_ACTIONS = ("enable", "disable", "delete")
+# maximum number of aliases changed by a bulk action
+MAX_BULK_SIZE = 1000
+
+
+def normalize_query(query: str) -> str:
+    return (query or "").strip().lower()
+
+
+def search_condition(query: str):
+    """condition on the aliases whose email contains query.
+    % and _ in query are matched literally"""
+    return GenEmail.email.contains(normalize_query(query), autoescape=True)
+
+
+def search_aliases(user_id: int, query: str, limit=20) -> List[GenEmail]:
+    """aliases of the user whose email contains query: the ones starting with query first,
+    then the most recent"""
+    query = normalize_query(query)
+    if not query:
+        return []
+
+    limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+    is_prefix = case([(GenEmail.email.startswith(query, autoescape=True), 0)], else_=1)
+
+    return (
+        GenEmail.query.filter(GenEmail.user_id == user_id, search_condition(query))
+        .order_by(is_prefix, GenEmail.created_at.desc(), GenEmail.id.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def record_alias_used_on(gen_email: GenEmail, hostname: str):
+    """the alias is used on hostname, it becomes the one recommended for hostname.
+    Doesn't commit"""
+    AliasUsedOn.create(gen_email_id=gen_email.id, hostname=hostname)
+
+    if db.engine.dialect.name == "postgresql":
+        now = arrow.now()
+        db.session.execute(
+            insert(LastAliasUsedOn.__table__)
+            .values(
+                user_id=gen_email.user_id,
+                hostname=hostname,
+                gen_email_id=gen_email.id,
+                created_at=now,
+            )
+            .on_conflict_do_update(
+                constraint="uq_last_alias_used_on",
+                set_={"gen_email_id": gen_email.id, "updated_at": now},
+            )
+        )
+        return
+
+    last = LastAliasUsedOn.get_by(user_id=gen_email.user_id, hostname=hostname)
+    if last:
+        last.gen_email_id = gen_email.id
+    else:
+        LastAliasUsedOn.create(
+            user_id=gen_email.user_id, hostname=hostname, gen_email_id=gen_email.id
+        )
+
+
+def last_alias_used_on(user_id: int, hostname: str) -> Optional[GenEmail]:
+    """the alias the user has used the most recently on hostname"""
+    gen_email = (
+        GenEmail.query.join(
+            LastAliasUsedOn, LastAliasUsedOn.gen_email_id == GenEmail.id
+        )
+        .filter(
+            LastAliasUsedOn.user_id == user_id, LastAliasUsedOn.hostname == hostname
+        )
+        .first()
+    )
+    if gen_email:
+        return gen_email
+
+    # the last alias is deleted: its LastAliasUsedOn is gone with it,
+    # fall back on the other aliases used on hostname
+    return (
+        GenEmail.query.join(AliasUsedOn, AliasUsedOn.gen_email_id == GenEmail.id)
+        .filter(GenEmail.user_id == user_id, AliasUsedOn.hostname == hostname)
+        .order_by(AliasUsedOn.created_at.desc(), AliasUsedOn.id.desc())
+        .first()
+    )
+
+
+def bulk_action(user_id: int, gen_email_ids: List[int], action: str) -> int:
+    """apply action (one of BULK_ACTIONS) to the aliases of the user among gen_email_ids
+    with a statement per table, and return the number of aliases changed.
+    The ids of other users' aliases are ignored. Doesn't commit"""
+    if action not in BULK_ACTIONS:
+        raise ValueError(f"unknown bulk action {action}")
+
+    q = GenEmail.query.filter(
+        GenEmail.user_id == user_id, GenEmail.id.in_(set(gen_email_ids))
+    )
+
+    if action in ("enable", "disable"):
+        return q.update(
+            {GenEmail.enabled: action == "enable"}, synchronize_session=False
+        )
+
+    emails = [email for (email,) in q.with_entities(GenEmail.email)]
+    if not emails:
+        return 0
+
+    # save deleted aliases, in one multi-row insert
+    now = arrow.now()
+    db.session.execute(
+        DeletedAlias.__table__.insert().values(
+            [
+                {"user_id": user_id, "email": email, "created_at": now}
+                for email in emails
+            ]
+        )
+    )
+    q.delete(synchronize_session=False)
+
+    return len(emails)
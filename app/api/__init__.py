@@ -1 +1,8 @@
-from .views import alias_options, new_custom_alias
+from .views import (
+    alias_options,
+    new_custom_alias,
+    alias_search,
+    alias_list,
+    alias_bulk,
+    batch,
+)
@@ -1,10 +1,9 @@
 from functools import wraps
 
-import arrow
 from flask import Blueprint, request, jsonify, g
 
-from app.extensions import db
-from app.models import ApiKey
+from app.api_key_usage import api_key_usage
+from app.models import User
 
 api_bp = Blueprint(name="api", import_name=__name__, url_prefix="/api")
 
@@ -13,17 +12,21 @@ def verify_api_key(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         api_code = request.headers.get("Authentication")
-        api_key = ApiKey.get_by(code=api_code)
+        r = api_key_usage.resolve(api_code)
 
-        if not api_key:
+        if not r:
             return jsonify(error="Wrong api key"), 401
 
-        # Update api key stats
-        api_key.last_used = arrow.now()
-        api_key.times += 1
-        db.session.commit()
+        api_key_id, user_id = r
+        g.user = User.get(user_id)
 
-        g.user = api_key.user
+        # the user has been deleted since the api key was cached
+        if not g.user:
+            api_key_usage.forget(api_code)
+            return jsonify(error="Wrong api key"), 401
+
+        # Update api key stats, written later by batch
+        api_key_usage.add(api_key_id)
 
         return f(*args, **kwargs)
 
@@ -0,0 +1,48 @@
+from flask import jsonify, request, g
+from flask_cors import cross_origin
+
+from app.alias_utils import BULK_ACTIONS, MAX_BULK_SIZE, bulk_action
+from app.api.base import api_bp, verify_api_key
+from app.extensions import db
+from app.log import LOG
+
+
+@api_bp.route("/aliases/bulk", methods=["POST"])
+@cross_origin()
+@verify_api_key
+def alias_bulk():
+    """
+    Enable, disable or delete many aliases at once
+    Input:
+        a valid api-key in "Authentication" header
+        action: enable, disable or delete
+        alias_ids: array of alias ids, at most 1000
+    Output:
+        200 {nb_alias: number of aliases changed}, the ids of aliases not owned by user are ignored
+        400 if action or alias_ids is wrong
+
+    """
+    user = g.user
+    data = request.get_json() or {}
+    action = data.get("action")
+    alias_ids = data.get("alias_ids")
+
+    if action not in BULK_ACTIONS:
+        return jsonify(error=f"action must be one of {', '.join(BULK_ACTIONS)}"), 400
+
+    if (
+        not isinstance(alias_ids, list)
+        # bool is a subclass of int
+        or not all(type(i) is int for i in alias_ids)
+        or len(alias_ids) > MAX_BULK_SIZE
+    ):
+        return (
+            jsonify(error=f"alias_ids must be a list of at most {MAX_BULK_SIZE} ids"),
+            400,
+        )
+
+    nb_alias = bulk_action(user.id, alias_ids, action)
+    db.session.commit()
+    LOG.d("%s %s aliases of %s", action, nb_alias, user)
+
+    return jsonify(nb_alias=nb_alias)
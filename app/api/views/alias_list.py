@@ -0,0 +1,119 @@
+import hashlib
+
+import arrow
+from arrow.parser import ParserError
+from flask import jsonify, request, g
+from flask_cors import cross_origin
+from sqlalchemy import func, or_
+
+from app.api.base import api_bp, verify_api_key
+from app.extensions import db
+from app.models import GenEmail, DeletedAlias
+
+# at most this number of aliases per page
+MAX_PAGE_LIMIT = 1000
+
+# the changes are looked for slightly before the cursor: a change committed late by a
+# slow transaction, or written by a server whose clock is behind, is not missed
+_SINCE_OVERLAP = 10  # in seconds
+
+
+@api_bp.route("/aliases")
+@cross_origin()
+@verify_api_key
+def get_aliases():
+    """
+    List the aliases of user, by page
+    Input:
+        a valid api-key in "Authentication" header
+        optional "after" in args: the next_after of the previous page
+        optional "limit" in args: number of aliases per page, 100 by default, at most 1000
+        optional "since" in args: the cursor of a previous call,
+            to only get the aliases created, updated or deleted since then
+        optional "If-None-Match" header: the ETag of a previous response
+    Output: cf README
+        aliases: array of {id, email, enabled}, by id
+        deleted: array of deleted alias emails, only with "since"
+        next_after: to get the next page, null if it's the last page
+        cursor: the "since" of the next call
+        304 if nothing changed since the response having this ETag
+
+    """
+    user = g.user
+    after = request.args.get("after", type=int)
+    limit = max(1, min(request.args.get("limit", 100, type=int), MAX_PAGE_LIMIT))
+
+    since = None
+    if request.args.get("since"):
+        try:
+            since = arrow.get(request.args.get("since"))
+        except (ParserError, ValueError):
+            return jsonify(error="wrong since"), 400
+
+    # the version of the user aliases: changes when an alias is created, updated or deleted
+    nb_alias, last_created, last_updated = (
+        db.session.query(
+            func.count(GenEmail.id),
+            func.max(GenEmail.created_at),
+            func.max(GenEmail.updated_at),
+        )
+        .filter(GenEmail.user_id == user.id)
+        .one()
+    )
+    last_deleted = (
+        db.session.query(func.max(DeletedAlias.created_at))
+        .filter(DeletedAlias.user_id == user.id)
+        .scalar()
+    )
+    changes = [t for t in (last_created, last_updated, last_deleted) if t]
+    cursor = max(changes).format("YYYY-MM-DDTHH:mm:ss.SSSSSS") if changes else ""
+
+    etag = hashlib.sha1(
+        f"{nb_alias} {cursor} {request.query_string.decode()}".encode()
+    ).hexdigest()
+    if etag in request.if_none_match:
+        return "", 304
+
+    q = GenEmail.query.filter(GenEmail.user_id == user.id)
+    if after:
+        q = q.filter(GenEmail.id > after)
+    if since:
+        changed_since = since.shift(seconds=-_SINCE_OVERLAP)
+        q = q.filter(
+            or_(
+                GenEmail.created_at >= changed_since,
+                GenEmail.updated_at >= changed_since,
+            )
+        )
+
+    gen_emails = q.order_by(GenEmail.id).limit(limit + 1).all()
+    next_after = None
+    if len(gen_emails) > limit:
+        gen_emails = gen_emails[:limit]
+        next_after = gen_emails[-1].id
+
+    ret = {
+        "aliases": [
+            {"id": ge.id, "email": ge.email, "enabled": ge.enabled} for ge in gen_emails
+        ],
+        "next_after": next_after,
+        "cursor": cursor,
+    }
+
+    if since:
+        # deleted aliases are only sent with the first page
+        ret["deleted"] = (
+            []
+            if after
+            else [
+                email
+                for (email,) in db.session.query(DeletedAlias.email).filter(
+                    DeletedAlias.user_id == user.id,
+                    DeletedAlias.created_at >= since.shift(seconds=-_SINCE_OVERLAP),
+                )
+            ]
+        )
+
+    res = jsonify(ret)
+    res.set_etag(etag)
+    return res
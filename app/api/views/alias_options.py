@@ -1,12 +1,11 @@
 from flask import jsonify, request, g
 from flask_cors import cross_origin
-from sqlalchemy import desc
 
+from app.alias_utils import last_alias_used_on
 from app.api.base import api_bp, verify_api_key
 from app.config import EMAIL_DOMAIN
-from app.extensions import db
 from app.log import LOG
-from app.models import AliasUsedOn, GenEmail, User
+from app.models import GenEmail
 from app.utils import convert_to_id, random_word
 
 
@@ -26,9 +25,11 @@ def options():
         existing: array of existing aliases
 
     """
-    user = g.user
-    hostname = request.args.get("hostname")
+    return jsonify(get_alias_options(g.user, request.args.get("hostname")))
 
+
+def get_alias_options(user, hostname) -> dict:
+    """the options of /alias/options, also used by /batch"""
     ret = {
         "existing": [ge.email for ge in GenEmail.query.filter_by(user_id=user.id)],
         "can_create_custom": user.can_create_new_alias(),
@@ -36,20 +37,8 @@ def options():
 
     # recommendation alias if exist
     if hostname:
-        # put the latest used alias first
-        q = (
-            db.session.query(AliasUsedOn, GenEmail, User)
-            .filter(
-                AliasUsedOn.gen_email_id == GenEmail.id,
-                GenEmail.user_id == user.id,
-                AliasUsedOn.hostname == hostname,
-            )
-            .order_by(desc(AliasUsedOn.created_at))
-        )
-
-        r = q.first()
-        if r:
-            _, alias, _ = r
+        alias = last_alias_used_on(user.id, hostname)
+        if alias:
             LOG.d("found alias %s %s %s", alias, hostname, user)
             ret["recommendation"] = {"alias": alias.email, "hostname": hostname}
 
@@ -77,4 +66,4 @@ def options():
     # custom domain should be put first
     ret["custom"]["suffixes"] = list(reversed(ret["custom"]["suffixes"]))
 
-    return jsonify(ret)
+    return ret
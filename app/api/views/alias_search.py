@@ -0,0 +1,40 @@
+from flask import jsonify, request, g
+from flask_cors import cross_origin
+
+from app.alias_utils import search_aliases
+from app.api.base import api_bp, verify_api_key
+
+
+@api_bp.route("/alias/search")
+@cross_origin()
+@verify_api_key
+def search_alias():
+    """
+    Search the aliases of user
+    Input:
+        a valid api-key in "Authentication" header
+        "query" in args: part of the alias email
+        optional "limit" in args, 20 by default, at most 100
+    Output:
+        aliases: array of {email, enabled, nb_forward, nb_blocked, nb_reply},
+            the aliases starting with query first, then the most recent
+
+    """
+    query = request.args.get("query")
+    if not query or not query.strip():
+        return jsonify(error="query cannot be empty"), 400
+
+    limit = request.args.get("limit", 20, type=int)
+
+    return jsonify(
+        aliases=[
+            {
+                "email": ge.email,
+                "enabled": ge.enabled,
+                "nb_forward": ge.nb_forward,
+                "nb_blocked": ge.nb_blocked,
+                "nb_reply": ge.nb_reply,
+            }
+            for ge in search_aliases(g.user.id, query, limit)
+        ]
+    )
@@ -0,0 +1,88 @@
+from flask import jsonify, request, g
+from flask_cors import cross_origin
+
+from app import request_memo
+from app.api.base import api_bp, verify_api_key
+from app.api.views.alias_options import get_alias_options
+from app.api.views.new_custom_alias import create_custom_alias
+from app.extensions import db
+from app.log import LOG
+
+# maximum number of operations of a batch
+MAX_BATCH_SIZE = 10
+
+
+def _alias_options(user, op: dict) -> (dict, int):
+    return get_alias_options(user, op.get("hostname")), 200
+
+
+def _new_custom_alias(user, op: dict) -> (dict, int):
+    if not isinstance(op.get("alias_prefix"), str) or not isinstance(
+        op.get("alias_suffix"), str
+    ):
+        return {"error": "alias_prefix and alias_suffix are required"}, 400
+
+    return create_custom_alias(user, op.get("hostname"), op)
+
+
+_OPERATIONS = {
+    "alias_options": _alias_options,
+    "new_custom_alias": _new_custom_alias,
+}
+
+
+@api_bp.route("/batch", methods=["POST"])
+@cross_origin()
+@verify_api_key
+def batch():
+    """
+    Run several operations in one request: the api key is verified once and
+    the user data is loaded once for all operations
+    Input:
+        a valid api-key in "Authentication" header
+        operations: array of at most 10 operations, run in order. An operation is
+            {op: "alias_options", hostname?} like GET /alias/options or
+            {op: "new_custom_alias", alias_prefix, alias_suffix, hostname?} like POST /alias/custom/new
+    Output:
+        200 {results: array of {status, body}}, a result per operation,
+            status and body are those of the equivalent endpoint.
+            An operation that fails is rolled back and has the status 500
+        400 if operations is wrong
+
+    """
+    user = g.user
+    data = request.get_json() or {}
+    operations = data.get("operations")
+
+    if (
+        not isinstance(operations, list)
+        or not operations
+        or len(operations) > MAX_BATCH_SIZE
+        or not all(isinstance(op, dict) for op in operations)
+    ):
+        return (
+            jsonify(
+                error=f"operations must be a list of 1 to {MAX_BATCH_SIZE} operations"
+            ),
+            400,
+        )
+
+    results = []
+    for op in operations:
+        f = _OPERATIONS.get(op.get("op"))
+        if not f:
+            LOG.d("unknown batch operation %s", op.get("op"))
+            body, status = {"error": f"unknown operation {op.get('op')}"}, 400
+        else:
+            try:
+                body, status = f(user, op)
+            except Exception:
+                # the other operations of the batch still run
+                LOG.exception("batch operation %s failed", op.get("op"))
+                db.session.rollback()
+                request_memo.clear()
+                body, status = {"error": "internal error"}, 500
+
+        results.append({"status": status, "body": body})
+
+    return jsonify(results=results)
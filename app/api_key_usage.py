@@ -0,0 +1,149 @@
+"""
+Resolve the API keys and count their usage without writing to the database on each API call.
+
+The usage (ApiKey.times and ApiKey.last_used) is accumulated in memory and written every
+API_KEY_USAGE_FLUSH_INTERVAL seconds by a background thread of each process, with one batched
+UPDATE in its own transaction. The usage not written yet is lost if the process is killed:
+these are only stats.
+
+The ApiKey of a code is cached API_KEY_CACHE_TTL seconds: a deleted API key can still
+be used during this time by the processes other than the one that deleted it.
+"""
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import arrow
+from flask import current_app
+from sqlalchemy import bindparam, case, or_
+
+from app.config import API_KEY_CACHE_TTL, API_KEY_USAGE_FLUSH_INTERVAL
+from app.extensions import db
+from app.log import LOG
+from app.models import ApiKey
+
+
+class _CachedApiKey(NamedTuple):
+    api_key_id: int
+    user_id: int
+    expire_at: float
+
+
+class ApiKeyUsage:
+    def __init__(
+        self, cache_ttl=API_KEY_CACHE_TTL, flush_interval=API_KEY_USAGE_FLUSH_INTERVAL
+    ):
+        # in seconds
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+
+        self._keys: Dict[str, _CachedApiKey] = {}
+        # api_key_id -> (nb of uses, last use)
+        self._usage: Dict[int, Tuple[int, arrow.Arrow]] = {}
+        self._lock = threading.Lock()
+        # pid of the process that runs the flush thread
+        self._flusher_pid = None
+
+    def resolve(self, code) -> Optional[Tuple[int, int]]:
+        """return (api_key_id, user_id), None if the api key doesn't exist"""
+        if not code:
+            return None
+
+        cached = self._keys.get(code)
+        if cached and cached.expire_at > time.time():
+            return cached.api_key_id, cached.user_id
+
+        row = (
+            db.session.query(ApiKey.id, ApiKey.user_id)
+            .filter(ApiKey.code == code)
+            .first()
+        )
+        if not row:
+            self._keys.pop(code, None)
+            return None
+
+        self._keys[code] = _CachedApiKey(row[0], row[1], time.time() + self.cache_ttl)
+        return row[0], row[1]
+
+    def forget(self, code):
+        """remove an api key from the cache, when it's deleted"""
+        self._keys.pop(code, None)
+
+    def add(self, api_key_id: int):
+        """record a use of the api key, written later by the flush thread.
+        Must be called inside an app context"""
+        now = arrow.now()
+        with self._lock:
+            times, _ = self._usage.get(api_key_id, (0, None))
+            self._usage[api_key_id] = (times + 1, now)
+            self._start_flusher()
+
+    def _start_flusher(self):
+        # the thread doesn't survive a fork, e.g. of the gunicorn workers:
+        # it's started by the first call in each process
+        if self._flusher_pid == os.getpid():
+            return
+
+        self._flusher_pid = os.getpid()
+        app = current_app._get_current_object()
+        threading.Thread(target=self._flush_loop, args=(app,), daemon=True).start()
+
+    def _flush_loop(self, app):
+        while True:
+            time.sleep(self.flush_interval)
+            # a session of its own, outside of any request
+            with app.app_context():
+                self.flush()
+
+    def flush(self):
+        """write the usage accumulated since the last flush"""
+        with self._lock:
+            usage, self._usage = self._usage, {}
+
+        if not usage:
+            return
+
+        table = ApiKey.__table__
+        last_used = bindparam("b_last_used", type_=table.c.last_used.type)
+        stmt = (
+            table.update()
+            .where(table.c.id == bindparam("b_id"))
+            .values(
+                times=table.c.times + bindparam("b_times"),
+                # another process might have written a more recent use
+                last_used=case(
+                    [
+                        (
+                            or_(
+                                table.c.last_used.is_(None),
+                                table.c.last_used < last_used,
+                            ),
+                            last_used,
+                        )
+                    ],
+                    else_=table.c.last_used,
+                ),
+                updated_at=table.c.updated_at,
+            )
+        )
+
+        try:
+            # always update the rows in the same order to avoid deadlocks between processes
+            db.session.execute(
+                stmt,
+                [
+                    {"b_id": api_key_id, "b_times": times, "b_last_used": last_used}
+                    for api_key_id, (times, last_used) in sorted(usage.items())
+                ],
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            LOG.exception("cannot write the usage of %s api keys", len(usage))
+            return
+
+        LOG.d("write the usage of %s api keys", len(usage))
+
+
+api_key_usage = ApiKeyUsage()
@@ -44,6 +44,67 @@ ADMIN_EMAIL = os.environ.get("ADMIN_EMAIL")
 MAX_NB_EMAIL_FREE_PLAN = int(os.environ["MAX_NB_EMAIL_FREE_PLAN"])
 # allow to override postfix server locally
 POSTFIX_SERVER = os.environ.get("POSTFIX_SERVER", "1.1.1.1")
+POSTFIX_PORT = int(os.environ.get("POSTFIX_PORT", 25))
+
+# Pool of SMTP connections to Postfix
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", 10))
+# a connection is closed after sending this number of messages
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(
+    os.environ.get("SMTP_MAX_MESSAGES_PER_CONNECTION", 100)
+)
+# in seconds, a connection idle for longer is checked with NOOP before being reused
+SMTP_IDLE_CHECK = int(os.environ.get("SMTP_IDLE_CHECK", 30))
+
+# Email handler: number of processes accepting SMTP connections, usually the number of cores
+EMAIL_HANDLER_PROCESSES = int(os.environ.get("EMAIL_HANDLER_PROCESSES", 1))
+# in seconds, on SIGTERM a process stops accepting connections and waits at most this time
+# for the SMTP sessions in progress to finish
+EMAIL_HANDLER_DRAIN_TIMEOUT = int(os.environ.get("EMAIL_HANDLER_DRAIN_TIMEOUT", 30))
+# number of messages processed at the same time by each process.
+# DB_POOL_SIZE + DB_MAX_OVERFLOW and SMTP_POOL_SIZE should be at least this number
+EMAIL_HANDLER_WORKERS = int(os.environ.get("EMAIL_HANDLER_WORKERS", 10))
+# number of messages that can wait for a free worker, the sender is asked to retry later
+# when this queue is full
+EMAIL_HANDLER_MAX_QUEUE = int(os.environ.get("EMAIL_HANDLER_MAX_QUEUE", 50))
+# number of recipients checked at the same time by each process, apart from the messages
+# so a recipient check doesn't wait behind the messages being processed.
+# Also counts in the DB_POOL_SIZE + DB_MAX_OVERFLOW connections
+EMAIL_HANDLER_RCPT_WORKERS = int(os.environ.get("EMAIL_HANDLER_RCPT_WORKERS", 2))
+
+# refuse emails sent to a disabled alias at RCPT TO
+# these emails are then not shown as blocked in the alias activity
+REJECT_DISABLED_ALIAS_AT_RCPT = "REJECT_DISABLED_ALIAS_AT_RCPT" in os.environ
+
+# in seconds, the email handler alias directory is refreshed at this interval
+ALIAS_DIRECTORY_REFRESH = int(os.environ.get("ALIAS_DIRECTORY_REFRESH", 10))
+# in seconds, the email handler alias directory is fully reloaded at this interval
+ALIAS_DIRECTORY_TTL = int(os.environ.get("ALIAS_DIRECTORY_TTL", 3600))
+
+# the email handler writes the activity logs (ForwardEmailLog) by batch:
+# every FORWARD_LOG_BATCH_SIZE logs or FORWARD_LOG_FLUSH_INTERVAL milliseconds
+FORWARD_LOG_BATCH_SIZE = int(os.environ.get("FORWARD_LOG_BATCH_SIZE", 100))
+FORWARD_LOG_FLUSH_INTERVAL = int(os.environ.get("FORWARD_LOG_FLUSH_INTERVAL", 1000))
+# the logs not written yet are also appended to files in this directory
+# so they are not lost if the process crashes
+FORWARD_LOG_WAL_DIR = os.environ.get("FORWARD_LOG_WAL_DIR")
+# the logs older than FORWARD_LOG_RETENTION_DAYS are aggregated by alias and day
+# then deleted by the compact_forward_logs cron job. 0: keep them forever
+FORWARD_LOG_RETENTION_DAYS = int(os.environ.get("FORWARD_LOG_RETENTION_DAYS", 0))
+
+# in seconds, an API key is cached this long by each process
+API_KEY_CACHE_TTL = int(os.environ.get("API_KEY_CACHE_TTL", 60))
+# in seconds, the API keys usage (last_used, times) is written at this interval
+API_KEY_USAGE_FLUSH_INTERVAL = int(os.environ.get("API_KEY_USAGE_FLUSH_INTERVAL", 60))
+
+# Spool mode: the email handler writes received messages to this directory and answers
+# right away, they are then forwarded by SPOOL_WORKERS processes
+SPOOL_DIR = os.environ.get("SPOOL_DIR")
+SPOOL_WORKERS = int(os.environ.get("SPOOL_WORKERS", 4))
+# a message that can't be processed is retried after SPOOL_RETRY_DELAY seconds,
+# the delay is doubled at each attempt
+SPOOL_RETRY_DELAY = int(os.environ.get("SPOOL_RETRY_DELAY", 30))
+# after this number of attempts the message is moved to the "failed" directory of the spool
+SPOOL_MAX_ATTEMPTS = int(os.environ.get("SPOOL_MAX_ATTEMPTS", 10))
 
 # list of (priority, email server)
 EMAIL_SERVERS_WITH_PRIORITY = eval(
@@ -65,12 +126,25 @@ with open(DKIM_PRIVATE_KEY_PATH) as f:
 
 DKIM_HEADERS = [b"from", b"to", b"subject"]
 
+# sign the emails sent from a custom domain alias with the DKIM key of EMAIL_DOMAIN
+# the custom domain must publish the key: dkim._domainkey.{domain} CNAME dkim._domainkey.{EMAIL_DOMAIN}
+DKIM_SIGN_CUSTOM_DOMAIN = "DKIM_SIGN_CUSTOM_DOMAIN" in os.environ
+
 # Database
 DB_URI = os.environ["DB_URI"]
 
+# Connection pool of long-running processes like the email handler
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 5))
+# in seconds, recycle connections before Postgres or a proxy closes them
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+
 # Flask secret
 FLASK_SECRET = os.environ["FLASK_SECRET"]
 
+# used to sign reverse-aliases, changing it invalidates all reverse-aliases created with it
+REVERSE_ALIAS_SECRET = os.environ.get("REVERSE_ALIAS_SECRET", FLASK_SECRET)
+
 # AWS
 AWS_REGION = "eu-west-3"
 BUCKET = os.environ["BUCKET"]
@@ -5,13 +5,12 @@ from flask_login import login_required, current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, validators, ValidationError
 
-from app.config import EMAIL_DOMAIN
+from app import alias_counters
 from app.dashboard.base import dashboard_bp
 from app.email_utils import get_email_part
 from app.extensions import db
 from app.log import LOG
 from app.models import GenEmail, ForwardEmail
-from app.utils import random_string
 
 
 def email_validator():
@@ -68,13 +67,6 @@ def alias_contact_manager(alias, forward_email_id=None):
             if new_contact_form.validate():
                 contact_email = new_contact_form.email.data
 
-                # generate a reply_email, make sure it is unique
-                # not use while to avoid infinite loop
-                for _ in range(1000):
-                    reply_email = f"ra+{random_string(25)}@{EMAIL_DOMAIN}"
-                    if not ForwardEmail.get_by(reply_email=reply_email):
-                        break
-
                 website_email = get_email_part(contact_email)
 
                 # already been added
@@ -86,11 +78,10 @@ def alias_contact_manager(alias, forward_email_id=None):
                         url_for("dashboard.alias_contact_manager", alias=alias)
                     )
 
-                forward_email = ForwardEmail.create(
+                forward_email = ForwardEmail.create_new(
                     gen_email_id=gen_email.id,
                     website_email=website_email,
                     website_from=contact_email,
-                    reply_email=reply_email,
                 )
 
                 LOG.d("create reverse-alias for %s", contact_email)
@@ -119,6 +110,8 @@ def alias_contact_manager(alias, forward_email_id=None):
                 return redirect(url_for("dashboard.alias_contact_manager", alias=alias))
 
             contact_name = forward_email.website_from
+            # its logs are deleted too
+            alias_counters.decrement_contact(forward_email)
             ForwardEmail.delete(forward_email_id)
             db.session.commit()
 
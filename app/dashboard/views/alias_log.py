@@ -1,13 +1,35 @@
+import csv
+import io
+import json
 from dataclasses import dataclass
+from typing import List, Optional, Tuple
 
 import arrow
-from flask import render_template, flash, redirect, url_for
+from flask import (
+    render_template,
+    flash,
+    redirect,
+    url_for,
+    request,
+    Response,
+    stream_with_context,
+)
 from flask_login import login_required, current_user
+from sqlalchemy import and_, or_
 
 from app.dashboard.base import dashboard_bp
 from app.extensions import db
 from app.models import GenEmail, ForwardEmailLog, ForwardEmail
 
+# number of logs per page
+PAGE_LIMIT = 50
+
+# number of rows fetched at once from the database by the export
+_EXPORT_BATCH_SIZE = 1000
+
+# a cell starting with one of these is run as a formula by spreadsheets
+_CSV_FORMULA_CHARS = ("=", "+", "-", "@", "\t", "\r")
+
 
 @dataclass
 class AliasLog:
@@ -22,43 +44,184 @@ class AliasLog:
 @dashboard_bp.route("/alias_log/<alias>", methods=["GET"])
 @login_required
 def alias_log(alias):
-    gen_email = GenEmail.get_by(email=alias)
-
-    # sanity check
+    gen_email = _get_gen_email(alias)
     if not gen_email:
         flash("You do not have access to this page", "warning")
         return redirect(url_for("dashboard.index"))
 
-    if gen_email.user_id != current_user.id:
+    # id of the last log of the previous page
+    after = request.args.get("after", type=int)
+    logs, next_after = get_alias_log(gen_email, after)
+
+    return render_template(
+        "dashboard/alias_log.html",
+        logs=logs,
+        alias=alias,
+        after=after,
+        next_after=next_after,
+    )
+
+
+@dashboard_bp.route("/alias_log/<alias>/export", methods=["GET"])
+@login_required
+def alias_log_export(alias):
+    """the whole history of the alias, as csv or json (?format=json)"""
+    gen_email = _get_gen_email(alias)
+    if not gen_email:
         flash("You do not have access to this page", "warning")
         return redirect(url_for("dashboard.index"))
 
-    return render_template(
-        "dashboard/alias_log.html", logs=get_alias_log(gen_email), alias=alias
+    if request.args.get("format") == "json":
+        gen, mimetype, extension = _export_json(gen_email), "application/json", "json"
+    else:
+        gen, mimetype, extension = _export_csv(gen_email), "text/csv", "csv"
+
+    # the rows are sent while being read: the memory doesn't depend on the number of logs
+    return Response(
+        stream_with_context(gen),
+        mimetype=mimetype,
+        headers={
+            "Content-Disposition": f"attachment; filename={alias}-activity.{extension}"
+        },
     )
 
 
-def get_alias_log(gen_email: GenEmail):
-    logs: [AliasLog] = []
+def get_alias_log(
+    gen_email: GenEmail, after=None, limit=PAGE_LIMIT
+) -> Tuple[List[AliasLog], Optional[int]]:
+    """return a page of logs, the most recent first, and the id of its last log
+    to pass as after to get the next page, None if it's the last page"""
+    q = _log_query(gen_email)
 
-    q = (
-        db.session.query(ForwardEmail, ForwardEmailLog)
+    if after:
+        last = (
+            db.session.query(ForwardEmailLog.created_at, ForwardEmailLog.id)
+            .filter(ForwardEmailLog.id == after)
+            .first()
+        )
+        if last:
+            q = q.filter(
+                or_(
+                    ForwardEmailLog.created_at < last.created_at,
+                    and_(
+                        ForwardEmailLog.created_at == last.created_at,
+                        ForwardEmailLog.id < last.id,
+                    ),
+                )
+            )
+
+    rows = q.limit(limit + 1).all()
+
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1].id
+
+    return [_to_alias_log(gen_email, row) for row in rows], next_after
+
+
+def _get_gen_email(alias) -> Optional[GenEmail]:
+    """the alias if it belongs to the current user"""
+    gen_email = GenEmail.get_by(email=alias)
+    if gen_email and gen_email.user_id == current_user.id:
+        return gen_email
+
+    return None
+
+
+def _log_query(gen_email: GenEmail):
+    """logs of the alias, most recent first. Only the needed columns are loaded"""
+    return (
+        db.session.query(
+            ForwardEmailLog.id,
+            ForwardEmailLog.created_at,
+            ForwardEmailLog.is_reply,
+            ForwardEmailLog.blocked,
+            ForwardEmail.website_email,
+            ForwardEmail.website_from,
+        )
         .filter(ForwardEmail.id == ForwardEmailLog.forward_id)
         .filter(ForwardEmail.gen_email_id == gen_email.id)
-        .all()
+        .order_by(ForwardEmailLog.created_at.desc(), ForwardEmailLog.id.desc())
     )
 
-    for fe, fel in q:
-        al = AliasLog(
-            website_email=fe.website_email,
-            website_from=fe.website_from,
-            alias=gen_email.email,
-            when=fel.created_at,
-            is_reply=fel.is_reply,
-            blocked=fel.blocked,
+
+def _to_alias_log(gen_email: GenEmail, row) -> AliasLog:
+    return AliasLog(
+        website_email=row.website_email,
+        website_from=row.website_from,
+        alias=gen_email.email,
+        when=row.created_at,
+        is_reply=row.is_reply,
+        blocked=row.blocked,
+    )
+
+
+def _iter_alias_log(gen_email: GenEmail):
+    # server-side cursor on Postgres: rows are fetched by batch instead of all at once
+    q = (
+        _log_query(gen_email)
+        .execution_options(stream_results=True)
+        .yield_per(_EXPORT_BATCH_SIZE)
+    )
+    for row in q:
+        yield _to_alias_log(gen_email, row)
+
+
+def _csv_cell(value: str) -> str:
+    """the senders choose website_email and website_from: quote the formulas"""
+    if value.startswith(_CSV_FORMULA_CHARS):
+        return "'" + value
+    return value
+
+
+def _export_csv(gen_email: GenEmail):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def pop():
+        s = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return s
+
+    writer.writerow(["date", "type", "website_email", "website_from", "alias"])
+    yield pop()
+
+    for log in _iter_alias_log(gen_email):
+        writer.writerow(
+            [
+                log.when.isoformat(),
+                _log_type(log),
+                _csv_cell(log.website_email),
+                _csv_cell(log.website_from or ""),
+                _csv_cell(log.alias),
+            ]
+        )
+        yield pop()
+
+
+def _export_json(gen_email: GenEmail):
+    yield "["
+    separator = ""
+    for log in _iter_alias_log(gen_email):
+        yield separator + json.dumps(
+            {
+                "date": log.when.isoformat(),
+                "type": _log_type(log),
+                "website_email": log.website_email,
+                "website_from": log.website_from,
+                "alias": log.alias,
+            }
         )
-        logs.append(al)
+        separator = ","
+    yield "]"
 
-    logs = sorted(logs, key=lambda l: l.when, reverse=True)
 
-    return logs
+def _log_type(log: AliasLog) -> str:
+    if log.is_reply:
+        return "reply"
+    elif log.blocked:
+        return "blocked"
+    else:
+        return "forward"
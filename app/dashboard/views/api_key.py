@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from flask_wtf import FlaskForm
 from wtforms import StringField, validators
 
+from app.api_key_usage import api_key_usage
 from app.dashboard.base import dashboard_bp
 from app.extensions import db
 from app.models import ApiKey
@@ -32,9 +33,10 @@ def api_key():
                 flash("You cannot delete this api key", "warning")
                 return redirect(url_for("dashboard.api_key"))
 
-            name = api_key.name
+            name, code = api_key.name, api_key.code
             ApiKey.delete(api_key_id)
             db.session.commit()
+            api_key_usage.forget(code)
             flash(f"API Key {name} has been deleted successfully", "success")
 
             return redirect(url_for("dashboard.api_key"))
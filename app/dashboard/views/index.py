@@ -1,15 +1,20 @@
 from dataclasses import dataclass
+from typing import List, Optional, Tuple
 
 from flask import render_template, request, redirect, url_for, flash, session
 from flask_login import login_required, current_user
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import joinedload
 
-from app import email_utils
+from app import alias_utils, email_utils
 from app.config import HIGHLIGHT_GEN_EMAIL_ID
 from app.dashboard.base import dashboard_bp
 from app.extensions import db
 from app.log import LOG
-from app.models import GenEmail, ClientUser, ForwardEmail, ForwardEmailLog, DeletedAlias
+from app.models import GenEmail, ClientUser, DeletedAlias
+
+# number of aliases per page
+PAGE_LIMIT = 20
 
 
 @dataclass
@@ -34,6 +39,10 @@ def index():
         del session[HIGHLIGHT_GEN_EMAIL_ID]
 
     query = request.args.get("query") or ""
+    # id of the last alias of the previous page
+    after = request.args.get("after", type=int)
+    # id of the alias highlighted on top of the first page
+    pinned = request.args.get("pinned", type=int)
 
     # User generates a new email
     if request.method == "POST":
@@ -87,7 +96,28 @@ def index():
             db.session.commit()
             flash(f"Email alias {email} has been deleted", "success")
 
-        return redirect(url_for("dashboard.index", query=query))
+        elif request.form.get("form-name") == "bulk":
+            action = request.form.get("bulk-action")
+            gen_email_ids = request.form.getlist("gen-email-ids", type=int)
+
+            if action not in alias_utils.BULK_ACTIONS or not gen_email_ids:
+                flash("Please select the aliases and the action", "warning")
+            elif len(gen_email_ids) > alias_utils.MAX_BULK_SIZE:
+                flash(
+                    f"Please select at most {alias_utils.MAX_BULK_SIZE} aliases",
+                    "warning",
+                )
+            else:
+                LOG.d("%s aliases %s", action, gen_email_ids)
+                nb_alias = alias_utils.bulk_action(
+                    current_user.id, gen_email_ids, action
+                )
+                db.session.commit()
+                flash(f"{nb_alias} aliases have been {action}d", "success")
+
+        return redirect(
+            url_for("dashboard.index", query=query, after=after, pinned=pinned)
+        )
 
     client_users = (
         ClientUser.filter_by(user_id=current_user.id)
@@ -98,82 +128,91 @@ def index():
 
     sorted(client_users, key=lambda cu: cu.client.name)
 
+    aliases, next_after = get_alias_info(
+        current_user.id, query, highlight_gen_email_id or pinned, after
+    )
+    if not after and aliases and aliases[0].highlight:
+        pinned = aliases[0].gen_email.id
+
     return render_template(
         "dashboard/index.html",
         client_users=client_users,
-        aliases=get_alias_info(current_user.id, query, highlight_gen_email_id),
+        aliases=aliases,
         highlight_gen_email_id=highlight_gen_email_id,
         query=query,
+        after=after,
+        next_after=next_after,
+        pinned=pinned,
     )
 
 
-def get_alias_info(user_id, query=None, highlight_gen_email_id=None) -> [AliasInfo]:
-    if query:
-        query = query.strip().lower()
-
-    aliases = {}  # dict of alias and AliasInfo
-    q = db.session.query(GenEmail, ForwardEmail, ForwardEmailLog).filter(
-        GenEmail.user_id == user_id,
-        GenEmail.id == ForwardEmail.gen_email_id,
-        ForwardEmail.id == ForwardEmailLog.forward_id,
-    )
-
-    if query:
-        q = q.filter(GenEmail.email.contains(query))
-
-    for ge, fe, fel in q:
-        if ge.email not in aliases:
-            aliases[ge.email] = AliasInfo(
-                gen_email=ge,
-                nb_blocked=0,
-                nb_forward=0,
-                nb_reply=0,
-                highlight=ge.id == highlight_gen_email_id,
+def get_alias_info(
+    user_id, query=None, highlight_gen_email_id=None, after=None, limit=PAGE_LIMIT
+) -> Tuple[List[AliasInfo], Optional[int]]:
+    """return a page of aliases, the most recent first, and the id of its last alias
+    to pass as after to get the next page, None if it's the last page.
+
+    The pages are delimited by (created_at, id) and not by offset: a page is read
+    from the user_id index whatever its position.
+
+    The highlighted alias is pinned on top of the first page, and is not on the next pages.
+    """
+    # the activity counters are on the alias: no need to join the logs
+    q = GenEmail.query.filter(GenEmail.user_id == user_id)
+
+    if query and query.strip():
+        q = q.filter(alias_utils.search_condition(query))
+
+    highlight = None
+    if after:
+        last = GenEmail.filter_by(id=after, user_id=user_id).first()
+        # the alias has been deleted since: start from the first page
+        if last:
+            q = q.filter(
+                or_(
+                    GenEmail.created_at < last.created_at,
+                    and_(GenEmail.created_at == last.created_at, GenEmail.id < last.id),
+                )
             )
 
-        alias_info = aliases[ge.email]
-        if fel.is_reply:
-            alias_info.nb_reply += 1
-        elif fel.blocked:
-            alias_info.nb_blocked += 1
-        else:
-            alias_info.nb_forward += 1
-
-    # also add alias that has no forward email or log
-    q = (
-        db.session.query(GenEmail)
-        .filter(GenEmail.email.notin_(aliases.keys()))
-        .filter(GenEmail.user_id == user_id)
+        if highlight_gen_email_id:
+            q = q.filter(GenEmail.id != highlight_gen_email_id)
+    elif highlight_gen_email_id:
+        # make sure the highlighted alias is the first element
+        highlight = q.filter(GenEmail.id == highlight_gen_email_id).first()
+        if highlight:
+            q = q.filter(GenEmail.id != highlight.id)
+
+    gen_emails = (
+        q.order_by(GenEmail.created_at.desc(), GenEmail.id.desc())
+        .limit(limit + 1)
+        .all()
     )
 
-    if query:
-        q = q.filter(GenEmail.email.contains(query))
+    next_after = None
+    if len(gen_emails) > limit:
+        gen_emails = gen_emails[:limit]
+        next_after = gen_emails[-1].id
+
+    if highlight:
+        gen_emails.insert(0, highlight)
 
-    for ge in q:
-        aliases[ge.email] = AliasInfo(
+    ret = [
+        AliasInfo(
             gen_email=ge,
-            nb_blocked=0,
-            nb_forward=0,
-            nb_reply=0,
+            nb_blocked=ge.nb_blocked,
+            nb_forward=ge.nb_forward,
+            nb_reply=ge.nb_reply,
             highlight=ge.id == highlight_gen_email_id,
         )
-
-    ret = list(aliases.values())
-
-    # make sure the highlighted alias is the first element
-    highlight_index = None
-    for ix, alias in enumerate(ret):
-        if alias.highlight:
-            highlight_index = ix
-            break
-
-    if highlight_index:
-        ret.insert(0, ret.pop(highlight_index))
+        for ge in gen_emails
+    ]
 
     # only show intro on the first enabled alias
-    for alias in ret:
-        if alias.gen_email.enabled:
-            alias.show_intro_test_send_email = True
-            break
+    if not after:
+        for alias in ret:
+            if alias.gen_email.enabled:
+                alias.show_intro_test_send_email = True
+                break
 
-    return ret
+    return ret, next_after
@@ -0,0 +1,173 @@
+"""
+DKIM signing with keys parsed once.
+dkim.sign() parses the PEM key and the whole message (splitting it in lines to convert
+line endings) at every call. Here the keys are parsed when they are registered, only the
+header block is parsed and the body hash is computed chunk by chunk on the received bytes.
+"""
+import base64
+import hashlib
+import re
+import time
+from typing import NamedTuple, Optional, Dict
+
+import dkim
+from dkim.canonicalization import CanonicalizationPolicy
+from dkim.crypto import parse_pem_private_key
+
+from app.config import (
+    DKIM_SELECTOR,
+    DKIM_PRIVATE_KEY,
+    DKIM_HEADERS,
+    EMAIL_DOMAIN,
+    SUPPORT_EMAIL,
+)
+
+# same as dkim.sign(): relaxed canonicalization for the header, simple for the body
+_CANONICALIZE = b"relaxed/simple"
+
+# the body hash is computed on chunks of this size
+_CHUNK_SIZE = 64 * 1024
+
+# LF not preceded by CR
+_BARE_LF = re.compile(rb"(?<!\r)\n")
+
+
+class DkimKey(NamedTuple):
+    selector: bytes
+    # parsed RSA private key
+    private_key: dict
+
+
+class DkimSigner:
+    def __init__(self, include_headers=DKIM_HEADERS):
+        # domain -> key
+        self._keys: Dict[str, DkimKey] = {}
+        # key used by register() when no key is given, parsed once for all domains
+        self._default_key: Optional[DkimKey] = None
+
+        self._include_headers = tuple(h.lower() for h in include_headers)
+        self._h_tag = b" : ".join(self._include_headers)
+        self._canon_policy = CanonicalizationPolicy.from_c_value(_CANONICALIZE)
+
+    def set_default_key(self, selector: bytes, private_key: str):
+        self._default_key = _parse_key(selector, private_key)
+
+    def register(self, domain: str, selector: bytes = None, private_key: str = None):
+        """sign emails of this domain with the given key, the default key if not given"""
+        if private_key:
+            self._keys[domain] = _parse_key(selector, private_key)
+        else:
+            self._keys[domain] = self._default_key
+
+    def can_sign(self, domain: str) -> bool:
+        return domain in self._keys
+
+    def sign(self, msg_raw: bytes, domain: str) -> bytes:
+        """return the DKIM-Signature header of the message, terminated by CRLF.
+        The domain must have been registered
+        """
+        key = self._keys.get(domain)
+        if not key:
+            raise ValueError(f"no DKIM key for {domain}")
+
+        header, body = _split(msg_raw)
+        body_hash = base64.b64encode(compute_body_hash(body))
+
+        domain = domain.encode()
+        fields = [
+            (b"v", b"1"),
+            (b"a", b"rsa-sha256"),
+            (b"c", _CANONICALIZE),
+            (b"d", domain),
+            (b"i", b"@" + domain),
+            (b"q", b"dns/txt"),
+            (b"s", key.selector),
+            (b"t", str(int(time.time())).encode()),
+            (b"h", self._h_tag),
+            (b"bh", body_hash),
+            # same placeholder as dkim.sign(): b= is folded on its own line
+            (b"b", b"0" * 60),
+        ]
+
+        # the signer only sees the header block
+        signer = dkim.DKIM(header)
+        signer.hasher = hashlib.sha256
+        sig = signer.gen_header(
+            fields,
+            self._include_headers,
+            self._canon_policy,
+            b"DKIM-Signature",
+            key.private_key,
+        )
+
+        return b"DKIM-Signature: " + sig
+
+
+def compute_body_hash(body) -> bytes:
+    """sha256 of the body with the "simple" canonicalization (RFC 6376 3.4.3):
+    lines end with CRLF, the empty lines at the end are ignored and the body ends with one CRLF.
+    body is bytes or memoryview. It is read chunk by chunk, without being copied as a whole.
+    """
+    h = hashlib.sha256()
+    # the line endings at the end of what has been read so far: they are only hashed
+    # when followed by some content
+    pending = b""
+
+    start = 0
+    while start < len(body):
+        chunk = bytes(body[start : start + _CHUNK_SIZE])
+        if start + len(chunk) < len(body):
+            # cut after the last line ending so that a CRLF is never split in 2 chunks
+            end = chunk.rfind(b"\n") + 1
+            if end:
+                chunk = chunk[:end]
+            elif chunk.endswith(b"\r"):
+                chunk = chunk[:-1]
+        start += len(chunk)
+
+        # counting is much faster than the regex, the lines almost always end with CRLF
+        if chunk.count(b"\n") != chunk.count(b"\r\n"):
+            chunk = _BARE_LF.sub(b"\r\n", chunk)
+
+        content = chunk.rstrip(b"\r\n")
+        if content:
+            h.update(pending)
+            h.update(content)
+            pending = chunk[len(content) :]
+        else:
+            pending += chunk
+
+    while pending.endswith(b"\r\n"):
+        pending = pending[:-2]
+    h.update(pending + b"\r\n")
+
+    return h.digest()
+
+
+def _parse_key(selector: bytes, private_key: str) -> DkimKey:
+    return DkimKey(
+        selector=selector, private_key=parse_pem_private_key(private_key.encode())
+    )
+
+
+def _split(msg_raw: bytes) -> (bytes, memoryview):
+    """return the header block in CRLF and the body"""
+    crlf = msg_raw.find(b"\r\n\r\n")
+    lf = msg_raw.find(b"\n\n")
+
+    if crlf != -1 and (lf == -1 or crlf < lf):
+        header_end, body_start = crlf + 2, crlf + 4
+    elif lf != -1:
+        header_end, body_start = lf + 1, lf + 2
+    else:
+        header_end = body_start = len(msg_raw)
+
+    header = _BARE_LF.sub(b"\r\n", msg_raw[:header_end])
+    return header, memoryview(msg_raw)[body_start:]
+
+
+dkim_signer = DkimSigner()
+dkim_signer.set_default_key(DKIM_SELECTOR, DKIM_PRIVATE_KEY)
+dkim_signer.register(EMAIL_DOMAIN)
+# transactional emails
+dkim_signer.register(SUPPORT_EMAIL[SUPPORT_EMAIL.find("@") + 1 :])
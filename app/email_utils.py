@@ -1,21 +1,24 @@
+import hashlib
+import hmac
 import os
+import re
 from email.message import EmailMessage
+from email.policy import SMTPUTF8
 from email.utils import make_msgid, formatdate
-from smtplib import SMTP
+from typing import Optional
 
-import dkim
 from jinja2 import Environment, FileSystemLoader
 
 from app.config import (
     SUPPORT_EMAIL,
     ROOT_DIR,
-    POSTFIX_SERVER,
     NOT_SEND_EMAIL,
-    DKIM_SELECTOR,
-    DKIM_PRIVATE_KEY,
-    DKIM_HEADERS,
+    EMAIL_DOMAIN,
+    REVERSE_ALIAS_SECRET,
 )
+from app.dkim_utils import dkim_signer
 from app.log import LOG
+from app.smtp_pool import smtp_pool
 
 
 def _render(template_name, **kwargs) -> str:
@@ -111,8 +114,6 @@ def send_email(to_email, subject, plaintext, html):
         )
         return
 
-    # host IP, setup via Docker network
-    smtp = SMTP(POSTFIX_SERVER, 25)
     msg = EmailMessage()
 
     msg["Subject"] = subject
@@ -133,10 +134,9 @@ def send_email(to_email, subject, plaintext, html):
 
     # add DKIM
     email_domain = SUPPORT_EMAIL[SUPPORT_EMAIL.find("@") + 1 :]
-    add_dkim_signature(msg, email_domain)
+    msg_raw = add_dkim_signature(message_to_bytes(msg), email_domain)
 
-    msg_raw = msg.as_string().encode()
-    smtp.sendmail(SUPPORT_EMAIL, to_email, msg_raw)
+    smtp_pool.sendmail(SUPPORT_EMAIL, to_email, msg_raw)
 
 
 def get_email_name(email_from):
@@ -161,23 +161,63 @@ def get_email_part(email_from):
     return email_from
 
 
-def add_dkim_signature(msg: EmailMessage, email_domain: str):
-    if msg["DKIM-Signature"]:
-        LOG.d("Remove DKIM-Signature %s", msg["DKIM-Signature"])
-        del msg["DKIM-Signature"]
+def message_to_bytes(msg: EmailMessage) -> bytes:
+    """serialize a message to send it.
+    smtp.send_message has UnicodeEncodeError issue, the raw message is sent instead
+    """
+    return msg.as_bytes(policy=SMTPUTF8)
 
-    # Specify headers in "byte" form
-    # Generate message signature
-    sig = dkim.sign(
-        msg.as_string().encode(),
-        DKIM_SELECTOR,
-        email_domain.encode(),
-        DKIM_PRIVATE_KEY.encode(),
-        include_headers=DKIM_HEADERS,
-    )
-    sig = sig.decode()
 
-    # remove linebreaks from sig
-    sig = sig.replace("\n", " ").replace("\r", "")
+def add_dkim_signature(msg_raw: bytes, email_domain: str) -> bytes:
+    """return the message with a DKIM-Signature header added at the top.
+    The message must not contain any DKIM-Signature already.
+    """
+    sig = dkim_signer.sign(msg_raw, email_domain)
+
+    # the signature is a header terminated by CRLF, prepending it avoids serializing the message again
+    return sig + msg_raw
+
+
+# reverse-alias that contains the ForwardEmail id and its signature: ra+{id}.{signature}@EMAIL_DOMAIN
+# reverse-aliases created before only contain letters: reply+{random} or ra+{random}
+_SIGNED_REPLY_EMAIL = re.compile(r"^ra\+(\d+)\.([0-9a-f]+)@(.+)$")
+_REPLY_EMAIL_SIGNATURE_LENGTH = 16
+
+
+def _reply_email_signature(forward_email_id: int) -> str:
+    return hmac.new(
+        REVERSE_ALIAS_SECRET.encode(), str(forward_email_id).encode(), hashlib.sha256
+    ).hexdigest()[:_REPLY_EMAIL_SIGNATURE_LENGTH]
+
+
+def generate_reply_email(forward_email_id: int) -> str:
+    """generate the reverse-alias of a ForwardEmail.
+    It is unique as it contains the ForwardEmail id and can't be guessed thanks to the signature
+    """
+    signature = _reply_email_signature(forward_email_id)
+    return f"ra+{forward_email_id}.{signature}@{EMAIL_DOMAIN}"
+
+
+def is_signed_reply_email(reply_email: str) -> bool:
+    """whether the reverse-alias has the format of generate_reply_email()"""
+    return _SIGNED_REPLY_EMAIL.match(reply_email.lower()) is not None
+
+
+def get_forward_email_id(reply_email: str) -> Optional[int]:
+    """return the ForwardEmail id contained in a reverse-alias generated by generate_reply_email()
+    None if the reverse-alias has another format or its signature is wrong
+    """
+    m = _SIGNED_REPLY_EMAIL.match(reply_email.lower())
+    if not m:
+        return None
+
+    forward_email_id, signature, domain = m.groups()
+    if domain != EMAIL_DOMAIN.lower():
+        return None
+
+    forward_email_id = int(forward_email_id)
+    if not hmac.compare_digest(signature, _reply_email_signature(forward_email_id)):
+        LOG.warning("wrong reverse-alias signature %s", reply_email)
+        return None
 
-    msg.add_header("DKIM-Signature", sig[len("DKIM-Signature: ") :])
+    return forward_email_id
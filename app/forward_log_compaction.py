@@ -0,0 +1,220 @@
+"""
+Keep forward_email_log small: the logs older than FORWARD_LOG_RETENTION_DAYS are aggregated
+by alias and day into AliasActivityDaily, then deleted.
+
+On Postgres forward_email_log is partitioned by month on created_at: forward_email_log_y2020m01, ...
+and forward_email_log_default for the rows outside these partitions. The expired partitions
+are dropped instead of deleting their rows, which leaves nothing to vacuum.
+
+A batch of logs is aggregated and deleted in the same transaction: a log is never counted twice.
+The alias counters (alias_counters.py) count both the logs and the aggregates and don't change.
+"""
+import re
+from datetime import date
+from typing import List, Tuple
+
+import arrow
+from sqlalchemy import func, text
+
+from app import alias_counters
+from app.config import FORWARD_LOG_RETENTION_DAYS
+from app.extensions import db
+from app.log import LOG
+from app.models import AliasActivityDaily, ForwardEmail, ForwardEmailLog
+
+_PARTITION_RE = re.compile(r"^forward_email_log_y(\d{4})m(\d{2})$")
+
+
+def compact(retention_days=FORWARD_LOG_RETENTION_DAYS, now: arrow.Arrow = None):
+    if retention_days <= 0:
+        LOG.d("forward log retention not set, nothing to compact")
+        return
+
+    now = now or arrow.utcnow()
+    cutoff = now.floor("day").shift(days=-retention_days)
+    LOG.d("compact the forward logs before %s", cutoff)
+
+    if is_partitioned():
+        create_partitions(now)
+
+        for name, start in partitions():
+            end = start.shift(months=1)
+            if end > cutoff:
+                break
+
+            nb_log = _rollup(start, end)
+            db.session.execute(text(f"DROP TABLE {name}"))
+            db.session.commit()
+            LOG.d("drop partition %s, %s logs aggregated", name, nb_log)
+
+    # the expired logs of a partition that is not entirely expired,
+    # or all the expired logs without partitioning: one day at a time
+    oldest = db.session.query(func.min(ForwardEmailLog.created_at)).scalar()
+    if not oldest:
+        return
+
+    start = arrow.get(oldest).floor("day")
+    while start < cutoff:
+        end = min(start.shift(days=1), cutoff)
+
+        nb_log = _rollup(start, end)
+        ForwardEmailLog.query.filter(
+            ForwardEmailLog.created_at >= start, ForwardEmailLog.created_at < end
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        if nb_log:
+            LOG.d("delete %s logs of %s", nb_log, start.date())
+
+        start = end
+
+
+def is_partitioned() -> bool:
+    if db.engine.dialect.name != "postgresql":
+        return False
+
+    relkind = db.session.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = 'forward_email_log'")
+    ).scalar()
+    return relkind == "p"
+
+
+def partitions() -> List[Tuple[str, arrow.Arrow]]:
+    """(name, first day) of the monthly partitions, the oldest first"""
+    rows = db.session.execute(
+        text(
+            """
+SELECT c.relname FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+JOIN pg_class p ON p.oid = i.inhparent
+WHERE p.relname = 'forward_email_log'
+"""
+        )
+    )
+
+    ret = []
+    for (name,) in rows:
+        m = _PARTITION_RE.match(name)
+        # forward_email_log_default
+        if m:
+            ret.append((name, arrow.Arrow(int(m.group(1)), int(m.group(2)), 1)))
+
+    return sorted(ret, key=lambda p: p[1])
+
+
+def partition_name(start: arrow.Arrow) -> str:
+    return f"forward_email_log_y{start.year}m{start.month:02d}"
+
+
+def create_partitions(now: arrow.Arrow = None, nb_month=3):
+    """create the partitions of the current month and of the next nb_month months.
+    The logs of a new partition that are already in the default partition, e.g. when the job
+    didn't run for a month, are moved to it"""
+    existing = {name for name, _ in partitions()}
+    month = (now or arrow.utcnow()).floor("month")
+    for _ in range(nb_month + 1):
+        next_month = month.shift(months=1)
+        name = partition_name(month)
+        if name not in existing:
+            _create_partition(name, month, next_month)
+        month = next_month
+
+
+def _create_partition(name: str, start: arrow.Arrow, end: arrow.Arrow):
+    bounds = {"start": start.naive, "end": end.naive}
+    in_default = (
+        "FROM forward_email_log_default "
+        "WHERE created_at >= :start AND created_at < :end"
+    )
+    create = text(
+        f"CREATE TABLE {name} PARTITION OF forward_email_log "
+        f"FOR VALUES FROM ('{start.format('YYYY-MM-DD')}') "
+        f"TO ('{end.format('YYYY-MM-DD')}')"
+    )
+
+    has_default = db.session.execute(
+        text("SELECT 1 FROM pg_class WHERE relname = 'forward_email_log_default'")
+    ).scalar()
+    if (
+        not has_default
+        or not db.session.execute(
+            text(f"SELECT 1 {in_default} LIMIT 1"), bounds
+        ).scalar()
+    ):
+        db.session.execute(create)
+        db.session.commit()
+        LOG.d("create partition %s", name)
+        return
+
+    # Postgres refuses to create a partition whose rows are in the default partition.
+    # The default partition is detached while its rows are moved, in one transaction:
+    # the email handler waits for the lock on forward_email_log
+    db.session.execute(
+        text("ALTER TABLE forward_email_log DETACH PARTITION forward_email_log_default")
+    )
+    db.session.execute(create)
+    nb_log = db.session.execute(
+        text(f"INSERT INTO {name} SELECT * {in_default}"), bounds
+    ).rowcount
+    db.session.execute(text(f"DELETE {in_default}"), bounds)
+    db.session.execute(
+        text(
+            "ALTER TABLE forward_email_log "
+            "ATTACH PARTITION forward_email_log_default DEFAULT"
+        )
+    )
+    db.session.commit()
+    LOG.d("create partition %s, move %s logs from the default partition", name, nb_log)
+
+
+def _rollup(start: arrow.Arrow, end: arrow.Arrow) -> int:
+    """add the logs created in [start, end) to AliasActivityDaily and return their number.
+    Doesn't commit"""
+    day = func.date(ForwardEmailLog.created_at)
+    rows = (
+        db.session.query(ForwardEmail.gen_email_id, day, *alias_counters.log_counts())
+        .filter(
+            ForwardEmailLog.forward_id == ForwardEmail.id,
+            ForwardEmailLog.created_at >= start,
+            ForwardEmailLog.created_at < end,
+        )
+        .group_by(ForwardEmail.gen_email_id, day)
+        .all()
+    )
+    if not rows:
+        return 0
+
+    # logs recovered after a crash can be older than the logs already aggregated
+    existing = {
+        (a.gen_email_id, a.date): a
+        for a in AliasActivityDaily.query.filter(
+            AliasActivityDaily.date >= start.date(),
+            AliasActivityDaily.date <= end.shift(days=-1).date(),
+        )
+    }
+
+    new_rows = []
+    nb_log = 0
+    for gen_email_id, d, nb_forward, nb_blocked, nb_reply in rows:
+        nb_log += nb_forward + nb_blocked + nb_reply
+        # a string on SQLite
+        if not isinstance(d, date):
+            d = date.fromisoformat(d)
+
+        activity = existing.get((gen_email_id, d))
+        if activity:
+            activity.nb_forward += nb_forward
+            activity.nb_blocked += nb_blocked
+            activity.nb_reply += nb_reply
+        else:
+            new_rows.append(
+                {
+                    "gen_email_id": gen_email_id,
+                    "date": d,
+                    "nb_forward": nb_forward,
+                    "nb_blocked": nb_blocked,
+                    "nb_reply": nb_reply,
+                }
+            )
+
+    db.session.bulk_insert_mappings(AliasActivityDaily, new_rows)
+    return nb_log
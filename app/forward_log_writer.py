@@ -0,0 +1,301 @@
+"""
+Write the activity logs (ForwardEmailLog) of the email handler by batch,
+and increment the alias counters in the same transaction.
+
+Creating a log and committing for each message costs a transaction per message.
+Instead the logs are kept in memory and inserted with one multi-row INSERT every
+FORWARD_LOG_BATCH_SIZE logs or FORWARD_LOG_FLUSH_INTERVAL milliseconds, and when the
+email handler stops.
+
+If FORWARD_LOG_WAL_DIR is set, each log is also appended to a file {pid}.{writer id}.{seq}.log
+of this directory. The files are removed once their logs are in the database. At startup, the files
+left by a dead process are replayed. The writer id is random: a process whose pid is reused,
+e.g. after a container restart, doesn't take the files of a dead process for its own. A log might then be inserted twice if the process died
+between the INSERT and the file removal.
+
+A batch that can't be inserted is retried at the next flushes. After _MAX_FLUSH_FAILURES
+failures its logs are inserted one by one and those that still fail are dead-lettered:
+logged as errors and, if FORWARD_LOG_WAL_DIR is set, appended to its failed/ directory.
+The logs that fail because the database is unreachable are retried instead.
+"""
+import json
+import os
+import re
+import threading
+import uuid
+from typing import List, Optional
+
+import arrow
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.config import (
+    FORWARD_LOG_BATCH_SIZE,
+    FORWARD_LOG_FLUSH_INTERVAL,
+    FORWARD_LOG_WAL_DIR,
+)
+from app import alias_counters
+from app.extensions import db
+from app.log import LOG
+from app.models import ForwardEmail, ForwardEmailLog
+
+_LOG_COLUMNS = ("created_at", "forward_id", "is_reply", "blocked")
+
+# consecutive failures of a flush before inserting the logs one by one
+_MAX_FLUSH_FAILURES = 3
+
+# {pid}.{seq}.log before the writer id
+_WAL_RE = re.compile(r"^(\d+)\.(?:([0-9a-f]+)\.)?\d+\.log$")
+
+
+class ForwardLogWriter:
+    def __init__(
+        self,
+        app,
+        batch_size=FORWARD_LOG_BATCH_SIZE,
+        flush_interval=FORWARD_LOG_FLUSH_INTERVAL,
+        wal_dir=FORWARD_LOG_WAL_DIR,
+    ):
+        self.app = app
+        self.batch_size = batch_size
+        # in milliseconds
+        self.flush_interval = flush_interval
+        self.wal_dir = wal_dir
+
+        self._rows: List[dict] = []
+        # protect _rows and the wal files
+        self._lock = threading.Lock()
+        # only one flush at a time
+        self._flush_lock = threading.Lock()
+
+        self._nb_failure = 0
+
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+        # wal files whose logs are not in the database yet, the last one is open
+        self._wal_files: List[str] = []
+        self._wal = None
+        self._wal_seq = 0
+        self._wal_id = uuid.uuid4().hex[:12]
+        if wal_dir:
+            os.makedirs(wal_dir, exist_ok=True)
+            self._recover()
+            self._open_wal()
+
+    def add(self, forward_id: int, gen_email_id: int, is_reply=False, blocked=False):
+        row = {
+            "created_at": arrow.utcnow(),
+            "forward_id": forward_id,
+            # to update the alias counters
+            "gen_email_id": gen_email_id,
+            "is_reply": is_reply,
+            "blocked": blocked,
+        }
+
+        with self._lock:
+            self._rows.append(row)
+            if self._wal:
+                self._wal.write(_to_line(row))
+                # written to the OS: survives a crash of the process but not of the host
+                self._wal.flush()
+
+            nb_row = len(self._rows)
+
+        if nb_row >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """insert the buffered logs"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._rows:
+                    return
+
+                rows, self._rows = self._rows, []
+                # the next logs go to a new wal file
+                wal_files = self._wal_files
+                if self._wal:
+                    self._wal.close()
+                    self._wal_files = []
+                    self._open_wal()
+
+            with self.app.app_context():
+                try:
+                    self._insert(rows)
+                    rows = []
+                except Exception:
+                    db.session.rollback()
+                    self._nb_failure += 1
+                    if self._nb_failure < _MAX_FLUSH_FAILURES:
+                        LOG.exception(
+                            "cannot write %s forward logs, retry later", len(rows)
+                        )
+                    else:
+                        LOG.exception(
+                            "cannot write %s forward logs %s times, write them one by one",
+                            len(rows),
+                            self._nb_failure,
+                        )
+                        rows = self._insert_one_by_one(rows)
+
+            if rows:
+                # keep the logs for the next flush
+                with self._lock:
+                    self._rows = rows + self._rows
+                    self._wal_files = wal_files + self._wal_files
+                return
+
+            self._nb_failure = 0
+            for path in wal_files:
+                os.remove(path)
+
+    def _insert(self, rows: List[dict]):
+        try:
+            self._execute(rows)
+        except IntegrityError:
+            db.session.rollback()
+            # a contact has been deleted since its log was added
+            forward_ids = {row["forward_id"] for row in rows}
+            existing = {
+                forward_id
+                for (forward_id,) in db.session.query(ForwardEmail.id).filter(
+                    ForwardEmail.id.in_(forward_ids)
+                )
+            }
+            LOG.warning("skip the logs of deleted contacts %s", forward_ids - existing)
+            self._execute([row for row in rows if row["forward_id"] in existing])
+
+    def _insert_one_by_one(self, rows: List[dict]) -> List[dict]:
+        """insert the logs in a transaction each and dead-letter those that fail.
+        Return the logs to retry later, if the database is unreachable"""
+        for i, row in enumerate(rows):
+            try:
+                self._insert([row])
+            except OperationalError:
+                db.session.rollback()
+                LOG.exception(
+                    "database unreachable, retry %s forward logs", len(rows) - i
+                )
+                return rows[i:]
+            except Exception:
+                db.session.rollback()
+                LOG.exception("cannot write forward log %s", row)
+                self._dead_letter(row)
+
+        return []
+
+    def _dead_letter(self, row: dict):
+        LOG.error("dead-letter forward log %s", _to_line(row).strip())
+        if not self.wal_dir:
+            return
+
+        failed_dir = os.path.join(self.wal_dir, "failed")
+        os.makedirs(failed_dir, exist_ok=True)
+        with open(os.path.join(failed_dir, f"{os.getpid()}.log"), "a") as f:
+            f.write(_to_line(row))
+
+    def _execute(self, rows: List[dict]):
+        for i in range(0, len(rows), self.batch_size):
+            db.session.execute(
+                ForwardEmailLog.__table__.insert().values(
+                    [
+                        {c: row[c] for c in _LOG_COLUMNS}
+                        for row in rows[i : i + self.batch_size]
+                    ]
+                )
+            )
+
+        alias_counters.increment(rows)
+        db.session.commit()
+
+    def start(self):
+        """flush in a background thread"""
+        self._thread = threading.Thread(
+            target=self._run, name="forward_log_writer", daemon=True
+        )
+        self._thread.start()
+
+    def close(self):
+        """flush the remaining logs and stop the background thread"""
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+
+        self.flush()
+        if self._wal:
+            self._wal.close()
+            self._wal = None
+            # otherwise the files are recovered at the next start
+            if not self._rows:
+                for path in self._wal_files:
+                    os.remove(path)
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.wait(self.flush_interval / 1000)
+            self._wakeup.clear()
+            self.flush()
+
+    def _open_wal(self):
+        path = self._new_wal_path()
+        # never append to a file of another process
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        self._wal = os.fdopen(fd, "a")
+        self._wal_files.append(path)
+
+    def _new_wal_path(self) -> str:
+        self._wal_seq += 1
+        return os.path.join(
+            self.wal_dir, f"{os.getpid()}.{self._wal_id}.{self._wal_seq}.log"
+        )
+
+    def _recover(self):
+        """take over the wal files of the processes that are not running anymore"""
+        for name in sorted(os.listdir(self.wal_dir)):
+            m = _WAL_RE.match(name)
+            # the failed/ directory
+            if not m or m.group(2) == self._wal_id:
+                continue
+
+            # a file with the pid of this process was left by a dead process whose pid is reused
+            pid = int(m.group(1))
+            if pid != os.getpid() and _is_running(pid):
+                continue
+
+            path = self._new_wal_path()
+            try:
+                os.rename(os.path.join(self.wal_dir, name), path)
+            except FileNotFoundError:
+                # taken over by another process
+                continue
+
+            with open(path) as f:
+                rows = [_from_line(line) for line in f if line.endswith("\n")]
+
+            LOG.warning("recover %s forward logs from %s", len(rows), name)
+            self._rows.extend(rows)
+            self._wal_files.append(path)
+
+
+def _to_line(row: dict) -> str:
+    return json.dumps({**row, "created_at": row["created_at"].isoformat()}) + "\n"
+
+
+def _from_line(line: str) -> dict:
+    row = json.loads(line)
+    row["created_at"] = arrow.get(row["created_at"])
+    return row
+
+
+def _is_running(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists but belongs to another user
+        return True
+
+    return True
@@ -10,10 +10,16 @@ from sqlalchemy_utils import ArrowType
 
 from app import s3
 from app.config import EMAIL_DOMAIN, MAX_NB_EMAIL_FREE_PLAN, URL, AVATAR_URL_EXPIRATION
-from app.email_utils import get_email_name
+from app.email_utils import (
+    get_email_name,
+    generate_reply_email,
+    get_forward_email_id,
+    is_signed_reply_email,
+)
 from app.extensions import db
 from app.log import LOG
 from app.oauth_models import Scope
+from app.request_memo import memoize
 from app.utils import convert_to_id, random_string, random_words, random_word
 
 
@@ -97,6 +103,13 @@ class User(db.Model, ModelMixin, UserMixin):
 
     profile_picture = db.relationship(File)
 
+    # the plan of the subscription, materialized to avoid loading the subscription.
+    # Null for free plan. Set by the Paddle callback, see sync_plan()
+    plan = db.Column(db.Enum(PlanEnum), nullable=True)
+    # premium until this time if the subscription is cancelled, null otherwise.
+    # The expired plans are removed by the downgrade_expired_plans cron job
+    plan_expiration = db.Column(ArrowType, nullable=True)
+
     @classmethod
     def create(cls, email, name, password=None, **kwargs):
         user: User = super(User, cls).create(email=email, name=name, **kwargs)
@@ -119,17 +132,25 @@ class User(db.Model, ModelMixin, UserMixin):
 
     def is_premium(self):
         """user is premium if they have a active subscription"""
-        sub: Subscription = self.get_subscription()
-        if sub:
-            if sub.cancelled:
-                # user is premium until the next billing_date + 1
-                return sub.next_bill_date >= arrow.now().shift(days=-1).date()
+        if not self.plan:
+            return False
 
-            # subscription active, ie not cancelled
+        # subscription active, ie not cancelled
+        if not self.plan_expiration:
             return True
 
-        return False
+        return self.plan_expiration > arrow.now()
+
+    def sync_plan(self, sub: "Subscription"):
+        """materialize the plan of the subscription on the user"""
+        self.plan = sub.plan
+        if sub.cancelled:
+            # user is premium until the next billing_date + 1
+            self.plan_expiration = arrow.get(sub.next_bill_date).shift(days=2)
+        else:
+            self.plan_expiration = None
 
+    @memoize
     def can_create_new_alias(self):
         if self.is_premium():
             return True
@@ -183,19 +204,19 @@ class User(db.Model, ModelMixin, UserMixin):
 
     def plan_name(self) -> str:
         if self.is_premium():
-            sub = self.get_subscription()
-
-            if sub.plan == PlanEnum.monthly:
+            if self.plan == PlanEnum.monthly:
                 return "Monthly ($2.99/month)"
             else:
                 return "Yearly ($29.99/year)"
         else:
             return "Free Plan"
 
+    @memoize
     def get_subscription(self):
         sub = Subscription.get_by(user_id=self.id)
         return sub
 
+    @memoize
     def verified_custom_domains(self):
         return CustomDomain.query.filter_by(user_id=self.id, verified=True).all()
 
@@ -381,7 +402,21 @@ def generate_email() -> str:
 class GenEmail(db.Model, ModelMixin):
     """Generated email"""
 
-    user_id = db.Column(db.ForeignKey(User.id, ondelete="cascade"), nullable=False)
+    __table_args__ = (
+        # the dashboard lists the aliases of a user by (created_at, id)
+        db.Index("ix_gen_email_user_id_created_at", "user_id", "created_at", "id"),
+        # substring search, see alias_utils.py
+        db.Index(
+            "ix_gen_email_email_trgm",
+            "email",
+            postgresql_using="gin",
+            postgresql_ops={"email": "gin_trgm_ops"},
+        ),
+    )
+
+    user_id = db.Column(
+        db.ForeignKey(User.id, ondelete="cascade"), nullable=False, index=True
+    )
     email = db.Column(db.String(128), unique=True, nullable=False)
 
     enabled = db.Column(db.Boolean(), default=True, nullable=False)
@@ -390,6 +425,12 @@ class GenEmail(db.Model, ModelMixin):
         db.ForeignKey("custom_domain.id", ondelete="cascade"), nullable=True
     )
 
+    # activity counters, maintained by the email handler, see alias_counters.py
+    nb_forward = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    nb_blocked = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    nb_reply = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    last_activity_at = db.Column(ArrowType, nullable=True)
+
     user = db.relationship(User)
 
     @classmethod
@@ -522,11 +563,44 @@ class ForwardEmail(db.Model, ModelMixin):
     # when user clicks on "reply", they will reply to this address.
     # This address allows to hide user personal email
     # this reply email is created every time a website sends an email to user
-    # it has the prefix "reply+" to distinguish with other email
-    reply_email = db.Column(db.String(128), nullable=False)
+    # it has the prefix "reply+" or "ra+" to distinguish with other email
+    # the ones created now are generated by generate_reply_email()
+    reply_email = db.Column(db.String(128), nullable=False, index=True)
 
     gen_email = db.relationship(GenEmail, backref="forward_emails")
 
+    @classmethod
+    def create_new(cls, gen_email_id, website_email, website_from) -> "ForwardEmail":
+        forward_email = cls.create(
+            gen_email_id=gen_email_id,
+            website_email=website_email,
+            website_from=website_from,
+            reply_email="",
+        )
+
+        # the reverse-alias is generated from the id
+        db.session.flush()
+        forward_email.reply_email = generate_reply_email(forward_email.id)
+
+        return forward_email
+
+    @classmethod
+    def get_by_reply_email(cls, reply_email) -> "ForwardEmail":
+        if is_signed_reply_email(reply_email):
+            forward_email_id = get_forward_email_id(reply_email)
+            if not forward_email_id:
+                return None
+
+            forward_email = cls.get(forward_email_id)
+            # make sure the ForwardEmail has not been deleted and its id reused
+            if forward_email and forward_email.reply_email == reply_email.lower():
+                return forward_email
+
+            return None
+
+        # reverse-alias created before generate_reply_email()
+        return cls.get_by(reply_email=reply_email)
+
     def website_send_to(self):
         """return the email address with name.
         to use when user wants to send an email from the alias"""
@@ -547,6 +621,18 @@ class ForwardEmail(db.Model, ModelMixin):
 
 
 class ForwardEmailLog(db.Model, ModelMixin):
+    __table_args__ = (
+        # the activity of an alias is listed by (created_at, id)
+        db.Index(
+            "ix_forward_email_log_forward_id_created_at",
+            "forward_id",
+            "created_at",
+            "id",
+        ),
+        # the expired logs are compacted by day, see forward_log_compaction.py
+        db.Index("ix_forward_email_log_created_at", "created_at"),
+    )
+
     forward_id = db.Column(
         db.ForeignKey(ForwardEmail.id, ondelete="cascade"), nullable=False
     )
@@ -558,6 +644,24 @@ class ForwardEmailLog(db.Model, ModelMixin):
     blocked = db.Column(db.Boolean, nullable=False, default=False)
 
 
+class AliasActivityDaily(db.Model, ModelMixin):
+    """ForwardEmailLog older than FORWARD_LOG_RETENTION_DAYS, aggregated by alias and day.
+    See forward_log_compaction.py"""
+
+    __table_args__ = (
+        db.UniqueConstraint("gen_email_id", "date", name="uq_alias_activity_daily"),
+    )
+
+    gen_email_id = db.Column(
+        db.ForeignKey(GenEmail.id, ondelete="cascade"), nullable=False
+    )
+    date = db.Column(db.Date, nullable=False)
+
+    nb_forward = db.Column(db.Integer, nullable=False, default=0)
+    nb_blocked = db.Column(db.Integer, nullable=False, default=0)
+    nb_reply = db.Column(db.Integer, nullable=False, default=0)
+
+
 class Subscription(db.Model, ModelMixin):
     # Come from Paddle
     cancel_url = db.Column(db.String(1024), nullable=False)
@@ -580,6 +684,11 @@ class Subscription(db.Model, ModelMixin):
 class DeletedAlias(db.Model, ModelMixin):
     """Store all deleted alias to make sure they are NOT reused"""
 
+    __table_args__ = (
+        # the deleted aliases of a user since a given time, see /api/aliases
+        db.Index("ix_deleted_alias_user_id_created_at", "user_id", "created_at"),
+    )
+
     user_id = db.Column(db.ForeignKey(User.id, ondelete="cascade"), nullable=False)
     email = db.Column(db.String(128), unique=True, nullable=False)
 
@@ -617,6 +726,22 @@ class AliasUsedOn(db.Model, ModelMixin):
     hostname = db.Column(db.String(1024), nullable=False)
 
 
+class LastAliasUsedOn(db.Model, ModelMixin):
+    """The alias most recently used on a hostname by a user, to recommend it.
+    Kept in sync with AliasUsedOn by alias_utils.record_alias_used_on()"""
+
+    __table_args__ = (
+        # also the index of the lookup by user and hostname
+        db.UniqueConstraint("user_id", "hostname", name="uq_last_alias_used_on"),
+    )
+
+    user_id = db.Column(db.ForeignKey(User.id, ondelete="cascade"), nullable=False)
+    hostname = db.Column(db.String(1024), nullable=False)
+    gen_email_id = db.Column(
+        db.ForeignKey(GenEmail.id, ondelete="cascade"), nullable=False
+    )
+
+
 class ApiKey(db.Model, ModelMixin):
     """used in browser extension to identify user"""
 
@@ -651,3 +776,29 @@ class CustomDomain(db.Model, ModelMixin):
 
     def nb_alias(self):
         return GenEmail.filter_by(custom_domain_id=self.id).count()
+
+
+class StatsSnapshot(db.Model, ModelMixin):
+    """Stats at the end of a day, computed by the stats cron job, see stats_utils.py.
+    The users of IGNORED_EMAILS are not counted"""
+
+    date = db.Column(db.Date, nullable=False, unique=True)
+
+    nb_user = db.Column(db.Integer, nullable=False)
+    nb_premium = db.Column(db.Integer, nullable=False)
+    nb_alias = db.Column(db.Integer, nullable=False)
+    # only known for the day before the snapshot is computed, None for the days caught up
+    nb_disabled_alias = db.Column(db.Integer, nullable=True)
+    nb_custom_domain = db.Column(db.Integer, nullable=False)
+    nb_custom_domain_alias = db.Column(db.Integer, nullable=False)
+    nb_app = db.Column(db.Integer, nullable=False)
+
+    # since the beginning
+    nb_forward = db.Column(db.Integer, nullable=False)
+    nb_block = db.Column(db.Integer, nullable=False)
+    nb_reply = db.Column(db.Integer, nullable=False)
+
+    # during the day
+    day_nb_forward = db.Column(db.Integer, nullable=False)
+    day_nb_block = db.Column(db.Integer, nullable=False)
+    day_nb_reply = db.Column(db.Integer, nullable=False)
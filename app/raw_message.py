@@ -0,0 +1,96 @@
+"""
+Message kept as raw bytes.
+Forwarding or replying only touches a few headers: instead of parsing the whole MIME tree
+and generating it again, only the header block is split into fields. The body is never
+parsed or copied before the message is serialized and is sent as received.
+"""
+from email.policy import SMTP, SMTPUTF8
+from typing import Optional
+
+
+class RawMessage:
+    def __init__(self, content: bytes):
+        header_end, body_start = _split(content)
+
+        # each field is (lowercase name, raw bytes including the continuation lines)
+        self._fields: [(str, bytes)] = []
+        for line in content[:header_end].splitlines(keepends=True):
+            if line[:1] in (b" ", b"\t") and self._fields:
+                name, raw = self._fields[-1]
+                self._fields[-1] = (name, raw + line)
+            else:
+                name = line[: line.find(b":")].strip().decode(errors="replace")
+                self._fields.append((name.lower(), line))
+
+        # new fields use the same line separator as the message
+        self._linesep = b"\n" if content[header_end:body_start] == b"\n" else b"\r\n"
+
+        # the blank line between the header and the body, and the body
+        self.body = memoryview(content)[header_end:]
+
+    def get(self, name) -> Optional[str]:
+        """return the decoded value of the first field with this name, None if not found"""
+        name = name.lower()
+        for field_name, raw in self._fields:
+            if field_name == name:
+                value = raw[raw.find(b":") + 1 :].decode("utf-8", errors="replace")
+                # unfold
+                value = "".join(value.splitlines()).strip()
+                return str(SMTPUTF8.header_factory(name, value))
+
+        return None
+
+    def __getitem__(self, name) -> Optional[str]:
+        return self.get(name)
+
+    def set(self, name, value: str):
+        """replace the first field with this name and remove the others.
+        The field is added at the end of the header block if it does not exist"""
+        raw = self._fold(name, value)
+        lower_name = name.lower()
+
+        fields = []
+        replaced = False
+        for field_name, field_raw in self._fields:
+            if field_name == lower_name:
+                if not replaced:
+                    fields.append((lower_name, raw))
+                    replaced = True
+            else:
+                fields.append((field_name, field_raw))
+
+        if not replaced:
+            fields.append((lower_name, raw))
+
+        self._fields = fields
+
+    def delete(self, name):
+        """remove all fields with this name"""
+        name = name.lower()
+        self._fields = [(n, raw) for n, raw in self._fields if n != name]
+
+    def as_bytes(self) -> bytes:
+        return b"".join([raw for _, raw in self._fields] + [self.body])
+
+    def _fold(self, name, value: str) -> bytes:
+        # non-ascii values are encoded according to RFC 2047
+        header = SMTP.header_factory(name, value)
+        raw = header.fold(policy=SMTP).encode()
+        if self._linesep != b"\r\n":
+            raw = raw.replace(b"\r\n", self._linesep)
+
+        return raw
+
+
+def _split(content: bytes) -> (int, int):
+    """return where the header block ends and where the body starts"""
+    crlf = content.find(b"\r\n\r\n")
+    lf = content.find(b"\n\n")
+
+    if crlf != -1 and (lf == -1 or crlf < lf):
+        return crlf + 2, crlf + 4
+    if lf != -1:
+        return lf + 1, lf + 2
+
+    # no body
+    return len(content), len(content)
@@ -0,0 +1,56 @@
+"""
+Memoize the result of a model method during a request, for ex User.is_premium() that is
+called many times by the views and the templates.
+
+The results are kept on flask.g: they don't outlive the request and are dropped as soon as
+something is written to the database. Outside a request (email handler, cron) nothing is memoized.
+
+The SQL queries of a request are also counted in g.nb_query.
+"""
+from functools import wraps
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+
+def memoize(f):
+    """for a model method: the result is memoized by object id and arguments"""
+
+    @wraps(f)
+    def wrapper(self, *args):
+        if not has_request_context():
+            return f(self, *args)
+
+        memo = g.setdefault("_memo", {})
+        key = (type(self).__name__, self.id, f.__name__, args)
+        if key not in memo:
+            memo[key] = f(self, *args)
+
+        return memo[key]
+
+    return wrapper
+
+
+def clear():
+    if has_request_context():
+        g.pop("_memo", None)
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session, flush_context):
+    clear()
+
+
+# Query.update() and Query.delete() don't flush, for ex ModelMixin.delete()
+@event.listens_for(Session, "after_bulk_update")
+@event.listens_for(Session, "after_bulk_delete")
+def _after_bulk(context):
+    clear()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.nb_query = g.get("nb_query", 0) + 1
@@ -0,0 +1,197 @@
+"""
+Pool of persistent SMTP connections to Postfix.
+Opening a connection costs more than relaying a small message so the email handler and
+the transactional emails share a few long-lived connections instead.
+"""
+import threading
+import time
+from smtplib import (
+    SMTP,
+    SMTPDataError,
+    SMTPRecipientsRefused,
+    SMTPResponseException,
+    SMTPSenderRefused,
+    SMTPServerDisconnected,
+)
+
+from app.config import (
+    POSTFIX_SERVER,
+    POSTFIX_PORT,
+    SMTP_POOL_SIZE,
+    SMTP_MAX_MESSAGES_PER_CONNECTION,
+    SMTP_IDLE_CHECK,
+)
+from app.log import LOG
+
+
+class _NotSent(Exception):
+    """the connection was closed before the message was handed over to Postfix"""
+
+
+class _Connection:
+    def __init__(self, smtp: SMTP):
+        self.smtp = smtp
+        self.nb_message = 0
+        self.last_used = time.time()
+
+
+class SMTPPool:
+    def __init__(
+        self,
+        host,
+        port,
+        size=SMTP_POOL_SIZE,
+        max_messages=SMTP_MAX_MESSAGES_PER_CONNECTION,
+        idle_check=SMTP_IDLE_CHECK,
+        smtp_class=SMTP,
+    ):
+        self.host = host
+        self.port = port
+        self.max_messages = max_messages
+        # a connection idle for more than idle_check seconds is checked with NOOP
+        self.idle_check = idle_check
+        self.smtp_class = smtp_class
+
+        self._idle: [_Connection] = []
+        self._lock = threading.Lock()
+        # limit the number of connections opened at the same time
+        self._slots = threading.BoundedSemaphore(size)
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        """send a message through a pooled connection, like SMTP.sendmail().
+        The message is sent again on a new connection if the pooled one has been closed by Postfix
+        before the message was handed over, i.e. before DATA. A disconnection during DATA is
+        raised: Postfix might have accepted the message, the caller decides whether to resend it
+        """
+        with self._slots:
+            conn = self._checkout()
+            try:
+                res = _transaction(
+                    conn.smtp, from_addr, to_addrs, msg, mail_options, rcpt_options
+                )
+            except _NotSent:
+                LOG.warning("SMTP connection closed, retry with a new connection")
+                self._discard(conn)
+                conn = self._connect()
+                try:
+                    res = _transaction(
+                        conn.smtp, from_addr, to_addrs, msg, mail_options, rcpt_options
+                    )
+                except _NotSent as e:
+                    self._discard(conn)
+                    raise e.__cause__
+                except Exception:
+                    self._release_after_error(conn)
+                    raise
+            except Exception:
+                self._release_after_error(conn)
+                raise
+
+            conn.nb_message += 1
+            self._checkin(conn)
+            return res
+
+    def close(self):
+        """close all idle connections, for ex when the process stops"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for conn in idle:
+            self._discard(conn)
+
+    def _connect(self) -> _Connection:
+        LOG.d("open SMTP connection to %s:%s", self.host, self.port)
+        return _Connection(self.smtp_class(self.host, self.port))
+
+    def _checkout(self) -> _Connection:
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+
+            if not conn:
+                return self._connect()
+
+            if time.time() - conn.last_used < self.idle_check:
+                return conn
+
+            # the connection might have been closed by Postfix
+            if self._is_alive(conn, "noop"):
+                return conn
+
+            self._discard(conn)
+
+    def _checkin(self, conn: _Connection):
+        if conn.nb_message >= self.max_messages:
+            LOG.d("SMTP connection has sent %s messages, close it", conn.nb_message)
+            self._discard(conn)
+            return
+
+        conn.last_used = time.time()
+        with self._lock:
+            self._idle.append(conn)
+
+    def _release_after_error(self, conn: _Connection):
+        """the transaction might be half done, reset it before reusing the connection"""
+        if self._is_alive(conn, "rset"):
+            self._checkin(conn)
+        else:
+            self._discard(conn)
+
+    @staticmethod
+    def _is_alive(conn: _Connection, command) -> bool:
+        try:
+            code, _ = getattr(conn.smtp, command)()
+        except (SMTPServerDisconnected, SMTPResponseException, OSError):
+            return False
+
+        return code == 250
+
+    @staticmethod
+    def _discard(conn: _Connection):
+        try:
+            conn.smtp.quit()
+        except (SMTPServerDisconnected, SMTPResponseException, OSError):
+            conn.smtp.close()
+
+
+def _transaction(
+    smtp: SMTP, from_addr, to_addrs, msg, mail_options, rcpt_options
+) -> dict:
+    """SMTP.sendmail() that raises _NotSent if the connection is closed before DATA"""
+    if isinstance(to_addrs, str):
+        to_addrs = [to_addrs]
+
+    try:
+        smtp.ehlo_or_helo_if_needed()
+
+        esmtp_opts = []
+        if smtp.does_esmtp:
+            if smtp.has_extn("size"):
+                esmtp_opts.append(f"size={len(msg)}")
+            esmtp_opts.extend(mail_options)
+
+        code, resp = smtp.mail(from_addr, esmtp_opts)
+        if code != 250:
+            smtp.rset()
+            raise SMTPSenderRefused(code, resp, from_addr)
+
+        refused = {}
+        for to_addr in to_addrs:
+            code, resp = smtp.rcpt(to_addr, rcpt_options)
+            if code not in (250, 251):
+                refused[to_addr] = (code, resp)
+
+        if len(refused) == len(to_addrs):
+            smtp.rset()
+            raise SMTPRecipientsRefused(refused)
+    except SMTPServerDisconnected as e:
+        raise _NotSent() from e
+
+    code, resp = smtp.data(msg)
+    if code != 250:
+        raise SMTPDataError(code, resp)
+
+    return refused
+
+
+smtp_pool = SMTPPool(POSTFIX_SERVER, POSTFIX_PORT)
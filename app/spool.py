@@ -0,0 +1,204 @@
+"""
+On-disk spool of the messages received by the email handler.
+
+A message is written to tmp/, fsync'ed then moved to new/: once in new/ it survives a crash.
+The file name is {next attempt in ms}.{nb attempt}.{id} so the messages due first come first
+when the directory is sorted.
+A worker claims a message by moving it to work/ with its pid in the name: only one worker
+can succeed. The messages of a dead worker are moved back to new/ by recover().
+A message that can't be processed goes back to new/ with a later next attempt, or to failed/
+after SPOOL_MAX_ATTEMPTS attempts or if it is refused with a 5xx.
+The files of new/ whose name isn't a spool name are moved to failed/ as is.
+
+Each file contains the envelope as a JSON line followed by the message content.
+"""
+import json
+import os
+import re
+import time
+import uuid
+from typing import NamedTuple, Optional, Callable
+
+from aiosmtpd.smtp import Envelope
+
+from app.config import SPOOL_RETRY_DELAY, SPOOL_MAX_ATTEMPTS
+from app.log import LOG
+
+# in seconds
+_MAX_RETRY_DELAY = 3600
+
+_NAME_RE = re.compile(r"^(\d+)\.(\d+)\.(\w+)$")
+
+
+class SpooledMessage(NamedTuple):
+    # file name in work/
+    name: str
+    nb_attempt: int
+    envelope: Envelope
+
+
+class Spool:
+    def __init__(
+        self, directory, retry_delay=SPOOL_RETRY_DELAY, max_attempts=SPOOL_MAX_ATTEMPTS
+    ):
+        self.directory = directory
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+
+        for d in ("tmp", "new", "work", "failed"):
+            os.makedirs(self._path(d), exist_ok=True)
+
+    def put(self, envelope: Envelope) -> str:
+        """write the message durably and return its name"""
+        name = _name(time.time(), 0, uuid.uuid4().hex)
+        tmp_path = self._path("tmp", name)
+
+        meta = {
+            "mail_from": envelope.mail_from,
+            "rcpt_tos": envelope.rcpt_tos,
+            "mail_options": envelope.mail_options,
+            "rcpt_options": envelope.rcpt_options,
+        }
+        with open(tmp_path, "wb") as f:
+            f.write(json.dumps(meta).encode() + b"\n")
+            f.write(envelope.content)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.rename(tmp_path, self._path("new", name))
+        # the rename is only durable once the directory is synced
+        _fsync_dir(self._path("new"))
+
+        return name
+
+    def claim(self) -> Optional[SpooledMessage]:
+        """take the first message due, None if there's none"""
+        now_ms = int(time.time() * 1000)
+        for name in sorted(os.listdir(self._path("new"))):
+            m = _NAME_RE.match(name)
+            if not m:
+                self._quarantine(name)
+                continue
+
+            next_attempt, nb_attempt, _ = m.groups()
+            if int(next_attempt) > now_ms:
+                # the next messages are not due either
+                return None
+
+            work_name = f"{os.getpid()}.{name}"
+            try:
+                os.rename(self._path("new", name), self._path("work", work_name))
+            except FileNotFoundError:
+                # claimed by another worker
+                continue
+
+            return SpooledMessage(
+                name=work_name,
+                nb_attempt=int(nb_attempt),
+                envelope=self._read(work_name),
+            )
+
+        return None
+
+    def done(self, msg: SpooledMessage):
+        os.remove(self._path("work", msg.name))
+
+    def fail(self, msg: SpooledMessage):
+        """move the message to failed/, where it stays until an admin looks at it"""
+        msg_id = msg.name.split(".")[-1]
+        os.rename(
+            self._path("work", msg.name),
+            self._path("failed", _name(time.time(), msg.nb_attempt + 1, msg_id)),
+        )
+
+    def retry(self, msg: SpooledMessage):
+        """put the message back in new/ with a later next attempt,
+        or in failed/ if it has been tried too many times"""
+        msg_id = msg.name.split(".")[-1]
+        nb_attempt = msg.nb_attempt + 1
+
+        if nb_attempt >= self.max_attempts:
+            LOG.error("spooled message %s failed %s times, give up", msg_id, nb_attempt)
+            self.fail(msg)
+            return
+
+        delay = min(self.retry_delay * 2 ** (nb_attempt - 1), _MAX_RETRY_DELAY)
+        LOG.warning("retry spooled message %s in %s seconds", msg_id, delay)
+        os.rename(
+            self._path("work", msg.name),
+            self._path("new", _name(time.time() + delay, nb_attempt, msg_id)),
+        )
+
+    def process_one(self, process: Callable[[Envelope], str]) -> bool:
+        """process the first message due with process(envelope) that returns *status_code message*.
+        Return False if there was no message to process"""
+        msg = self.claim()
+        if not msg:
+            return False
+
+        try:
+            status = process(msg.envelope)
+        except Exception:
+            LOG.exception("cannot process spooled message %s", msg.name)
+            self.retry(msg)
+            return True
+
+        if status.startswith("4"):
+            LOG.warning("spooled message %s: %s", msg.name, status)
+            self.retry(msg)
+        elif status.startswith("5"):
+            # the message has already been accepted: there's nobody to answer to
+            LOG.error("spooled message %s refused: %s", msg.name, status)
+            self.fail(msg)
+        else:
+            self.done(msg)
+
+        return True
+
+    def recover(self, pid: int = None):
+        """move the messages claimed by a worker, all workers if pid is None, back to new/"""
+        for work_name in os.listdir(self._path("work")):
+            worker_pid, _, name = work_name.partition(".")
+            if not worker_pid.isdigit() or not _NAME_RE.match(name):
+                LOG.error("unknown file %s in the spool work/", work_name)
+                continue
+
+            if pid is None or int(worker_pid) == pid:
+                LOG.warning("recover spooled message %s", name)
+                os.rename(self._path("work", work_name), self._path("new", name))
+
+    def _quarantine(self, name):
+        LOG.error("unknown file %s in the spool new/, move it to failed/", name)
+        try:
+            os.rename(self._path("new", name), self._path("failed", name))
+        except FileNotFoundError:
+            # moved by another worker
+            pass
+
+    def _read(self, work_name) -> Envelope:
+        with open(self._path("work", work_name), "rb") as f:
+            meta = json.loads(f.readline())
+            content = f.read()
+
+        envelope = Envelope()
+        envelope.mail_from = meta["mail_from"]
+        envelope.rcpt_tos = meta["rcpt_tos"]
+        envelope.mail_options = meta["mail_options"]
+        envelope.rcpt_options = meta["rcpt_options"]
+        envelope.content = content
+        return envelope
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+
+def _name(next_attempt: float, nb_attempt: int, msg_id: str) -> str:
+    return f"{int(next_attempt * 1000):013d}.{nb_attempt}.{msg_id}"
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -0,0 +1,147 @@
+"""
+Daily stats, stored in StatsSnapshot.
+
+A snapshot is computed for each day since the last one (the watermark): only the activity
+logs of the day are counted and added to the totals of the previous snapshot.
+The first snapshot counts everything once.
+
+Users, aliases, custom domains, custom domain aliases, subscriptions and apps are counted
+as of the end of the day, from their created_at. The subscriptions and the custom domain aliases
+include the ignored users, like before.
+
+Whether an alias is disabled is only known now: nb_disabled_alias is only counted
+for the day before today, and left to None for the days before it when catching up.
+The cancelled subscriptions are counted, like before.
+"""
+from datetime import date
+from typing import Optional
+
+import arrow
+from sqlalchemy import func, or_
+
+from app import alias_counters
+from app.config import IGNORED_EMAILS
+from app.extensions import db
+from app.log import LOG
+from app.models import (
+    AliasActivityDaily,
+    Client,
+    CustomDomain,
+    ForwardEmail,
+    ForwardEmailLog,
+    GenEmail,
+    StatsSnapshot,
+    Subscription,
+    User,
+)
+
+
+def update_snapshots(today: date = None) -> Optional[StatsSnapshot]:
+    """compute the snapshots of the days before today that don't have one yet
+    and return the most recent one, None if all the snapshots were already there"""
+    today = today or arrow.utcnow().date()
+    last = StatsSnapshot.query.order_by(StatsSnapshot.date.desc()).first()
+
+    if last:
+        day = arrow.get(last.date).shift(days=1).date()
+    else:
+        day = arrow.get(today).shift(days=-1).date()
+
+    snapshot = None
+    while day < today:
+        is_latest = arrow.get(day).shift(days=1).date() == today
+        snapshot = last = _compute(day, last, is_latest)
+        db.session.commit()
+        LOG.d("stats snapshot %s", snapshot)
+        day = arrow.get(day).shift(days=1).date()
+
+    return snapshot
+
+
+def _compute(
+    day: date, previous: Optional[StatsSnapshot], is_latest: bool
+) -> StatsSnapshot:
+    start = arrow.get(day)
+    end = start.shift(days=1)
+
+    day_nb_forward, day_nb_block, day_nb_reply = _activity(start, end)
+    if previous:
+        nb_forward = previous.nb_forward + day_nb_forward
+        nb_block = previous.nb_block + day_nb_block
+        nb_reply = previous.nb_reply + day_nb_reply
+    else:
+        nb_forward, nb_block, nb_reply = _activity(None, end)
+
+    alias_q = _not_ignored(
+        GenEmail.query.join(User, GenEmail.user_id == User.id).filter(
+            GenEmail.created_at < end
+        )
+    )
+
+    # the state of the aliases of a past day isn't kept
+    nb_disabled_alias = None
+    if is_latest:
+        nb_disabled_alias = GenEmail.query.filter(GenEmail.enabled == False).count()
+
+    return StatsSnapshot.create(
+        date=day,
+        nb_user=_not_ignored(User.query.filter(User.created_at < end)).count(),
+        nb_premium=Subscription.query.filter(Subscription.created_at < end).count(),
+        nb_alias=alias_q.count(),
+        nb_disabled_alias=nb_disabled_alias,
+        nb_custom_domain=CustomDomain.query.filter(
+            CustomDomain.created_at < end
+        ).count(),
+        nb_custom_domain_alias=GenEmail.query.filter(
+            GenEmail.custom_domain_id.isnot(None), GenEmail.created_at < end
+        ).count(),
+        nb_app=Client.query.filter(Client.created_at < end).count(),
+        nb_forward=nb_forward,
+        nb_block=nb_block,
+        nb_reply=nb_reply,
+        day_nb_forward=day_nb_forward,
+        day_nb_block=day_nb_block,
+        day_nb_reply=day_nb_reply,
+    )
+
+
+def _activity(start: Optional[arrow.Arrow], end: arrow.Arrow) -> (int, int, int):
+    """nb_forward, nb_block, nb_reply in [start, end), from the logs and the compacted logs"""
+    q = (
+        db.session.query(*alias_counters.log_counts())
+        .select_from(ForwardEmailLog)
+        .join(ForwardEmail, ForwardEmailLog.forward_id == ForwardEmail.id)
+        .join(GenEmail, ForwardEmail.gen_email_id == GenEmail.id)
+        .join(User, GenEmail.user_id == User.id)
+        .filter(ForwardEmailLog.created_at < end)
+    )
+    if start:
+        q = q.filter(ForwardEmailLog.created_at >= start)
+
+    compacted_q = (
+        db.session.query(
+            func.sum(AliasActivityDaily.nb_forward),
+            func.sum(AliasActivityDaily.nb_blocked),
+            func.sum(AliasActivityDaily.nb_reply),
+        )
+        .select_from(AliasActivityDaily)
+        .join(GenEmail, AliasActivityDaily.gen_email_id == GenEmail.id)
+        .join(User, GenEmail.user_id == User.id)
+        .filter(AliasActivityDaily.date < end.date())
+    )
+    if start:
+        compacted_q = compacted_q.filter(AliasActivityDaily.date >= start.date())
+
+    logs = _not_ignored(q).one()
+    compacted = _not_ignored(compacted_q).one()
+
+    return tuple((a or 0) + (b or 0) for a, b in zip(logs, compacted))
+
+
+def _not_ignored(q):
+    """exclude the users of IGNORED_EMAILS, q must be on User"""
+    if not IGNORED_EMAILS:
+        return q
+
+    # a single NOT (... OR ...) instead of a filter per email
+    return q.filter(~or_(*[User.email.contains(ie) for ie in IGNORED_EMAILS]))
@@ -0,0 +1,154 @@
+"""
+Run a function in several processes, restart the processes that die and stop them all on SIGTERM.
+The processes are spawned and not forked: they start with a fresh interpreter and
+must create their own app, database and SMTP connections.
+
+A process that dies before min_uptime is restarted after a delay doubling at each quick
+failure, up to max_restart_delay, and an error is logged after max_quick_failures in a row.
+"""
+import multiprocessing
+import signal
+import time
+from typing import Callable, List, Optional
+
+from app.log import LOG
+
+
+class _Worker:
+    def __init__(
+        self, name, target: Callable, on_exit: Optional[Callable[[int], None]]
+    ):
+        self.name = name
+        self.target = target
+        self.on_exit = on_exit
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+
+        # number of times in a row the process died before min_uptime
+        self.nb_quick_failure = 0
+        # when the dead process is restarted, None if it's running
+        self.restart_at: Optional[float] = None
+
+
+class Supervisor:
+    def __init__(
+        self,
+        stop_timeout=30,
+        check_interval=1,
+        min_uptime=60,
+        max_restart_delay=300,
+        max_quick_failures=5,
+    ):
+        # in seconds, the time left to the processes to stop on SIGTERM before being killed
+        self.stop_timeout = stop_timeout
+        self.check_interval = check_interval
+        # in seconds, a process dying before is restarted with a delay
+        self.min_uptime = min_uptime
+        self.max_restart_delay = max_restart_delay
+        self.max_quick_failures = max_quick_failures
+
+        self._workers: List[_Worker] = []
+        self._stopping = False
+        self._context = multiprocessing.get_context("spawn")
+
+    def add(self, name, target: Callable, nb=1, on_exit: Callable[[int], None] = None):
+        """run target() in nb processes. on_exit(pid) is called when one of them dies"""
+        for _ in range(nb):
+            self._workers.append(_Worker(name, target, on_exit))
+
+    def run(self):
+        """block until SIGTERM or SIGINT"""
+        signal.signal(signal.SIGTERM, self._on_signal)
+        signal.signal(signal.SIGINT, self._on_signal)
+
+        self.start()
+        while not self._stopping:
+            time.sleep(self.check_interval)
+            if not self._stopping:
+                self.check()
+
+        self.stop()
+
+    def start(self):
+        for worker in self._workers:
+            self._start(worker)
+
+    def check(self):
+        """restart the dead processes, after a delay for those that keep dying"""
+        now = time.time()
+        for worker in self._workers:
+            if worker.restart_at is not None:
+                if now >= worker.restart_at:
+                    self._start(worker)
+                continue
+
+            process = worker.process
+            if process.is_alive():
+                continue
+
+            if worker.on_exit:
+                worker.on_exit(process.pid)
+
+            if now - worker.started_at < self.min_uptime:
+                worker.nb_quick_failure += 1
+            else:
+                worker.nb_quick_failure = 0
+
+            delay = 0
+            if worker.nb_quick_failure:
+                # the exponent is bounded to not overflow when the process never starts
+                delay = min(
+                    self.check_interval * 2 ** min(worker.nb_quick_failure - 1, 30),
+                    self.max_restart_delay,
+                )
+
+            LOG.error(
+                "%s %s exited with %s, restart it in %ss",
+                worker.name,
+                process.pid,
+                process.exitcode,
+                delay,
+            )
+            if worker.nb_quick_failure == self.max_quick_failures:
+                LOG.error(
+                    "%s keeps dying: %s times in a row within %ss of starting",
+                    worker.name,
+                    worker.nb_quick_failure,
+                    self.min_uptime,
+                    self.max_restart_delay,
+                )
+
+            worker.restart_at = now + delay
+            if delay == 0:
+                self._start(worker)
+
+    def stop(self):
+        """ask the processes to stop with SIGTERM, kill those still running after stop_timeout"""
+        LOG.d("stop %s processes", len(self._workers))
+        for worker in self._workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+        deadline = time.time() + self.stop_timeout
+        for worker in self._workers:
+            worker.process.join(max(deadline - time.time(), 0))
+            if worker.process.is_alive():
+                LOG.error(
+                    "%s %s did not stop, kill it", worker.name, worker.process.pid
+                )
+                worker.process.kill()
+                worker.process.join()
+
+    def pids(self) -> List[int]:
+        return [w.process.pid for w in self._workers if w.process]
+
+    def _start(self, worker: _Worker):
+        worker.process = self._context.Process(target=worker.target, name=worker.name)
+        worker.process.start()
+        worker.started_at = time.time()
+        worker.restart_at = None
+        LOG.d("start %s %s", worker.name, worker.process.pid)
+
+    def _on_signal(self, signum, frame):
+        LOG.d("receive signal %s, stop", signum)
+        self._stopping = True
@@ -0,0 +1,130 @@
+"""
+Measure the time and peak memory needed by the email handler to transform a message,
+for both the forward and reply phases, with messages of different sizes.
+The database and Postfix are not involved.
+
+The current pipeline, that only parses the header block, is compared with the previous one
+that decoded the message to str, parsed the whole MIME tree and serialized it twice
+(once for DKIM, once for sending).
+
+Run with: CONFIG=/path/to/.env python -m benchmarks.email_pipeline
+"""
+import os
+import time
+import tracemalloc
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.parser import Parser
+from email.policy import SMTPUTF8
+
+import dkim
+
+from app.config import EMAIL_DOMAIN, DKIM_SELECTOR, DKIM_PRIVATE_KEY, DKIM_HEADERS
+from app.raw_message import RawMessage
+from email_handler import build_forward_message, build_reply_message
+
+SIZES = [1, 5, 10]  # in MB
+NB_RUN = 5
+
+WEBSITE_EMAIL = "newsletter@website.com"
+ALIAS = f"alias@{EMAIL_DOMAIN}"
+REPLY_EMAIL = f"ra+1.abcdef@{EMAIL_DOMAIN}"
+
+
+def generate_message(size_mb) -> bytes:
+    msg = MIMEMultipart()
+    msg["From"] = f"Website <{WEBSITE_EMAIL}>"
+    msg["To"] = ALIAS
+    msg["Subject"] = "Monthly newsletter"
+    msg.attach(MIMEText("Hello, please find the attachment\n" * 100))
+    msg.attach(MIMEApplication(os.urandom(size_mb * 1024 * 1024), Name="file.bin"))
+
+    return msg.as_bytes()
+
+
+def _legacy_add_or_replace_header(msg, header, value):
+    try:
+        msg.add_header(header, value)
+    except ValueError:
+        msg.replace_header(header, value)
+
+
+def _legacy_sign(msg, email_domain):
+    sig = dkim.sign(
+        msg.as_string().encode(),
+        DKIM_SELECTOR,
+        email_domain.encode(),
+        DKIM_PRIVATE_KEY.encode(),
+        include_headers=DKIM_HEADERS,
+    )
+    sig = sig.decode().replace("\n", " ").replace("\r", "")
+    msg.add_header("DKIM-Signature", sig[len("DKIM-Signature: ") :])
+
+
+def legacy_forward(content: bytes) -> bytes:
+    msg = Parser(policy=SMTPUTF8).parsestr(content.decode("utf8", errors="replace"))
+    _legacy_add_or_replace_header(msg, "X-SimpleLogin-Type", "Forward")
+    msg.replace_header("From", f"Website - {WEBSITE_EMAIL} <{REPLY_EMAIL}>")
+    _legacy_add_or_replace_header(msg, "List-Unsubscribe", "<https://unsubscribe>")
+    _legacy_sign(msg, EMAIL_DOMAIN)
+    return msg.as_string().encode()
+
+
+def legacy_reply(content: bytes) -> bytes:
+    msg = Parser(policy=SMTPUTF8).parsestr(content.decode("utf8", errors="replace"))
+    msg.replace_header("From", ALIAS)
+    msg.replace_header("To", WEBSITE_EMAIL)
+    _legacy_add_or_replace_header(msg, "List-Unsubscribe", "<https://unsubscribe>")
+    _legacy_sign(msg, EMAIL_DOMAIN)
+    return msg.as_string().encode()
+
+
+def current_forward(content: bytes) -> bytes:
+    msg = RawMessage(content)
+    return build_forward_message(msg, WEBSITE_EMAIL, REPLY_EMAIL, 1)
+
+
+def current_reply(content: bytes) -> bytes:
+    msg = RawMessage(content)
+    return build_reply_message(msg, ALIAS, WEBSITE_EMAIL, 1)
+
+
+PIPELINES = [
+    ("forward legacy", legacy_forward),
+    ("forward", current_forward),
+    ("reply legacy", legacy_reply),
+    ("reply", current_reply),
+]
+
+
+def measure(fn, content):
+    """return the average time in ms and the peak memory in MB"""
+    start = time.perf_counter()
+    for _ in range(NB_RUN):
+        fn(content)
+    elapsed = (time.perf_counter() - start) / NB_RUN * 1000
+
+    tracemalloc.start()
+    fn(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak / 1024 / 1024
+
+
+def main():
+    print(f"{'pipeline':<16}{'size MB':>8}{'ms':>10}{'ms/MB':>10}{'peak MB':>10}")
+    for size_mb in SIZES:
+        content = generate_message(size_mb)
+        real_size = len(content) / 1024 / 1024
+        for name, fn in PIPELINES:
+            elapsed, peak = measure(fn, content)
+            print(
+                f"{name:<16}{real_size:>8.1f}{elapsed:>10.1f}"
+                f"{elapsed / real_size:>10.1f}{peak:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
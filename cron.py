@@ -1,105 +1,95 @@
+import argparse
+
 import arrow
 
-from app.config import IGNORED_EMAILS, ADMIN_EMAIL
+from app import alias_counters, forward_log_compaction, stats_utils
+from app.config import ADMIN_EMAIL
 from app.email_utils import send_email
 from app.extensions import db
 from app.log import LOG
-from app.models import (
-    Subscription,
-    User,
-    GenEmail,
-    ForwardEmailLog,
-    ForwardEmail,
-    CustomDomain,
-    Client,
-)
+from app.models import User
 from server import create_app
 
 
 def stats():
-    """send admin stats everyday"""
-    if not ADMIN_EMAIL:
+    """compute the stats of the previous days and send them to admin"""
+    snapshot = stats_utils.update_snapshots()
+
+    # the email has already been sent if the snapshot of yesterday was there
+    if not ADMIN_EMAIL or not snapshot:
         # nothing to do
         return
 
-    # nb user
-    q = User.query
-    for ie in IGNORED_EMAILS:
-        q = q.filter(~User.email.contains(ie))
-
-    nb_user = q.count()
+    day = snapshot.date.isoformat()
 
-    LOG.d("total number user %s", nb_user)
-
-    # nb gen emails
-    q = db.session.query(GenEmail, User).filter(GenEmail.user_id == User.id)
-    for ie in IGNORED_EMAILS:
-        q = q.filter(~User.email.contains(ie))
+    send_email(
+        ADMIN_EMAIL,
+        subject=f"SimpleLogin Stats for {day}, {snapshot.nb_user} users, {snapshot.nb_alias} aliases, {snapshot.nb_forward} forwards",
+        plaintext="",
+        html=f"""
+Stats for {day} <br>
 
-    nb_gen_email = q.count()
-    LOG.d("total number alias %s", nb_gen_email)
+nb_user: {snapshot.nb_user} <br>
+nb_premium: {snapshot.nb_premium} <br>
 
-    # nb mails forwarded
-    q = db.session.query(ForwardEmailLog, ForwardEmail, GenEmail, User).filter(
-        ForwardEmailLog.forward_id == ForwardEmail.id,
-        ForwardEmail.gen_email_id == GenEmail.id,
-        GenEmail.user_id == User.id,
-    )
-    for ie in IGNORED_EMAILS:
-        q = q.filter(~User.email.contains(ie))
+nb_alias: {snapshot.nb_alias} <br>
+nb_disabled_alias: {snapshot.nb_disabled_alias} <br>
 
-    nb_forward = nb_block = nb_reply = 0
-    for fel, _, _, _ in q:
-        if fel.is_reply:
-            nb_reply += 1
-        elif fel.blocked:
-            nb_block += 1
-        else:
-            nb_forward += 1
+nb_custom_domain: {snapshot.nb_custom_domain} <br>
+nb_custom_domain_alias: {snapshot.nb_custom_domain_alias} <br>
 
-    LOG.d("nb forward %s, nb block %s, nb reply %s", nb_forward, nb_block, nb_reply)
+nb_forward: {snapshot.nb_forward} (+{snapshot.day_nb_forward}) <br>
+nb_reply: {snapshot.nb_reply} (+{snapshot.day_nb_reply}) <br>
+nb_block: {snapshot.nb_block} (+{snapshot.day_nb_block}) <br>
 
-    nb_premium = Subscription.query.count()
-    nb_custom_domain = CustomDomain.query.count()
+nb_app: {snapshot.nb_app} <br>
+    """,
+    )
 
-    nb_custom_domain_alias = GenEmail.query.filter(
-        GenEmail.custom_domain_id.isnot(None)
-    ).count()
 
-    nb_disabled_alias = GenEmail.query.filter(GenEmail.enabled == False).count()
+def backfill_alias_counters():
+    """set the activity counters of all aliases from their logs.
+    Already done by the migration that adds the counters"""
+    alias_counters.backfill()
 
-    nb_app = Client.query.count()
 
-    today = arrow.now().format()
+def check_alias_counters():
+    """fix the aliases with logs since the previous run (daily, with a margin)
+    whose activity counters don't match their logs"""
+    wrong = alias_counters.check(fix=True, since=arrow.now().shift(days=-2))
+    LOG.d("fix the activity counters of %s aliases", len(wrong))
 
-    send_email(
-        ADMIN_EMAIL,
-        subject=f"SimpleLogin Stats for {today}, {nb_user} users, {nb_gen_email} aliases, {nb_forward} forwards",
-        plaintext="",
-        html=f"""
-Stats for {today} <br>
 
-nb_user: {nb_user} <br>
-nb_premium: {nb_premium} <br>
+def compact_forward_logs():
+    """aggregate then delete the logs older than FORWARD_LOG_RETENTION_DAYS"""
+    forward_log_compaction.compact()
 
-nb_alias: {nb_gen_email} <br>
-nb_disabled_alias: {nb_disabled_alias} <br>
 
-nb_custom_domain: {nb_custom_domain} <br>
-nb_custom_domain_alias: {nb_custom_domain_alias} <br>
+def downgrade_expired_plans():
+    """remove the plan of the users whose cancelled subscription has expired"""
+    nb_user = User.query.filter(User.plan_expiration < arrow.now()).update(
+        {User.plan: None, User.plan_expiration: None}, synchronize_session=False
+    )
+    db.session.commit()
+    LOG.d("downgrade %s users", nb_user)
 
-nb_forward: {nb_forward} <br>
-nb_reply: {nb_reply} <br>
-nb_block: {nb_block} <br>
 
-nb_app: {nb_app} <br>
-    """,
-    )
+JOBS = {
+    "stats": stats,
+    "backfill_alias_counters": backfill_alias_counters,
+    "check_alias_counters": check_alias_counters,
+    "compact_forward_logs": compact_forward_logs,
+    "downgrade_expired_plans": downgrade_expired_plans,
+}
 
 
 if __name__ == "__main__":
-    LOG.d("Start running cronjob")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-j", "--job", choices=JOBS.keys(), default="stats")
+    args = parser.parse_args()
+
+    LOG.d("Start running cronjob %s", args.job)
     app = create_app()
 
     with app.app_context():
-        stats()
+        JOBS[args.job]()
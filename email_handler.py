@@ -30,15 +30,36 @@ It should contain the following info:
 
 
 """
-import time
-from email.message import EmailMessage
-from email.parser import Parser
-from email.policy import SMTPUTF8
-from smtplib import SMTP
-
-from aiosmtpd.controller import Controller
-
-from app.config import EMAIL_DOMAIN, POSTFIX_SERVER, URL
+import asyncio
+import os
+import signal
+import socket
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from aiosmtpd.smtp import SMTP
+
+from app.alias_directory import alias_directory
+from app.config import (
+    EMAIL_DOMAIN,
+    URL,
+    DB_URI,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    EMAIL_HANDLER_WORKERS,
+    EMAIL_HANDLER_MAX_QUEUE,
+    EMAIL_HANDLER_RCPT_WORKERS,
+    EMAIL_HANDLER_PROCESSES,
+    EMAIL_HANDLER_DRAIN_TIMEOUT,
+    REJECT_DISABLED_ALIAS_AT_RCPT,
+    DKIM_SIGN_CUSTOM_DOMAIN,
+    SPOOL_DIR,
+    SPOOL_WORKERS,
+)
+from app.dkim_utils import dkim_signer
 from app.email_utils import (
     get_email_name,
     get_email_part,
@@ -46,131 +67,189 @@ from app.email_utils import (
     add_dkim_signature,
 )
 from app.extensions import db
+from app.forward_log_writer import ForwardLogWriter
 from app.log import LOG
-from app.models import GenEmail, ForwardEmail, ForwardEmailLog
-from app.utils import random_string
+from app.models import ForwardEmail, CustomDomain, GenEmail
+from app.raw_message import RawMessage
+from app.smtp_pool import smtp_pool
+from app.spool import Spool
+from app.supervisor import Supervisor
 from server import create_app
 
 
-# fix the database connection leak issue
-# use this method instead of create_app
+EMAIL_HANDLER_PORT = 20381
+
+
 def new_app():
+    """Create the app used by the email handler.
+    It must be created only once per process: every app has its own database engine,
+    creating an app per message used to leak a connection pool per message.
+    """
     app = create_app()
 
+    if not DB_URI.startswith("sqlite"):
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_recycle": DB_POOL_RECYCLE,
+            # a pooled connection can be closed by Postgres while idle
+            "pool_pre_ping": True,
+        }
+
     @app.teardown_appcontext
     def shutdown_session(response_or_exc):
-        # same as shutdown_session() in flask-sqlalchemy but this is not enough
+        # same as shutdown_session() in flask-sqlalchemy: each message has its own session
+        # which gives its connection back to the pool here
         db.session.remove()
 
-        # dispose the engine too
-        db.engine.dispose()
-
     return app
 
 
 class MailHandler:
+    def __init__(self, app, spool: Spool = None):
+        self.app = app
+        # in spool mode, messages are only written to the spool and processed by spool_worker()
+        self.spool = spool
+
+        # handle_DATA runs in the event loop shared by all SMTP sessions:
+        # the blocking work (database, DKIM, relay to Postfix) is done in this pool
+        self.executor = ThreadPoolExecutor(
+            max_workers=EMAIL_HANDLER_WORKERS, thread_name_prefix="email_handler"
+        )
+        # number of messages being processed or waiting for a free worker
+        self.nb_pending = 0
+        # the recipients are checked in their own pool: a check doesn't wait behind
+        # the messages queued in the pool above
+        self.rcpt_executor = ThreadPoolExecutor(
+            max_workers=EMAIL_HANDLER_RCPT_WORKERS,
+            thread_name_prefix="email_handler_rcpt",
+        )
+
+        # the activity logs are inserted by batch
+        self.forward_log_writer = ForwardLogWriter(app)
+        self.forward_log_writer.start()
+
+    def close(self):
+        """wait for the messages being processed and write their logs"""
+        self.rcpt_executor.shutdown(wait=True)
+        self.executor.shutdown(wait=True)
+        self.forward_log_writer.close()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        # refuse unknown recipients before receiving the message body
+        error = await asyncio.get_event_loop().run_in_executor(
+            self.rcpt_executor, self.check_recipient, address
+        )
+        if error:
+            LOG.d("refuse recipient %s: %s", address, error)
+            return error
+
+        envelope.rcpt_tos.append(address)
+        envelope.rcpt_options.extend(rcpt_options)
+        return "250 OK"
+
+    def check_recipient(self, address) -> Optional[str]:
+        """return *status_code message* if the recipient must be refused, None otherwise"""
+        with self.app.app_context():
+            if is_reply_email(address):
+                if not ForwardEmail.get_by_reply_email(address):
+                    return "550 5.1.1 Unknown reverse-alias"
+            else:
+                alias = alias_directory.get(address)
+                if not alias:
+                    return "550 5.1.1 Unknown alias"
+
+                # a disabled alias is blocked anyway, refusing it early skips the block log
+                if REJECT_DISABLED_ALIAS_AT_RCPT and not alias.enabled:
+                    return "550 5.7.1 Alias is disabled"
+
+        return None
+
     async def handle_DATA(self, server, session, envelope):
         LOG.debug(">>> New message <<<")
 
         LOG.debug("Mail from %s", envelope.mail_from)
         LOG.debug("Rcpt to %s", envelope.rcpt_tos)
-        message_data = envelope.content.decode("utf8", errors="replace")
 
-        # Only when debug
-        # LOG.debug("Message data:\n")
-        # LOG.debug(message_data)
+        if self.nb_pending >= EMAIL_HANDLER_WORKERS + EMAIL_HANDLER_MAX_QUEUE:
+            LOG.warning("%s messages pending, ask sender to retry", self.nb_pending)
+            return "451 4.3.2 Too many messages, please try again later"
 
-        # host IP, setup via Docker network
-        smtp = SMTP(POSTFIX_SERVER, 25)
-        msg = Parser(policy=SMTPUTF8).parsestr(message_data)
+        self.nb_pending += 1
+        try:
+            if self.spool:
+                await asyncio.get_event_loop().run_in_executor(
+                    self.executor, self.spool.put, envelope
+                )
+                return "250 Message accepted for delivery"
+
+            return await asyncio.get_event_loop().run_in_executor(
+                self.executor, self.process_message, envelope
+            )
+        finally:
+            self.nb_pending -= 1
+
+    def process_message(self, envelope) -> str:
+        """run in a worker thread, return *status_code message*"""
+        # only the header block is parsed, the body is sent as received
+        msg = RawMessage(envelope.content)
 
         # Reply case
-        # reply+ or ra+ (reverse-alias) prefix
-        if envelope.rcpt_tos[0].startswith("reply+") or envelope.rcpt_tos[0].startswith(
-            "ra+"
-        ):
+        if is_reply_email(envelope.rcpt_tos[0]):
             LOG.debug("Reply phase")
-            app = new_app()
-
-            with app.app_context():
-                return self.handle_reply(envelope, smtp, msg)
+            with self.app.app_context():
+                return self.handle_reply(envelope, msg)
         else:  # Forward case
             LOG.debug("Forward phase")
-            app = new_app()
+            with self.app.app_context():
+                return self.handle_forward(envelope, msg)
 
-            with app.app_context():
-                return self.handle_forward(envelope, smtp, msg)
-
-    def handle_forward(self, envelope, smtp: SMTP, msg: EmailMessage) -> str:
+    def handle_forward(self, envelope, msg: RawMessage) -> str:
         """return *status_code message*"""
         alias = envelope.rcpt_tos[0]  # alias@SL
 
-        gen_email = GenEmail.get_by(email=alias)
-        if not gen_email:
-            LOG.d("alias %s not exist")
+        alias_entry = alias_directory.get(alias)
+        if not alias_entry:
+            LOG.d("alias %s not exist", alias)
             return "510 Email not exist"
 
-        user_email = gen_email.user.email
+        user_email = alias_entry.user_email
 
         website_email = get_email_part(msg["From"])
 
         forward_email = ForwardEmail.get_by(
-            gen_email_id=gen_email.id, website_email=website_email
+            gen_email_id=alias_entry.gen_email_id, website_email=website_email
         )
         if not forward_email:
+            # the directory still has the aliases deleted with their user or custom domain
+            # until its next reload. The contacts of an alias are deleted with it
+            if (
+                not db.session.query(GenEmail.id)
+                .filter(GenEmail.id == alias_entry.gen_email_id)
+                .first()
+            ):
+                LOG.d("alias %s has been deleted", alias)
+                alias_directory.forget(alias)
+                return "550 5.1.1 Unknown alias"
+
             LOG.debug(
                 "create forward email for alias %s and website email %s",
                 alias,
                 website_email,
             )
 
-            # generate a reply_email, make sure it is unique
-            # not use while to avoid infinite loop
-            for _ in range(1000):
-                reply_email = f"reply+{random_string(30)}@{EMAIL_DOMAIN}"
-                if not ForwardEmail.get_by(reply_email=reply_email):
-                    break
-
-            forward_email = ForwardEmail.create(
-                gen_email_id=gen_email.id,
+            forward_email = ForwardEmail.create_new(
+                gen_email_id=alias_entry.gen_email_id,
                 website_email=website_email,
                 website_from=msg["From"],
-                reply_email=reply_email,
             )
             db.session.commit()
 
-        forward_log = ForwardEmailLog.create(forward_id=forward_email.id)
-
-        if gen_email.enabled:
-            # add custom header
-            add_or_replace_header(msg, "X-SimpleLogin-Type", "Forward")
-
-            # remove reply-to header if present
-            if msg["Reply-To"]:
-                LOG.d("Delete reply-to header %s", msg["Reply-To"])
-                del msg["Reply-To"]
-
-            # change the from header so the sender comes from @SL
-            # so it can pass DMARC check
-            # replace the email part in from: header
-            from_header = (
-                get_email_name(msg["From"])
-                + " - "
-                + website_email.replace("@", " at ")
-                + f" <{forward_email.reply_email}>"
-            )
-            msg.replace_header("From", from_header)
-            LOG.d("new from header:%s", from_header)
-
-            # add List-Unsubscribe header
-            unsubscribe_link = f"{URL}/dashboard/unsubscribe/{gen_email.id}"
-            add_or_replace_header(msg, "List-Unsubscribe", f"<{unsubscribe_link}>")
-            add_or_replace_header(
-                msg, "List-Unsubscribe-Post", "List-Unsubscribe=One-Click"
+        if alias_entry.enabled:
+            msg_raw = build_forward_message(
+                msg, website_email, forward_email.reply_email, alias_entry.gen_email_id
             )
 
-            add_dkim_signature(msg, EMAIL_DOMAIN)
-
             LOG.d(
                 "Forward mail from %s to %s, mail_options %s, rcpt_options %s ",
                 website_email,
@@ -179,10 +258,7 @@ class MailHandler:
                 envelope.rcpt_options,
             )
 
-            # smtp.send_message has UnicodeEncodeErroremail issue
-            # encode message raw directly instead
-            msg_raw = msg.as_string().encode()
-            smtp.sendmail(
+            smtp_pool.sendmail(
                 forward_email.reply_email,
                 user_email,
                 msg_raw,
@@ -190,13 +266,16 @@ class MailHandler:
                 envelope.rcpt_options,
             )
         else:
-            LOG.d("%s is disabled, do not forward", gen_email)
-            forward_log.blocked = True
+            LOG.d("%s is disabled, do not forward", alias)
 
-        db.session.commit()
+        self.forward_log_writer.add(
+            forward_email.id,
+            alias_entry.gen_email_id,
+            blocked=not alias_entry.enabled,
+        )
         return "250 Message accepted for delivery"
 
-    def handle_reply(self, envelope, smtp: SMTP, msg: EmailMessage) -> str:
+    def handle_reply(self, envelope, msg: RawMessage) -> str:
         reply_email = envelope.rcpt_tos[0]
 
         # reply_email must end with EMAIL_DOMAIN
@@ -204,10 +283,24 @@ class MailHandler:
             LOG.error(f"Reply email {reply_email} has wrong domain")
             return "550 wrong reply email"
 
-        forward_email = ForwardEmail.get_by(reply_email=reply_email)
-        alias: str = forward_email.gen_email.email
+        forward_email = ForwardEmail.get_by_reply_email(reply_email)
+        if not forward_email:
+            LOG.warning("reverse-alias %s not exist", reply_email)
+            return "550 5.1.1 Unknown reverse-alias"
+
+        gen_email = forward_email.gen_email
+        alias: str = gen_email.email
 
-        user_email = forward_email.gen_email.user.email
+        # the custom domain is added to the DKIM signer the first time one of its aliases replies
+        if DKIM_SIGN_CUSTOM_DOMAIN and gen_email.custom_domain_id:
+            custom_domain = CustomDomain.get(gen_email.custom_domain_id)
+            if custom_domain.verified and not dkim_signer.can_sign(
+                custom_domain.domain
+            ):
+                LOG.d("sign emails of custom domain %s", custom_domain.domain)
+                dkim_signer.register(custom_domain.domain)
+
+        user_email = gen_email.user.email
         if envelope.mail_from != user_email:
             LOG.error(
                 f"Reply email can only be used by user email. Actual mail_from: %s. User email %s",
@@ -224,20 +317,8 @@ class MailHandler:
 
             return "250 ignored"
 
-        # remove DKIM-Signature
-        if msg["DKIM-Signature"]:
-            LOG.d("Remove DKIM-Signature %s", msg["DKIM-Signature"])
-            del msg["DKIM-Signature"]
-
-        # email seems to come from alias
-        msg.replace_header("From", alias)
-        msg.replace_header("To", forward_email.website_email)
-
-        # add List-Unsubscribe header
-        unsubscribe_link = f"{URL}/dashboard/unsubscribe/{forward_email.gen_email_id}"
-        add_or_replace_header(msg, "List-Unsubscribe", f"<{unsubscribe_link}>")
-        add_or_replace_header(
-            msg, "List-Unsubscribe-Post", "List-Unsubscribe=One-Click"
+        msg_raw = build_reply_message(
+            msg, alias, forward_email.website_email, forward_email.gen_email_id
         )
 
         LOG.d(
@@ -248,13 +329,7 @@ class MailHandler:
             envelope.rcpt_options,
         )
 
-        # todo: add DKIM-Signature for custom domain
-        # add DKIM-Signature for non-custom-domain alias
-        if alias.endswith(EMAIL_DOMAIN):
-            add_dkim_signature(msg, EMAIL_DOMAIN)
-
-        msg_raw = msg.as_string().encode()
-        smtp.sendmail(
+        smtp_pool.sendmail(
             alias,
             forward_email.website_email,
             msg_raw,
@@ -262,25 +337,179 @@ class MailHandler:
             envelope.rcpt_options,
         )
 
-        ForwardEmailLog.create(forward_id=forward_email.id, is_reply=True)
-        db.session.commit()
+        self.forward_log_writer.add(
+            forward_email.id, forward_email.gen_email_id, is_reply=True
+        )
 
         return "250 Message accepted for delivery"
 
 
-def add_or_replace_header(msg: EmailMessage, header: str, value: str):
-    try:
-        msg.add_header(header, value)
-    except ValueError:
-        # the header exists already
-        msg.replace_header(header, value)
+def build_forward_message(
+    msg: RawMessage, website_email: str, reply_email: str, gen_email_id: int
+) -> bytes:
+    """rewrite the headers of a message sent to an alias and return the signed message to forward"""
+    # add custom header
+    msg.set("X-SimpleLogin-Type", "Forward")
 
+    # remove reply-to header if present
+    delete_header(msg, "Reply-To")
 
-if __name__ == "__main__":
-    controller = Controller(MailHandler(), hostname="0.0.0.0", port=20381)
+    # change the from header so the sender comes from @SL
+    # so it can pass DMARC check
+    # replace the email part in from: header
+    from_header = (
+        get_email_name(msg["From"])
+        + " - "
+        + website_email.replace("@", " at ")
+        + f" <{reply_email}>"
+    )
+    msg.set("From", from_header)
+    LOG.d("new from header:%s", from_header)
+
+    # add List-Unsubscribe header
+    unsubscribe_link = f"{URL}/dashboard/unsubscribe/{gen_email_id}"
+    msg.set("List-Unsubscribe", f"<{unsubscribe_link}>")
+    msg.set("List-Unsubscribe-Post", "List-Unsubscribe=One-Click")
+
+    # remove the website DKIM-Signature, no longer valid
+    delete_header(msg, "DKIM-Signature")
+
+    return add_dkim_signature(msg.as_bytes(), EMAIL_DOMAIN)
 
-    controller.start()
-    LOG.d("Start mail controller %s %s", controller.hostname, controller.port)
 
-    while True:
-        time.sleep(2)
+def build_reply_message(
+    msg: RawMessage, alias: str, website_email: str, gen_email_id: int
+) -> bytes:
+    """rewrite the headers of a message sent to a reverse-alias and return the message to send"""
+    # remove DKIM-Signature
+    delete_header(msg, "DKIM-Signature")
+
+    # email seems to come from alias
+    msg.set("From", alias)
+    msg.set("To", website_email)
+
+    # add List-Unsubscribe header
+    unsubscribe_link = f"{URL}/dashboard/unsubscribe/{gen_email_id}"
+    msg.set("List-Unsubscribe", f"<{unsubscribe_link}>")
+    msg.set("List-Unsubscribe-Post", "List-Unsubscribe=One-Click")
+
+    # the message is serialized once, the signature is computed on and prepended to these bytes
+    msg_raw = msg.as_bytes()
+
+    # add DKIM-Signature if the alias domain has a DKIM key: EMAIL_DOMAIN or a custom domain
+    alias_domain = alias[alias.find("@") + 1 :]
+    if dkim_signer.can_sign(alias_domain):
+        msg_raw = add_dkim_signature(msg_raw, alias_domain)
+
+    return msg_raw
+
+
+def is_reply_email(address: str) -> bool:
+    """reply+ or ra+ (reverse-alias) prefix"""
+    return address.startswith("reply+") or address.startswith("ra+")
+
+
+def delete_header(msg: RawMessage, header: str):
+    """delete all occurrences of a header"""
+    if msg[header]:
+        LOG.d("Remove %s %s", header, msg[header])
+        msg.delete(header)
+
+
+def smtp_worker():
+    """accept SMTP connections until SIGTERM, run in its own process.
+    All the processes listen on the same port thanks to SO_REUSEPORT,
+    the kernel spreads the connections between them"""
+    app = new_app()
+    with app.app_context():
+        alias_directory.load()
+
+    spool = Spool(SPOOL_DIR) if SPOOL_DIR else None
+    handler = MailHandler(app, spool)
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("0.0.0.0", EMAIL_HANDLER_PORT))
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    # SMTP sessions in progress
+    sessions = weakref.WeakSet()
+
+    def factory():
+        session = SMTP(handler, enable_SMTPUTF8=True, loop=loop)
+        sessions.add(session)
+        return session
+
+    server = loop.run_until_complete(loop.create_server(factory, sock=sock))
+    LOG.d("Start SMTP worker %s on port %s", os.getpid(), EMAIL_HANDLER_PORT)
+
+    stop = asyncio.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop.set)
+    loop.run_until_complete(stop.wait())
+
+    # drain: stop accepting connections, let the current sessions finish
+    LOG.d(
+        "Stop SMTP worker %s, %s sessions in progress",
+        os.getpid(),
+        len([s for s in sessions if s.transport]),
+    )
+    server.close()
+    loop.run_until_complete(server.wait_closed())
+    loop.run_until_complete(_wait_sessions(sessions, EMAIL_HANDLER_DRAIN_TIMEOUT))
+
+    for session in list(sessions):
+        if session.transport:
+            session.transport.close()
+
+    handler.close()
+    loop.close()
+
+
+async def _wait_sessions(sessions, timeout):
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    while any(s.transport for s in sessions) and loop.time() < deadline:
+        await asyncio.sleep(0.1)
+
+
+def spool_worker():
+    """process the spooled messages until SIGTERM, run in its own process"""
+    stop = threading.Event()
+    # finish the current message before stopping
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda signum, frame: stop.set())
+
+    app = new_app()
+    with app.app_context():
+        alias_directory.load()
+
+    handler = MailHandler(app)
+    spool = Spool(SPOOL_DIR)
+    LOG.d("Start spool worker %s", os.getpid())
+
+    while not stop.is_set():
+        if not spool.process_one(handler.process_message):
+            stop.wait(1)
+
+    handler.close()
+
+
+if __name__ == "__main__":
+    # the supervisor does not create any app: its processes are spawned and create their own
+    supervisor = Supervisor(stop_timeout=EMAIL_HANDLER_DRAIN_TIMEOUT + 5)
+    supervisor.add("smtp_worker", smtp_worker, nb=EMAIL_HANDLER_PROCESSES)
+
+    if SPOOL_DIR:
+        spool = Spool(SPOOL_DIR)
+        # messages being processed when the email handler stopped
+        spool.recover()
+        # the messages of a dead worker are processed again
+        supervisor.add(
+            "spool_worker", spool_worker, nb=SPOOL_WORKERS, on_exit=spool.recover
+        )
+
+    supervisor.run()
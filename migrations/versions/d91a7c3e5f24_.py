@@ -0,0 +1,33 @@
+"""empty message
+
+Revision ID: d91a7c3e5f24
+Revises: c4e8f2a6d1b0
+Create Date: 2026-10-18 19:58:40.127734
+
+"""
+import sqlalchemy_utils
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91a7c3e5f24'
+down_revision = 'c4e8f2a6d1b0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # trigram index for the alias search, only on Postgres
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index('ix_gen_email_email_trgm', 'gen_email', ['email'], unique=False, postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'})
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "postgresql":
+        return
+
+    op.drop_index('ix_gen_email_email_trgm', table_name='gen_email')
@@ -3,7 +3,7 @@ import ssl
 
 import arrow
 import sentry_sdk
-from flask import Flask, redirect, url_for, render_template, request, jsonify
+from flask import Flask, redirect, url_for, render_template, request, jsonify, g
 from flask_admin import Admin
 from flask_cors import cross_origin
 from flask_debugtoolbar import DebugToolbarExtension
@@ -101,7 +101,7 @@ def fake_data():
     db.session.commit()
 
     # Create a subscription for user
-    Subscription.create(
+    sub = Subscription.create(
         user_id=user.id,
         cancel_url="https://checkout.paddle.com/subscription/cancel?user=1234",
         update_url="https://checkout.paddle.com/subscription/update?user=1234",
@@ -110,6 +110,7 @@ def fake_data():
         next_bill_date=arrow.now().shift(days=10).date(),
         plan=PlanEnum.monthly,
     )
+    user.sync_plan(sub)
     db.session.commit()
 
     api_key = ApiKey.create(user_id=user.id, name="Chrome")
@@ -180,12 +181,13 @@ def set_index_page(app):
             and not request.path.startswith("/_debug_toolbar")
         ):
             LOG.debug(
-                "%s %s %s %s %s",
+                "%s %s %s %s %s, %s queries",
                 request.remote_addr,
                 request.method,
                 request.path,
                 request.args,
                 res.status_code,
+                g.get("nb_query", 0),
             )
 
         res.headers["X-Frame-Options"] = "deny"
@@ -303,7 +305,7 @@ def setup_paddle_callback(app: Flask):
 
             if not sub:
                 LOG.d("create a new sub")
-                Subscription.create(
+                sub = Subscription.create(
                     user_id=user.id,
                     cancel_url=request.form.get("cancel_url"),
                     update_url=request.form.get("update_url"),
@@ -325,6 +327,7 @@ def setup_paddle_callback(app: Flask):
                 ).date()
                 sub.plan = plan
 
+            user.sync_plan(sub)
             LOG.debug("User %s upgrades!", user)
 
             db.session.commit()
@@ -338,6 +341,7 @@ def setup_paddle_callback(app: Flask):
             sub.next_bill_date = arrow.get(
                 request.form.get("next_bill_date"), "YYYY-MM-DD"
             ).date()
+            sub.user.sync_plan(sub)
 
             db.session.commit()
 
@@ -347,6 +351,7 @@ def setup_paddle_callback(app: Flask):
 
             sub: Subscription = Subscription.get_by(subscription_id=subscription_id)
             sub.cancelled = True
+            sub.user.sync_plan(sub)
 
             db.session.commit()
 
@@ -0,0 +1,59 @@
+from flask import url_for
+
+from app.extensions import db
+from app.models import User, ApiKey, GenEmail, DeletedAlias
+
+
+def test_alias_bulk(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    other_user = User.create(email="b@b.c", password="password", name="Other")
+    api_key = ApiKey.create(user.id, "for test")
+    aliases = [GenEmail.create_new(user.id, prefix=f"alias{i}") for i in range(3)]
+    db.session.commit()
+    alias_ids = [ge.id for ge in aliases]
+    other_alias_id = GenEmail.get_by(user_id=other_user.id).id
+    headers = {"Authentication": api_key.code}
+
+    r = flask_client.post(
+        url_for("api.alias_bulk"),
+        json={"action": "disable", "alias_ids": alias_ids + [other_alias_id]},
+        headers=headers,
+    )
+    assert r.status_code == 200
+    # the alias of the other user is not changed
+    assert r.json["nb_alias"] == 3
+    assert GenEmail.filter_by(user_id=user.id, enabled=False).count() == 3
+    assert GenEmail.get(other_alias_id).enabled
+
+    r = flask_client.post(
+        url_for("api.alias_bulk"),
+        json={"action": "delete", "alias_ids": alias_ids[:2]},
+        headers=headers,
+    )
+    assert r.json["nb_alias"] == 2
+    assert GenEmail.query.filter(GenEmail.id.in_(alias_ids)).count() == 1
+    assert DeletedAlias.filter_by(user_id=user.id).count() == 2
+
+    r = flask_client.post(
+        url_for("api.alias_bulk"),
+        json={"action": "move", "alias_ids": alias_ids},
+        headers=headers,
+    )
+    assert r.status_code == 400
+
+    r = flask_client.post(
+        url_for("api.alias_bulk"),
+        json={"action": "enable", "alias_ids": "1"},
+        headers=headers,
+    )
+    assert r.status_code == 400
+
+    # true is not the alias 1
+    r = flask_client.post(
+        url_for("api.alias_bulk"),
+        json={"action": "enable", "alias_ids": [True]},
+        headers=headers,
+    )
+    assert r.status_code == 400
@@ -0,0 +1,59 @@
+import arrow
+from flask import url_for
+
+from app.extensions import db
+from app.models import User, ApiKey, GenEmail, DeletedAlias
+
+
+def test_get_aliases(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    api_key = ApiKey.create(user.id, "for test")
+    for i in range(2):
+        GenEmail.create_new(user.id, prefix=f"alias{i}")
+    db.session.commit()
+    headers = {"Authentication": api_key.code}
+
+    # pagination
+    r = flask_client.get(url_for("api.get_aliases", limit=2), headers=headers)
+    assert r.status_code == 200
+    assert len(r.json["aliases"]) == 2
+    next_after = r.json["next_after"]
+    cursor = r.json["cursor"]
+    etag = r.headers["ETag"]
+
+    r = flask_client.get(
+        url_for("api.get_aliases", limit=2, after=next_after), headers=headers
+    )
+    assert len(r.json["aliases"]) == 1
+    assert r.json["next_after"] is None
+
+    # nothing changed
+    r = flask_client.get(
+        url_for("api.get_aliases", limit=2),
+        headers={**headers, "If-None-Match": etag},
+    )
+    assert r.status_code == 304
+
+    # an alias is deleted, another one created more than the overlap after the cursor
+    deleted = GenEmail.get_by(user_id=user.id)
+    DeletedAlias.create(user_id=user.id, email=deleted.email)
+    GenEmail.delete(deleted.id)
+    for ge in GenEmail.filter_by(user_id=user.id):
+        ge.created_at = ge.updated_at = arrow.get(cursor).shift(minutes=-1)
+    new_alias = GenEmail.create_new(user.id, prefix="new")
+    db.session.commit()
+
+    r = flask_client.get(
+        url_for("api.get_aliases", limit=2),
+        headers={**headers, "If-None-Match": etag},
+    )
+    assert r.status_code == 200
+
+    r = flask_client.get(url_for("api.get_aliases", since=cursor), headers=headers)
+    assert [a["email"] for a in r.json["aliases"]] == [new_alias.email]
+    assert r.json["deleted"] == [deleted.email]
+
+    r = flask_client.get(url_for("api.get_aliases", since="wrong"), headers=headers)
+    assert r.status_code == 400
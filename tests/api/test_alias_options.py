@@ -1,7 +1,8 @@
 from flask import url_for
 
 from app.extensions import db
-from app.models import User, ApiKey, AliasUsedOn, GenEmail
+from app.alias_utils import record_alias_used_on
+from app.models import User, ApiKey, GenEmail
 
 
 def test_different_scenarios(flask_client):
@@ -41,7 +42,7 @@ def test_different_scenarios(flask_client):
     # <<< with recommendation >>>
     alias = GenEmail.create_new(user.id, prefix="test")
     db.session.commit()
-    AliasUsedOn.create(gen_email_id=alias.id, hostname="www.test.com")
+    record_alias_used_on(alias, "www.test.com")
     db.session.commit()
 
     r = flask_client.get(
@@ -50,3 +51,25 @@ def test_different_scenarios(flask_client):
     )
     assert r.json["recommendation"]["alias"] == alias.email
     assert r.json["recommendation"]["hostname"] == "www.test.com"
+
+    # the latest alias used on the hostname is recommended
+    other_alias = GenEmail.create_new(user.id, prefix="other")
+    db.session.commit()
+    record_alias_used_on(other_alias, "www.test.com")
+    db.session.commit()
+
+    r = flask_client.get(
+        url_for("api.options", hostname="www.test.com"),
+        headers={"Authentication": api_key.code},
+    )
+    assert r.json["recommendation"]["alias"] == other_alias.email
+
+    # the latest alias is deleted: the one used before is recommended
+    GenEmail.delete(other_alias.id)
+    db.session.commit()
+
+    r = flask_client.get(
+        url_for("api.options", hostname="www.test.com"),
+        headers={"Authentication": api_key.code},
+    )
+    assert r.json["recommendation"]["alias"] == alias.email
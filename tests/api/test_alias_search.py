@@ -0,0 +1,48 @@
+from flask import url_for
+
+from app.extensions import db
+from app.models import User, ApiKey, GenEmail
+
+
+def test_search_alias(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+
+    api_key = ApiKey.create(user.id, "for test")
+    GenEmail.create(user_id=user.id, email="shop_groupon@sl.local")
+    GenEmail.create(user_id=user.id, email="groupon@sl.local")
+    GenEmail.create(user_id=user.id, email="per_cent@sl.local")
+    db.session.commit()
+
+    # the alias starting with the query comes first
+    r = flask_client.get(
+        url_for("api.search_alias", query="Groupon"),
+        headers={"Authentication": api_key.code},
+    )
+    assert r.status_code == 200
+    assert [a["email"] for a in r.json["aliases"]] == [
+        "groupon@sl.local",
+        "shop_groupon@sl.local",
+    ]
+    assert r.json["aliases"][0]["nb_forward"] == 0
+
+    r = flask_client.get(
+        url_for("api.search_alias", query="groupon", limit=1),
+        headers={"Authentication": api_key.code},
+    )
+    assert len(r.json["aliases"]) == 1
+
+    # _ is not a wildcard
+    r = flask_client.get(
+        url_for("api.search_alias", query="r_c"),
+        headers={"Authentication": api_key.code},
+    )
+    assert [a["email"] for a in r.json["aliases"]] == ["per_cent@sl.local"]
+
+    r = flask_client.get(
+        url_for("api.search_alias", query=" "),
+        headers={"Authentication": api_key.code},
+    )
+    assert r.status_code == 400
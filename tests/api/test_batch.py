@@ -0,0 +1,91 @@
+from unittest.mock import patch
+
+from flask import url_for
+
+from app.config import EMAIL_DOMAIN
+from app.extensions import db
+from app.models import User, ApiKey, GenEmail
+
+
+def test_batch(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    api_key = ApiKey.create(user.id, "for test")
+    db.session.commit()
+
+    r = flask_client.post(
+        url_for("api.batch"),
+        json={
+            "operations": [
+                {"op": "alias_options", "hostname": "www.test.com"},
+                {
+                    "op": "new_custom_alias",
+                    "hostname": "www.test.com",
+                    "alias_prefix": "prefix",
+                    "alias_suffix": f".abcdef@{EMAIL_DOMAIN}",
+                },
+                {"op": "alias_options", "hostname": "www.test.com"},
+                {"op": "new_custom_alias", "alias_prefix": "prefix"},
+                {"op": "unknown"},
+            ]
+        },
+        headers={"Authentication": api_key.code},
+    )
+
+    assert r.status_code == 200
+    options, new_alias, options_after, missing_suffix, unknown = r.json["results"]
+
+    assert options["status"] == 200
+    assert "recommendation" not in options["body"]
+    assert options["body"]["custom"]["suggestion"] == "test"
+
+    assert new_alias["status"] == 201
+    assert new_alias["body"]["alias"] == f"prefix.abcdef@{EMAIL_DOMAIN}"
+    assert GenEmail.get_by(email=f"prefix.abcdef@{EMAIL_DOMAIN}")
+
+    # the operations see the changes of the previous ones
+    assert (
+        options_after["body"]["recommendation"]["alias"] == new_alias["body"]["alias"]
+    )
+
+    assert missing_suffix["status"] == 400
+    assert unknown["status"] == 400
+
+    r = flask_client.post(
+        url_for("api.batch"),
+        json={"operations": []},
+        headers={"Authentication": api_key.code},
+    )
+    assert r.status_code == 400
+
+
+def test_batch_operation_error(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    api_key = ApiKey.create(user.id, "for test")
+    db.session.commit()
+
+    with patch(
+        "app.api.views.batch.create_custom_alias", side_effect=ValueError("boom")
+    ):
+        r = flask_client.post(
+            url_for("api.batch"),
+            json={
+                "operations": [
+                    {
+                        "op": "new_custom_alias",
+                        "alias_prefix": "prefix",
+                        "alias_suffix": f".abcdef@{EMAIL_DOMAIN}",
+                    },
+                    {"op": "alias_options", "hostname": "www.test.com"},
+                ]
+            },
+            headers={"Authentication": api_key.code},
+        )
+
+    assert r.status_code == 200
+    failed, options = r.json["results"]
+    assert failed == {"status": 500, "body": {"error": "internal error"}}
+    assert options["status"] == 200
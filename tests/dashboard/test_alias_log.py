@@ -0,0 +1,85 @@
+import json
+
+from flask import url_for
+
+from app.dashboard.views.alias_log import get_alias_log
+from app.extensions import db
+from app.models import GenEmail, ForwardEmail, ForwardEmailLog
+from tests.utils import login
+
+
+def _create_logs(user, nb) -> GenEmail:
+    gen_email = GenEmail.get_by(user_id=user.id)
+    forward_email = ForwardEmail.create_new(
+        gen_email_id=gen_email.id,
+        website_email="web@site.com",
+        website_from="Web <web@site.com>",
+    )
+    db.session.commit()
+
+    for i in range(nb):
+        ForwardEmailLog.create(forward_id=forward_email.id, is_reply=i == 0)
+    db.session.commit()
+
+    return gen_email
+
+
+def test_get_alias_log_pagination(flask_client):
+    user = login(flask_client)
+    gen_email = _create_logs(user, 5)
+
+    logs, next_after = get_alias_log(gen_email, limit=3)
+    assert len(logs) == 3
+    assert next_after
+
+    older_logs, next_after = get_alias_log(gen_email, after=next_after, limit=3)
+    assert len(older_logs) == 2
+    assert next_after is None
+
+    whens = [log.when for log in logs + older_logs]
+    assert whens == sorted(whens, reverse=True)
+    # the reply is the first log created
+    assert older_logs[-1].is_reply
+
+    r = flask_client.get(url_for("dashboard.alias_log", alias=gen_email.email))
+    assert r.status_code == 200
+    assert b"Older" not in r.data
+
+
+def test_export(flask_client):
+    user = login(flask_client)
+    gen_email = _create_logs(user, 3)
+
+    r = flask_client.get(url_for("dashboard.alias_log_export", alias=gen_email.email))
+    assert r.status_code == 200
+    assert r.mimetype == "text/csv"
+    lines = r.data.decode().splitlines()
+    assert lines[0] == "date,type,website_email,website_from,alias"
+    assert len(lines) == 4
+    assert lines[-1].split(",")[1] == "reply"
+
+    r = flask_client.get(
+        url_for("dashboard.alias_log_export", alias=gen_email.email, format="json")
+    )
+    logs = json.loads(r.data)
+    assert [log["type"] for log in logs] == ["forward", "forward", "reply"]
+    assert logs[0]["website_email"] == "web@site.com"
+
+
+def test_export_csv_formula(flask_client):
+    user = login(flask_client)
+    gen_email = GenEmail.get_by(user_id=user.id)
+    ForwardEmail.create_new(
+        gen_email_id=gen_email.id,
+        website_email="web@site.com",
+        website_from='=HYPERLINK("http://evil.com") <web@site.com>',
+    )
+    db.session.commit()
+    forward_email = ForwardEmail.get_by(gen_email_id=gen_email.id)
+    ForwardEmailLog.create(forward_id=forward_email.id)
+    db.session.commit()
+
+    r = flask_client.get(url_for("dashboard.alias_log_export", alias=gen_email.email))
+    row = r.data.decode().splitlines()[1]
+    assert '"\'=HYPERLINK(""http://evil.com"") <web@site.com>"' in row
+    assert ",web@site.com," in row
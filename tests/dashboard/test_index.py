@@ -0,0 +1,132 @@
+from unittest.mock import patch
+
+from flask import url_for
+
+from app.config import HIGHLIGHT_GEN_EMAIL_ID
+
+from app.dashboard.views.index import get_alias_info, PAGE_LIMIT
+from app.extensions import db
+from app.models import GenEmail
+from tests.utils import login
+
+
+def test_get_alias_info_pagination(flask_client):
+    user = login(flask_client)
+    for i in range(4):
+        GenEmail.create_new(user.id, prefix=f"alias{i}")
+    db.session.commit()
+
+    # the first alias is created with the user
+    all_ids = [
+        ge.id
+        for ge in GenEmail.filter_by(user_id=user.id).order_by(
+            GenEmail.created_at.desc(), GenEmail.id.desc()
+        )
+    ]
+    assert len(all_ids) == 5
+
+    aliases, next_after = get_alias_info(user.id, limit=2)
+    assert [a.gen_email.id for a in aliases] == all_ids[:2]
+    assert next_after == all_ids[1]
+    assert aliases[0].show_intro_test_send_email
+
+    aliases, next_after = get_alias_info(user.id, after=next_after, limit=2)
+    assert [a.gen_email.id for a in aliases] == all_ids[2:4]
+
+    aliases, next_after = get_alias_info(user.id, after=next_after, limit=2)
+    assert [a.gen_email.id for a in aliases] == all_ids[4:]
+    assert next_after is None
+
+    # the highlighted alias comes first
+    aliases, _ = get_alias_info(user.id, highlight_gen_email_id=all_ids[3], limit=2)
+    assert [a.gen_email.id for a in aliases] == [all_ids[3]] + all_ids[:2]
+    assert aliases[0].highlight
+
+    # and is not shown again on the next pages
+    aliases, next_after = get_alias_info(
+        user.id, highlight_gen_email_id=all_ids[3], after=all_ids[1], limit=2
+    )
+    assert [a.gen_email.id for a in aliases] == [all_ids[2], all_ids[4]]
+    assert next_after is None
+
+    # search
+    aliases, next_after = get_alias_info(user.id, query="ALIAS2", limit=2)
+    assert len(aliases) == 1
+    assert aliases[0].gen_email.email.startswith("alias2.")
+    assert next_after is None
+
+
+def test_index_page(flask_client):
+    login(flask_client)
+
+    r = flask_client.get(url_for("dashboard.index"))
+    assert r.status_code == 200
+    assert b"Next page" not in r.data
+
+
+def test_bulk_action(flask_client):
+    user = login(flask_client)
+    alias = GenEmail.create_new(user.id, prefix="alias")
+    db.session.commit()
+    alias_ids = [ge.id for ge in GenEmail.filter_by(user_id=user.id)]
+
+    r = flask_client.post(
+        url_for("dashboard.index"),
+        data={
+            "form-name": "bulk",
+            "bulk-action": "disable",
+            "gen-email-ids": alias_ids,
+        },
+        follow_redirects=True,
+    )
+    assert r.status_code == 200
+    assert b"2 aliases have been disabled" in r.data
+    assert not GenEmail.get(alias.id).enabled
+
+
+def test_index_page_pinned(flask_client):
+    user = login(flask_client)
+    # 2 pages besides the pinned alias
+    for i in range(PAGE_LIMIT + 1):
+        GenEmail.create_new(user.id, prefix=f"alias{i}")
+    db.session.commit()
+    oldest = GenEmail.filter_by(user_id=user.id).order_by(GenEmail.id).first()
+
+    with flask_client.session_transaction() as session:
+        session[HIGHLIGHT_GEN_EMAIL_ID] = oldest.id
+
+    # the oldest alias is pinned on top of the first page
+    r = flask_client.get(url_for("dashboard.index"))
+    assert r.status_code == 200
+    assert oldest.email.encode() in r.data
+    assert f"pinned={oldest.id}".encode() in r.data
+
+    # and not on the second page, where it would be
+    next_after = (
+        GenEmail.filter_by(user_id=user.id)
+        .order_by(GenEmail.created_at.desc(), GenEmail.id.desc())[PAGE_LIMIT - 1]
+        .id
+    )
+    r = flask_client.get(url_for("dashboard.index", after=next_after, pinned=oldest.id))
+    assert r.status_code == 200
+    assert oldest.email.encode() not in r.data
+
+
+def test_bulk_action_too_many(flask_client):
+    user = login(flask_client)
+    alias = GenEmail.get_by(user_id=user.id)
+
+    with patch("app.alias_utils.MAX_BULK_SIZE", 1):
+        r = flask_client.post(
+            url_for("dashboard.index"),
+            data={
+                "form-name": "bulk",
+                "bulk-action": "disable",
+                "gen-email-ids": [alias.id, alias.id + 1],
+            },
+            follow_redirects=True,
+        )
+
+    assert r.status_code == 200
+    assert b"Please select at most 1 aliases" in r.data
+    assert GenEmail.get(alias.id).enabled
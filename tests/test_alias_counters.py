@@ -0,0 +1,114 @@
+import arrow
+
+from app import alias_counters
+from app.extensions import db
+from app.models import User, GenEmail, ForwardEmail, ForwardEmailLog
+
+
+def test_backfill_and_check(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+    alias = GenEmail.get_by(user_id=user.id)
+    other_alias = GenEmail.create_new(user.id, prefix="other")
+    db.session.commit()
+
+    forward_email = ForwardEmail.create_new(
+        gen_email_id=alias.id,
+        website_email="web@site.com",
+        website_from="Web <web@site.com>",
+    )
+    db.session.commit()
+
+    ForwardEmailLog.create(forward_id=forward_email.id)
+    ForwardEmailLog.create(forward_id=forward_email.id)
+    ForwardEmailLog.create(forward_id=forward_email.id, blocked=True)
+    ForwardEmailLog.create(forward_id=forward_email.id, is_reply=True)
+    db.session.commit()
+
+    # logs written without the counters
+    assert alias_counters.check() == [alias.id]
+
+    alias_counters.backfill()
+    db.session.refresh(alias)
+    assert (alias.nb_forward, alias.nb_blocked, alias.nb_reply) == (2, 1, 1)
+    assert alias.last_activity_at
+    assert alias_counters.check() == []
+
+    # counters out of sync are fixed
+    other_alias.nb_forward = 3
+    db.session.commit()
+    assert alias_counters.check(fix=True) == [other_alias.id]
+    assert alias_counters.check() == []
+
+    # the counters follow the deletion of a contact and its logs
+    alias_counters.decrement_contact(forward_email)
+    ForwardEmail.delete(forward_email.id)
+    db.session.commit()
+    assert alias_counters.check() == []
+
+
+def test_check_concurrent_increment(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+    alias = GenEmail.get_by(user_id=user.id)
+    forward_email = ForwardEmail.create_new(
+        gen_email_id=alias.id,
+        website_email="web@site.com",
+        website_from="Web <web@site.com>",
+    )
+    ForwardEmailLog.create(forward_id=forward_email.id)
+    db.session.commit()
+
+    deltas = alias_counters._deltas()
+
+    # the email handler writes a log between the check and the fix
+    log = ForwardEmailLog.create(forward_id=forward_email.id)
+    db.session.flush()
+    alias_counters.increment(
+        [
+            {
+                "gen_email_id": alias.id,
+                "is_reply": False,
+                "blocked": False,
+                "created_at": log.created_at,
+            }
+        ]
+    )
+    db.session.commit()
+
+    alias_counters._add(deltas)
+    db.session.commit()
+
+    db.session.refresh(alias)
+    assert alias.nb_forward == 2
+    assert alias_counters.check() == []
+
+
+def test_check_since(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+    alias = GenEmail.get_by(user_id=user.id)
+    old_alias = GenEmail.create_new(user.id, prefix="old")
+    db.session.commit()
+
+    for gen_email, created_at in ((alias, arrow.now()), (old_alias, arrow.get(0))):
+        forward_email = ForwardEmail.create_new(
+            gen_email_id=gen_email.id,
+            website_email="web@site.com",
+            website_from="Web <web@site.com>",
+        )
+        db.session.flush()
+        ForwardEmailLog.create(forward_id=forward_email.id, created_at=created_at)
+    db.session.commit()
+
+    # only the aliases with recent logs are checked
+    since = arrow.now().shift(days=-2)
+    assert alias_counters.check(fix=True, since=since) == [alias.id]
+    assert alias_counters.check(since=since) == []
+    assert alias_counters.check() == [old_alias.id]
@@ -0,0 +1,53 @@
+from app.alias_directory import AliasDirectory
+from app.extensions import db
+from app.models import User, GenEmail, DeletedAlias
+
+
+def test_get(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+    alias = GenEmail.get_by(user_id=user.id)
+
+    directory = AliasDirectory(refresh_interval=0)
+    directory.load()
+
+    entry = directory.get(alias.email)
+    assert entry.gen_email_id == alias.id
+    assert entry.user_email == "a@b.c"
+    assert entry.enabled
+
+    assert directory.get("not-exist@sl.local") is None
+
+
+def test_refresh(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+
+    directory = AliasDirectory(refresh_interval=0)
+    directory.load()
+
+    # alias created after the directory is loaded
+    alias = GenEmail.create_new(user.id, prefix="test")
+    db.session.commit()
+    assert directory.get(alias.email).enabled
+
+    # alias disabled
+    alias.enabled = False
+    db.session.commit()
+    assert not directory.get(alias.email).enabled
+
+    # user changes their email
+    user.email = "new@b.c"
+    db.session.commit()
+    assert directory.get(alias.email).user_email == "new@b.c"
+
+    # alias deleted
+    email = alias.email
+    GenEmail.delete(alias.id)
+    DeletedAlias.create(user_id=user.id, email=email)
+    db.session.commit()
+    assert directory.get(email) is None
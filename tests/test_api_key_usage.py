@@ -0,0 +1,84 @@
+import time
+
+from flask import url_for
+
+from app.api_key_usage import ApiKeyUsage, api_key_usage
+from app.extensions import db
+from app.models import User, ApiKey
+
+
+def test_api_key_usage(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    api_key = ApiKey.create(user.id, "for test")
+    db.session.commit()
+    api_key_id, code = api_key.id, api_key.code
+
+    usage = ApiKeyUsage(flush_interval=3600)
+    assert usage.resolve(code) == (api_key_id, user.id)
+    assert usage.resolve("wrong code") is None
+
+    usage.add(api_key_id)
+    usage.add(api_key_id)
+    # not written yet
+    db.session.refresh(api_key)
+    assert api_key.times == 0
+
+    usage.flush()
+    db.session.refresh(api_key)
+    assert api_key.times == 2
+    assert api_key.last_used
+
+    # the api key is cached until it's forgotten
+    ApiKey.delete(api_key_id)
+    db.session.commit()
+    assert usage.resolve(code) == (api_key_id, user.id)
+
+    usage.forget(code)
+    assert usage.resolve(code) is None
+
+
+def test_api_key_usage_flush_thread(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    api_key = ApiKey.create(user.id, "for test")
+    db.session.commit()
+
+    usage = ApiKeyUsage(flush_interval=0.1)
+    usage.add(api_key.id)
+
+    for _ in range(50):
+        time.sleep(0.1)
+        db.session.refresh(api_key)
+        if api_key.times:
+            break
+
+    assert api_key.times == 1
+
+
+def test_deleted_user(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    api_key = ApiKey.create(user.id, "for test")
+    db.session.commit()
+    code = api_key.code
+
+    r = flask_client.get(
+        url_for("api.options", hostname="www.test.com"),
+        headers={"Authentication": code},
+    )
+    assert r.status_code == 200
+
+    # the api key is cached, not its user
+    User.query.filter(User.id == user.id).delete()
+    db.session.commit()
+
+    r = flask_client.get(
+        url_for("api.options", hostname="www.test.com"),
+        headers={"Authentication": code},
+    )
+    assert r.status_code == 401
+    assert code not in api_key_usage._keys
@@ -0,0 +1,71 @@
+import base64
+import hashlib
+import re
+
+import dkim
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from dkim.canonicalization import Simple
+
+from app.config import DKIM_PRIVATE_KEY
+from app.dkim_utils import DkimSigner, compute_body_hash, dkim_signer
+
+
+def _dns_txt(name, timeout=5):
+    """DKIM record of the test key"""
+    key = serialization.load_pem_private_key(
+        DKIM_PRIVATE_KEY.encode(), password=None, backend=default_backend()
+    )
+    pub = key.public_key().public_bytes(
+        serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+    return b"v=DKIM1; k=rsa; p=" + base64.b64encode(pub)
+
+
+MSG = (
+    b"From: alias@sl.local\r\n"
+    b"To: website@example.com\r\n"
+    b"Subject: hello\r\n"
+    b"\r\n"
+    b"line 1\r\n"
+    b"line 2\r\n"
+)
+
+
+def test_sign():
+    msg_raw = dkim_signer.sign(MSG, "sl.local") + MSG
+    assert dkim.verify(msg_raw, dnsfunc=_dns_txt)
+
+    # the body is signed
+    assert not dkim.verify(msg_raw + b"added\r\n", dnsfunc=_dns_txt)
+
+
+def test_sign_custom_domain():
+    signer = DkimSigner()
+    signer.set_default_key(b"dkim", DKIM_PRIVATE_KEY)
+    assert not signer.can_sign("my-domain.com")
+
+    signer.register("my-domain.com")
+    assert signer.can_sign("my-domain.com")
+
+    sig = signer.sign(MSG, "my-domain.com")
+    assert b"d=my-domain.com" in sig
+    assert dkim.verify(sig + MSG, dnsfunc=_dns_txt)
+
+
+def test_compute_body_hash():
+    for body in [
+        b"",
+        b"\r\n",
+        b"\r\n\r\n",
+        b"line\r\n",
+        b"line",
+        b"line\r\n\r\n\r\n",
+        b"line\n\nline\n\n",
+        b"a" * 200_000 + b"\r\n" + b"b\r" * 100_000 + b"\r\n" * 100_000,
+        (b"x" * 1000 + b"\r\n") * 500,
+    ]:
+        expected = hashlib.sha256(
+            Simple.canonicalize_body(b"\r\n".join(re.split(rb"\r?\n", body)))
+        ).digest()
+        assert compute_body_hash(memoryview(body)) == expected
@@ -0,0 +1,274 @@
+import asyncio
+import email
+import threading
+
+import dkim
+from aiosmtpd.smtp import Envelope
+from flask import current_app
+
+import email_handler
+from app.alias_directory import alias_directory
+from app.config import EMAIL_DOMAIN
+from app.email_utils import generate_reply_email
+from app.extensions import db
+from app.models import User, GenEmail, ForwardEmail
+from app.raw_message import RawMessage
+from email_handler import MailHandler
+from tests.test_dkim_utils import _dns_txt
+
+# the body must be relayed as is: 8bit, trailing spaces, a line that looks like a header
+_BODY = "héllo  \r\nFrom: not a header\r\n\r\n-- \r\nbye\r\n".encode()
+
+
+def _envelope(rcpt_to="alias@sl.local") -> Envelope:
+    envelope = Envelope()
+    envelope.mail_from = "website@example.com"
+    envelope.rcpt_tos = [rcpt_to]
+    envelope.content = b"From: website@example.com\r\nSubject: hello\r\n\r\nbody\r\n"
+    return envelope
+
+
+class _SmtpPool:
+    """record the emails sent instead of relaying them to Postfix"""
+
+    def __init__(self):
+        self.sent = []
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        self.sent.append((from_addr, to_addrs, msg))
+
+
+def _split(msg_raw: bytes) -> (email.message.Message, bytes):
+    """the headers and the body of a message"""
+    return email.message_from_bytes(msg_raw), msg_raw.split(b"\r\n\r\n", 1)[1]
+
+
+def _rcpt(handler, address) -> (str, Envelope):
+    envelope = Envelope()
+    status = asyncio.run(handler.handle_RCPT(None, None, envelope, address, []))
+    return status, envelope
+
+
+def test_handle_rcpt(flask_client, monkeypatch):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+    alias = GenEmail.get_by(user_id=user.id)
+    disabled_alias = GenEmail.create_new(user.id, prefix="disabled")
+    disabled_alias.enabled = False
+    forward_email = ForwardEmail.create_new(
+        gen_email_id=alias.id,
+        website_email="web@site.com",
+        website_from="Web <web@site.com>",
+    )
+    db.session.commit()
+
+    alias_directory.load()
+    handler = MailHandler(current_app._get_current_object())
+
+    status, envelope = _rcpt(handler, alias.email)
+    assert status == "250 OK"
+    assert envelope.rcpt_tos == [alias.email]
+
+    status, envelope = _rcpt(handler, f"unknown@{EMAIL_DOMAIN}")
+    assert status == "550 5.1.1 Unknown alias"
+    assert envelope.rcpt_tos == []
+
+    # a disabled alias is only refused if REJECT_DISABLED_ALIAS_AT_RCPT
+    monkeypatch.setattr(email_handler, "REJECT_DISABLED_ALIAS_AT_RCPT", True)
+    status, envelope = _rcpt(handler, disabled_alias.email)
+    assert status == "550 5.7.1 Alias is disabled"
+    assert envelope.rcpt_tos == []
+
+    monkeypatch.setattr(email_handler, "REJECT_DISABLED_ALIAS_AT_RCPT", False)
+    status, _ = _rcpt(handler, disabled_alias.email)
+    assert status == "250 OK"
+
+    # reverse-alias
+    status, envelope = _rcpt(handler, forward_email.reply_email)
+    assert status == "250 OK"
+    assert envelope.rcpt_tos == [forward_email.reply_email]
+
+    # forged: the signature of another contact
+    forged = forward_email.reply_email.replace(
+        f"ra+{forward_email.id}.", f"ra+{forward_email.id + 1}."
+    )
+    status, _ = _rcpt(handler, forged)
+    assert status == "550 5.1.1 Unknown reverse-alias"
+
+    # signed but its contact doesn't exist
+    status, _ = _rcpt(handler, generate_reply_email(forward_email.id + 1))
+    assert status == "550 5.1.1 Unknown reverse-alias"
+
+    # old format
+    status, _ = _rcpt(handler, f"reply+unknown@{EMAIL_DOMAIN}")
+    assert status == "550 5.1.1 Unknown reverse-alias"
+
+    handler.close()
+
+
+def test_handle_forward_deleted_alias(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+    alias = GenEmail.get_by(user_id=user.id)
+    email = alias.email
+
+    alias_directory.load()
+    handler = MailHandler(current_app._get_current_object())
+
+    # deleted with its user: no DeletedAlias, the directory still has it
+    GenEmail.delete(alias.id)
+    User.delete(user.id)
+    db.session.commit()
+
+    envelope = _envelope(email)
+    with current_app.app_context():
+        status = handler.handle_forward(envelope, RawMessage(envelope.content))
+
+    assert status == "550 5.1.1 Unknown alias"
+    assert ForwardEmail.query.count() == 0
+    assert alias_directory.get(email) is None
+
+    handler.close()
+
+
+def test_handle_data_queue_full(flask_client, monkeypatch):
+    monkeypatch.setattr(email_handler, "EMAIL_HANDLER_WORKERS", 1)
+    monkeypatch.setattr(email_handler, "EMAIL_HANDLER_MAX_QUEUE", 1)
+    handler = MailHandler(current_app._get_current_object())
+
+    # the messages are processed until released
+    release = threading.Event()
+
+    def process_message(envelope):
+        release.wait(5)
+        return "250 Message accepted for delivery"
+
+    monkeypatch.setattr(handler, "process_message", process_message)
+
+    async def run():
+        # a message being processed, another one waiting for the worker
+        pending = [
+            asyncio.ensure_future(handler.handle_DATA(None, None, _envelope()))
+            for _ in range(2)
+        ]
+        await asyncio.sleep(0.1)
+        assert handler.nb_pending == 2
+
+        # the queue is full
+        status = await handler.handle_DATA(None, None, _envelope())
+
+        # the recipients are still checked
+        rcpt_status = await asyncio.wait_for(
+            handler.handle_RCPT(None, None, Envelope(), "unknown@sl.local", []), 1
+        )
+        assert rcpt_status.startswith("550")
+
+        release.set()
+        return status, await asyncio.gather(*pending)
+
+    status, accepted = asyncio.run(run())
+    handler.close()
+
+    assert status.startswith("451")
+    assert accepted == ["250 Message accepted for delivery"] * 2
+    assert handler.nb_pending == 0
+
+
+def test_handle_forward(flask_client, monkeypatch):
+    smtp_pool = _SmtpPool()
+    monkeypatch.setattr(email_handler, "smtp_pool", smtp_pool)
+
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+    alias = GenEmail.get_by(user_id=user.id)
+    alias_id, alias_email = alias.id, alias.email
+
+    alias_directory.load()
+    handler = MailHandler(current_app._get_current_object())
+
+    envelope = _envelope(alias_email)
+    envelope.content = (
+        b"From: Web <web@site.com>\r\n"
+        b"To: " + alias_email.encode() + b"\r\n"
+        b"Reply-To: web@site.com\r\n"
+        b"DKIM-Signature: v=1; d=site.com; b=abc\r\n"
+        b"Subject: hello\r\n"
+        b"\r\n" + _BODY
+    )
+    with current_app.app_context():
+        status = handler.handle_forward(envelope, RawMessage(envelope.content))
+    handler.close()
+
+    assert status == "250 Message accepted for delivery"
+    forward_email = ForwardEmail.get_by(gen_email_id=alias_id)
+
+    [(from_addr, to_addr, msg_raw)] = smtp_pool.sent
+    assert (from_addr, to_addr) == (forward_email.reply_email, "a@b.c")
+
+    headers, body = _split(msg_raw)
+    assert headers["From"] == f"Web - web at site.com <{forward_email.reply_email}>"
+    assert headers["To"] == alias_email
+    assert headers["Reply-To"] is None
+    assert headers["X-SimpleLogin-Type"] == "Forward"
+    # only the signature of EMAIL_DOMAIN is left
+    [signature] = headers.get_all("DKIM-Signature")
+    assert f"d={EMAIL_DOMAIN};" in signature
+    assert body == _BODY
+
+    assert dkim.verify(msg_raw, dnsfunc=_dns_txt)
+
+
+def test_handle_reply(flask_client, monkeypatch):
+    smtp_pool = _SmtpPool()
+    monkeypatch.setattr(email_handler, "smtp_pool", smtp_pool)
+
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+    alias = GenEmail.get_by(user_id=user.id)
+    alias_email = alias.email
+    forward_email = ForwardEmail.create_new(
+        gen_email_id=alias.id,
+        website_email="web@site.com",
+        website_from="Web <web@site.com>",
+    )
+    db.session.commit()
+    reply_email = forward_email.reply_email
+
+    handler = MailHandler(current_app._get_current_object())
+
+    envelope = _envelope(reply_email)
+    envelope.mail_from = "a@b.c"
+    envelope.content = (
+        b"From: Test User <a@b.c>\r\n"
+        b"To: " + reply_email.encode() + b"\r\n"
+        b"DKIM-Signature: v=1; d=b.c; b=abc\r\n"
+        b"Subject: re: hello\r\n"
+        b"\r\n" + _BODY
+    )
+    with current_app.app_context():
+        status = handler.handle_reply(envelope, RawMessage(envelope.content))
+    handler.close()
+
+    assert status == "250 Message accepted for delivery"
+
+    [(from_addr, to_addr, msg_raw)] = smtp_pool.sent
+    assert (from_addr, to_addr) == (alias_email, "web@site.com")
+
+    headers, body = _split(msg_raw)
+    # the user address doesn't appear
+    assert headers["From"] == alias_email
+    assert headers["To"] == "web@site.com"
+    assert b"a@b.c" not in msg_raw
+    [signature] = headers.get_all("DKIM-Signature")
+    assert f"d={EMAIL_DOMAIN};" in signature
+    assert body == _BODY
+
+    assert dkim.verify(msg_raw, dnsfunc=_dns_txt)
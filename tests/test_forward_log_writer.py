@@ -0,0 +1,151 @@
+import json
+import os
+
+from flask import current_app
+
+from app.extensions import db
+from app.forward_log_writer import ForwardLogWriter, _MAX_FLUSH_FAILURES
+from app.models import User, GenEmail, ForwardEmail, ForwardEmailLog
+
+
+def _create_forward_email() -> ForwardEmail:
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+    alias = GenEmail.get_by(user_id=user.id)
+
+    forward_email = ForwardEmail.create_new(
+        gen_email_id=alias.id,
+        website_email="web@site.com",
+        website_from="Web <web@site.com>",
+    )
+    db.session.commit()
+    return forward_email
+
+
+def test_flush(flask_client):
+    forward_email = _create_forward_email()
+    forward_id, gen_email_id = forward_email.id, forward_email.gen_email_id
+    writer = ForwardLogWriter(current_app._get_current_object(), batch_size=2)
+
+    writer.add(forward_id, gen_email_id)
+    writer.add(forward_id, gen_email_id, is_reply=True)
+    writer.add(forward_id, gen_email_id, blocked=True)
+    assert ForwardEmailLog.query.count() == 0
+
+    writer.flush()
+    assert ForwardEmailLog.query.count() == 3
+    assert ForwardEmailLog.filter_by(forward_id=forward_id, is_reply=True).count() == 1
+    assert ForwardEmailLog.filter_by(forward_id=forward_id, blocked=True).count() == 1
+
+    # the alias counters are updated with the logs
+    alias = GenEmail.get(gen_email_id)
+    assert (alias.nb_forward, alias.nb_blocked, alias.nb_reply) == (1, 1, 1)
+    assert alias.last_activity_at
+
+    # nothing left to write
+    writer.close()
+    assert ForwardEmailLog.query.count() == 3
+
+
+def test_recover_wal(flask_client, tmp_path):
+    forward_email = _create_forward_email()
+    forward_id, gen_email_id = forward_email.id, forward_email.gen_email_id
+
+    # wal file left by a process that died before writing its logs
+    # above the maximum pid on Linux
+    dead_pid = 4194305
+    with open(tmp_path / f"{dead_pid}.1.log", "w") as f:
+        f.write(
+            json.dumps(
+                {
+                    "created_at": "2020-01-01T00:00:00+00:00",
+                    "forward_id": forward_id,
+                    "gen_email_id": gen_email_id,
+                    "is_reply": False,
+                    "blocked": False,
+                }
+            )
+            + "\n"
+        )
+        # partially written line
+        f.write('{"created_at": "2020-01')
+
+    writer = ForwardLogWriter(current_app._get_current_object(), wal_dir=str(tmp_path))
+    writer.add(forward_id, gen_email_id, is_reply=True)
+    writer.close()
+
+    assert ForwardEmailLog.query.count() == 2
+    assert ForwardEmailLog.get_by(is_reply=False).created_at.year == 2020
+
+    # all logs are written: no wal file left
+    assert os.listdir(tmp_path) == []
+
+
+def test_flush_keeps_failing(flask_client, tmp_path, monkeypatch):
+    forward_email = _create_forward_email()
+    forward_id, gen_email_id = forward_email.id, forward_email.gen_email_id
+    writer = ForwardLogWriter(current_app._get_current_object(), wal_dir=str(tmp_path))
+
+    # a log that can't be inserted makes its batch fail
+    execute = writer._execute
+
+    def _execute(rows):
+        if any(row["blocked"] for row in rows):
+            raise ValueError("cannot insert")
+        execute(rows)
+
+    monkeypatch.setattr(writer, "_execute", _execute)
+
+    writer.add(forward_id, gen_email_id)
+    writer.add(forward_id, gen_email_id, blocked=True)
+    writer.add(forward_id, gen_email_id, is_reply=True)
+
+    for _ in range(_MAX_FLUSH_FAILURES - 1):
+        writer.flush()
+        assert ForwardEmailLog.query.count() == 0
+
+    # then the logs are written one by one
+    writer.flush()
+    assert ForwardEmailLog.query.count() == 2
+    assert not ForwardEmailLog.get_by(blocked=True)
+
+    # and the failing one is dead-lettered
+    with open(tmp_path / "failed" / f"{os.getpid()}.log") as f:
+        (line,) = f.readlines()
+    assert json.loads(line)["blocked"]
+
+    writer.close()
+    assert os.listdir(tmp_path) == ["failed"]
+
+    # the failed logs are not recovered
+    ForwardLogWriter(current_app._get_current_object(), wal_dir=str(tmp_path)).close()
+    assert ForwardEmailLog.query.count() == 2
+
+
+def test_recover_wal_same_pid(flask_client, tmp_path):
+    forward_email = _create_forward_email()
+    forward_id, gen_email_id = forward_email.id, forward_email.gen_email_id
+
+    # left by a dead process that had the pid of this one, e.g. before a container restart
+    with open(tmp_path / f"{os.getpid()}.0123456789ab.1.log", "w") as f:
+        f.write(
+            json.dumps(
+                {
+                    "created_at": "2020-01-01T00:00:00+00:00",
+                    "forward_id": forward_id,
+                    "gen_email_id": gen_email_id,
+                    "is_reply": False,
+                    "blocked": False,
+                }
+            )
+            + "\n"
+        )
+
+    writer = ForwardLogWriter(current_app._get_current_object(), wal_dir=str(tmp_path))
+    writer.add(forward_id, gen_email_id, is_reply=True)
+    writer.close()
+
+    assert ForwardEmailLog.query.count() == 2
+    assert os.listdir(tmp_path) == []
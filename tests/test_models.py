@@ -2,7 +2,7 @@ import arrow
 
 from app.config import EMAIL_DOMAIN, MAX_NB_EMAIL_FREE_PLAN
 from app.extensions import db
-from app.models import generate_email, User, GenEmail
+from app.models import generate_email, User, GenEmail, Subscription, PlanEnum
 
 
 def test_generate_email(flask_client):
@@ -38,3 +38,33 @@ def test_suggested_emails_for_user_who_cannot_create_new_email(flask_client):
     # all other emails are generated emails
     for email in other_emails:
         assert GenEmail.get_by(email=email)
+
+
+def test_sync_plan(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    sub = Subscription.create(
+        user_id=user.id,
+        cancel_url="https://checkout.paddle.com/subscription/cancel?user=1234",
+        update_url="https://checkout.paddle.com/subscription/update?user=1234",
+        subscription_id="123",
+        event_time=arrow.now(),
+        next_bill_date=arrow.now().shift(days=-1).date(),
+        plan=PlanEnum.yearly,
+    )
+    db.session.commit()
+    assert not user.is_premium()
+
+    user.sync_plan(sub)
+    assert user.is_premium()
+    assert user.plan_name() == "Yearly ($29.99/year)"
+
+    # premium until the next billing date + 1
+    sub.cancelled = True
+    user.sync_plan(sub)
+    assert user.is_premium()
+
+    sub.next_bill_date = arrow.now().shift(days=-2).date()
+    user.sync_plan(sub)
+    assert not user.is_premium()
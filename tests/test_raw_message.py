@@ -0,0 +1,61 @@
+from app.raw_message import RawMessage
+
+BODY = b"\r\n--boundary\r\nbody that must not be touched\xff\r\n"
+
+
+def test_get():
+    msg = RawMessage(
+        b"From: Web Site <web@site.com>\r\n"
+        b"Subject: =?utf-8?q?h=C3=A9llo?=\r\n"
+        b"To: first@a.com,\r\n"
+        b" second@a.com\r\n" + BODY
+    )
+
+    assert msg["From"] == "Web Site <web@site.com>"
+    assert msg.get("subject") == "héllo"
+    assert msg["To"] == "first@a.com, second@a.com"
+    assert msg["Reply-To"] is None
+
+
+def test_set_and_delete():
+    msg = RawMessage(
+        b"From: Web Site <web@site.com>\r\n"
+        b"DKIM-Signature: v=1;\r\n"
+        b"\tb=abc\r\n"
+        b"Subject: hello\r\n"
+        b"DKIM-Signature: v=1; b=def\r\n" + BODY
+    )
+
+    msg.set("From", "Jérôme - web at site.com <ra+1.abc@sl.local>")
+    msg.set("X-SimpleLogin-Type", "Forward")
+    msg.delete("DKIM-Signature")
+
+    raw = msg.as_bytes()
+    header = raw[: raw.find(b"\r\n\r\n")]
+
+    # the body is passed through untouched
+    assert raw.endswith(BODY)
+
+    # non-ascii value is encoded
+    assert b"=?utf-8?q?J=C3=A9r=C3=B4me?=" in header
+    assert msg["From"] == '"Jérôme - web at site.com" <ra+1.abc@sl.local>'
+
+    assert b"DKIM-Signature" not in header
+    assert header.endswith(b"X-SimpleLogin-Type: Forward")
+    assert b"Subject: hello\r\n" in header
+
+
+def test_lf_line_endings():
+    msg = RawMessage(b"From: web@site.com\nSubject: hello\n\nbody\n")
+    msg.set("To", "alias@sl.local")
+
+    assert msg.as_bytes() == (
+        b"From: web@site.com\nSubject: hello\nTo: alias@sl.local\n\nbody\n"
+    )
+
+
+def test_no_body():
+    msg = RawMessage(b"From: web@site.com\r\n")
+    msg.set("From", "alias@sl.local")
+
+    assert msg.as_bytes() == b"From: alias@sl.local\r\n"
@@ -0,0 +1,51 @@
+import arrow
+from flask import current_app, g
+
+from app.extensions import db
+from app.models import User, Subscription, PlanEnum
+
+
+def test_memoize(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+    user_id = user.id
+
+    with current_app.test_request_context():
+        user = User.get(user_id)
+
+        nb_query = g.get("nb_query", 0)
+        assert not user.is_premium()
+        assert user.can_create_new_alias()
+        assert user.plan_name() == "Free Plan"
+        # a query for the number of aliases
+        assert g.nb_query - nb_query == 1
+
+        for _ in range(10):
+            user.is_premium()
+            user.should_upgrade()
+            user.can_create_new_alias()
+            user.plan_name()
+            user.get_subscription()
+        assert g.nb_query - nb_query == 2
+
+        # writing drops the memoized results
+        sub = Subscription.create(
+            user_id=user.id,
+            cancel_url="https://checkout.paddle.com/subscription/cancel?user=1234",
+            update_url="https://checkout.paddle.com/subscription/update?user=1234",
+            subscription_id="123",
+            event_time=arrow.now(),
+            next_bill_date=arrow.now().shift(days=10).date(),
+            plan=PlanEnum.monthly,
+        )
+        db.session.flush()
+        assert user.get_subscription()
+
+        user.sync_plan(sub)
+        assert user.is_premium()
+        assert user.plan_name() == "Monthly ($2.99/month)"
+
+    # nothing memoized outside a request
+    assert user.get_subscription()
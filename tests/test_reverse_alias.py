@@ -0,0 +1,49 @@
+from app.config import EMAIL_DOMAIN
+from app.email_utils import generate_reply_email, get_forward_email_id
+from app.extensions import db
+from app.models import User, GenEmail, ForwardEmail
+
+
+def test_generate_reply_email():
+    reply_email = generate_reply_email(123)
+    assert reply_email.startswith("ra+123.")
+    assert reply_email.endswith("@" + EMAIL_DOMAIN)
+
+    assert get_forward_email_id(reply_email) == 123
+    assert get_forward_email_id(reply_email.upper()) == 123
+
+    # wrong signature
+    assert get_forward_email_id(reply_email.replace("ra+123.", "ra+124.")) is None
+    # old format
+    assert get_forward_email_id(f"ra+abcdef@{EMAIL_DOMAIN}") is None
+
+
+def test_get_by_reply_email(flask_client):
+    user = User.create(
+        email="a@b.c", password="password", name="Test User", activated=True
+    )
+    db.session.commit()
+    alias = GenEmail.get_by(user_id=user.id)
+
+    forward_email = ForwardEmail.create_new(
+        gen_email_id=alias.id,
+        website_email="web@site.com",
+        website_from="Web <web@site.com>",
+    )
+    db.session.commit()
+
+    assert forward_email.reply_email == generate_reply_email(forward_email.id)
+    assert ForwardEmail.get_by_reply_email(forward_email.reply_email) == forward_email
+    assert ForwardEmail.get_by_reply_email(f"ra+9999.abcdef@{EMAIL_DOMAIN}") is None
+
+    # reverse-alias created before generate_reply_email()
+    old_forward_email = ForwardEmail.create(
+        gen_email_id=alias.id,
+        website_email="old@site.com",
+        reply_email=f"reply+abcdefgh@{EMAIL_DOMAIN}",
+    )
+    db.session.commit()
+    assert (
+        ForwardEmail.get_by_reply_email(f"reply+abcdefgh@{EMAIL_DOMAIN}")
+        == old_forward_email
+    )
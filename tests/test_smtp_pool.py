@@ -0,0 +1,137 @@
+from smtplib import SMTPServerDisconnected, SMTPRecipientsRefused
+
+import pytest
+
+from app.smtp_pool import SMTPPool
+
+
+class FakeSMTP:
+    instances = []
+
+    def __init__(self, host, port):
+        self.sent = []
+        self.commands = []
+        self.disconnected = False
+        self.disconnect_on_data = False
+        self.refuse = False
+        self.does_esmtp = True
+        FakeSMTP.instances.append(self)
+
+    def ehlo_or_helo_if_needed(self):
+        pass
+
+    def has_extn(self, opt):
+        return False
+
+    def mail(self, sender, options=()):
+        if self.disconnected:
+            raise SMTPServerDisconnected()
+        return 250, b"OK"
+
+    def rcpt(self, recip, options=()):
+        if self.refuse:
+            return 550, b"refused"
+        return 250, b"OK"
+
+    def data(self, msg):
+        if self.disconnect_on_data:
+            raise SMTPServerDisconnected()
+
+        self.sent.append(msg)
+        return 250, b"OK"
+
+    def noop(self):
+        self.commands.append("noop")
+        if self.disconnected:
+            raise SMTPServerDisconnected()
+        return 250, b"OK"
+
+    def rset(self):
+        self.commands.append("rset")
+        if self.disconnected:
+            raise SMTPServerDisconnected()
+        return 250, b"OK"
+
+    def quit(self):
+        self.commands.append("quit")
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def reset_fake_smtp():
+    FakeSMTP.instances = []
+
+
+def test_reuse_connection():
+    pool = SMTPPool("localhost", 25, smtp_class=FakeSMTP)
+
+    pool.sendmail("a@b.c", "d@e.f", b"msg1")
+    pool.sendmail("a@b.c", "d@e.f", b"msg2")
+
+    assert len(FakeSMTP.instances) == 1
+    assert FakeSMTP.instances[0].sent == [b"msg1", b"msg2"]
+
+
+def test_max_messages_per_connection():
+    pool = SMTPPool("localhost", 25, max_messages=2, smtp_class=FakeSMTP)
+
+    for _ in range(3):
+        pool.sendmail("a@b.c", "d@e.f", b"msg")
+
+    assert len(FakeSMTP.instances) == 2
+    assert FakeSMTP.instances[0].commands == ["quit"]
+
+
+def test_reconnect_when_disconnected():
+    pool = SMTPPool("localhost", 25, smtp_class=FakeSMTP)
+    pool.sendmail("a@b.c", "d@e.f", b"msg1")
+
+    # Postfix closes the connection
+    FakeSMTP.instances[0].disconnected = True
+    pool.sendmail("a@b.c", "d@e.f", b"msg2")
+
+    assert len(FakeSMTP.instances) == 2
+    assert FakeSMTP.instances[1].sent == [b"msg2"]
+
+
+def test_no_retry_when_disconnected_during_data():
+    pool = SMTPPool("localhost", 25, smtp_class=FakeSMTP)
+    pool.sendmail("a@b.c", "d@e.f", b"msg1")
+
+    # Postfix might have received the message: it's not sent again
+    FakeSMTP.instances[0].disconnect_on_data = True
+    with pytest.raises(SMTPServerDisconnected):
+        pool.sendmail("a@b.c", "d@e.f", b"msg2")
+
+    assert len(FakeSMTP.instances) == 1
+
+
+def test_health_check_idle_connection():
+    pool = SMTPPool("localhost", 25, idle_check=0, smtp_class=FakeSMTP)
+    pool.sendmail("a@b.c", "d@e.f", b"msg1")
+
+    FakeSMTP.instances[0].disconnected = True
+    pool.sendmail("a@b.c", "d@e.f", b"msg2")
+
+    assert FakeSMTP.instances[0].commands[0] == "noop"
+    assert FakeSMTP.instances[1].sent == [b"msg2"]
+
+
+def test_reset_after_failed_transaction():
+    pool = SMTPPool("localhost", 25, smtp_class=FakeSMTP)
+    pool.sendmail("a@b.c", "d@e.f", b"msg1")
+
+    FakeSMTP.instances[0].refuse = True
+    with pytest.raises(SMTPRecipientsRefused):
+        pool.sendmail("a@b.c", "d@e.f", b"msg2")
+
+    # the connection is reset and kept in the pool
+    FakeSMTP.instances[0].refuse = False
+    pool.sendmail("a@b.c", "d@e.f", b"msg3")
+
+    # by sendmail then before reusing the connection
+    assert FakeSMTP.instances[0].commands == ["rset", "rset"]
+    assert FakeSMTP.instances[0].sent == [b"msg1", b"msg3"]
+    assert len(FakeSMTP.instances) == 1
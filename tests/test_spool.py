@@ -0,0 +1,98 @@
+import os
+
+from aiosmtpd.smtp import Envelope
+
+from app.spool import Spool
+
+
+def _envelope() -> Envelope:
+    envelope = Envelope()
+    envelope.mail_from = "website@example.com"
+    envelope.rcpt_tos = ["alias@sl.local"]
+    envelope.mail_options = ["BODY=8BITMIME"]
+    envelope.content = b"Subject: hello\r\n\r\nbody\r\n"
+    return envelope
+
+
+def test_put_and_process(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.put(_envelope())
+
+    received = []
+
+    def process(envelope):
+        received.append(envelope)
+        return "250 Message accepted for delivery"
+
+    assert spool.process_one(process)
+    assert not spool.process_one(process)
+
+    envelope = received[0]
+    assert envelope.mail_from == "website@example.com"
+    assert envelope.rcpt_tos == ["alias@sl.local"]
+    assert envelope.mail_options == ["BODY=8BITMIME"]
+    assert envelope.content == b"Subject: hello\r\n\r\nbody\r\n"
+
+    for d in ("tmp", "new", "work", "failed"):
+        assert os.listdir(tmp_path / d) == []
+
+
+def test_retry(tmp_path):
+    spool = Spool(str(tmp_path), retry_delay=0, max_attempts=3)
+    spool.put(_envelope())
+
+    def process(envelope):
+        raise ConnectionError("postfix is down")
+
+    # 3 attempts then the message is moved to failed/
+    for _ in range(3):
+        assert spool.process_one(process)
+
+    assert not spool.process_one(process)
+    assert len(os.listdir(tmp_path / "failed")) == 1
+
+
+def test_retry_later(tmp_path):
+    spool = Spool(str(tmp_path), retry_delay=60)
+    spool.put(_envelope())
+
+    assert spool.process_one(lambda envelope: "451 try again later")
+
+    # not due yet
+    assert not spool.process_one(lambda envelope: "250 OK")
+    assert len(os.listdir(tmp_path / "new")) == 1
+
+
+def test_refused(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.put(_envelope())
+
+    assert spool.process_one(lambda envelope: "550 no such user")
+
+    assert os.listdir(tmp_path / "new") == []
+    assert len(os.listdir(tmp_path / "failed")) == 1
+
+
+def test_unknown_file(tmp_path):
+    spool = Spool(str(tmp_path))
+    (tmp_path / "new" / ".nfs0001").write_bytes(b"")
+    spool.put(_envelope())
+
+    assert spool.process_one(lambda envelope: "250 OK")
+    assert os.listdir(tmp_path / "new") == []
+    assert os.listdir(tmp_path / "failed") == [".nfs0001"]
+
+
+def test_recover(tmp_path):
+    spool = Spool(str(tmp_path))
+    spool.put(_envelope())
+
+    # the worker dies while processing the message
+    msg = spool.claim()
+    assert spool.claim() is None
+
+    spool.recover(pid=os.getpid() + 1)
+    assert spool.claim() is None
+
+    spool.recover(pid=os.getpid())
+    assert spool.claim().envelope.content == msg.envelope.content
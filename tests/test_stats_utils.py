@@ -0,0 +1,95 @@
+from datetime import date
+
+import arrow
+
+from app import stats_utils
+from app.extensions import db
+from app.models import (
+    User,
+    GenEmail,
+    ForwardEmail,
+    ForwardEmailLog,
+    StatsSnapshot,
+    Subscription,
+    PlanEnum,
+)
+
+
+def test_update_snapshots(flask_client, monkeypatch):
+    monkeypatch.setattr(stats_utils, "IGNORED_EMAILS", ["@ignored.com"])
+
+    user = User.create(
+        email="a@b.c",
+        password="password",
+        name="Test User",
+        activated=True,
+        created_at=arrow.get("2020-01-01"),
+    )
+    ignored_user = User.create(
+        email="a@ignored.com",
+        password="password",
+        name="Ignored",
+        created_at=arrow.get("2020-01-01"),
+    )
+    User.create(email="new@b.c", password="password", name="New")
+    db.session.commit()
+    alias = GenEmail.get_by(user_id=user.id)
+
+    forward_email = ForwardEmail.create_new(
+        gen_email_id=alias.id,
+        website_email="web@site.com",
+        website_from="Web <web@site.com>",
+    )
+    db.session.commit()
+
+    def log(created_at, **kwargs):
+        ForwardEmailLog.create(
+            forward_id=forward_email.id, created_at=arrow.get(created_at), **kwargs
+        )
+        db.session.commit()
+
+    log("2020-01-01T10:00:00")
+    log("2020-01-02T10:00:00")
+    log("2020-01-02T11:00:00", is_reply=True)
+
+    # the first snapshot counts everything
+    snapshot = stats_utils.update_snapshots(today=date(2020, 1, 3))
+    assert snapshot.date == date(2020, 1, 2)
+    assert (snapshot.nb_forward, snapshot.nb_reply) == (2, 1)
+    assert (snapshot.day_nb_forward, snapshot.day_nb_reply) == (1, 1)
+
+    # the next ones only count the logs of their day
+    log("2020-01-03T10:00:00", blocked=True)
+    log("2020-01-04T10:00:00")
+    GenEmail.get_by(user_id=ignored_user.id).enabled = False
+    Subscription.create(
+        cancel_url="https://cancel",
+        update_url="https://update",
+        subscription_id="123",
+        event_time=arrow.get("2020-01-04T10:00:00"),
+        next_bill_date=date(2020, 2, 4),
+        plan=PlanEnum.monthly,
+        user_id=user.id,
+        created_at=arrow.get("2020-01-04T10:00:00"),
+    )
+    db.session.commit()
+
+    snapshot = stats_utils.update_snapshots(today=date(2020, 1, 5))
+    assert snapshot.date == date(2020, 1, 4)
+    assert (snapshot.nb_forward, snapshot.nb_block, snapshot.nb_reply) == (3, 1, 1)
+    assert snapshot.day_nb_forward == 1
+    assert StatsSnapshot.get_by(date=date(2020, 1, 3)).day_nb_block == 1
+
+    # users created after the day are not counted, ignored users neither
+    assert snapshot.nb_user == 1
+    # the disabled aliases are counted like before, with those of the ignored users
+    assert snapshot.nb_disabled_alias == 1
+    assert snapshot.nb_premium == 1
+
+    # the past days caught up: the disabled aliases of the day aren't known
+    past_snapshot = StatsSnapshot.get_by(date=date(2020, 1, 3))
+    assert past_snapshot.nb_disabled_alias is None
+    assert past_snapshot.nb_premium == 0
+
+    # the snapshots are already there
+    assert stats_utils.update_snapshots(today=date(2020, 1, 5)) is None
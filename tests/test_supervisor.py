@@ -0,0 +1,66 @@
+import os
+import time
+
+from app.supervisor import Supervisor
+
+
+def _exit_now():
+    os._exit(1)
+
+
+def _sleep():
+    time.sleep(60)
+
+
+def test_restart_dead_process():
+    exited = []
+    # every exit is counted as a slow one: restarted right away
+    supervisor = Supervisor(stop_timeout=5, min_uptime=0)
+    supervisor.add("exit_now", _exit_now, on_exit=exited.append)
+    supervisor.start()
+
+    first_pid = supervisor.pids()[0]
+    supervisor._workers[0].process.join(10)
+    supervisor.check()
+
+    assert exited == [first_pid]
+    assert supervisor.pids()[0] != first_pid
+
+    supervisor.stop()
+
+
+def test_restart_backoff():
+    supervisor = Supervisor(stop_timeout=5, check_interval=0.1, max_restart_delay=0.15)
+    supervisor.add("exit_now", _exit_now)
+    supervisor.start()
+    worker = supervisor._workers[0]
+
+    pids = []
+    delays = []
+    for _ in range(3):
+        pids.append(worker.process.pid)
+        worker.process.join(10)
+        supervisor.check()
+        delays.append(round(worker.restart_at - time.time(), 2))
+
+        # not restarted before the delay
+        assert supervisor.pids() == [pids[-1]]
+        time.sleep(delays[-1] + 0.05)
+        supervisor.check()
+        assert supervisor.pids() != [pids[-1]]
+
+    # doubled at each quick failure, up to max_restart_delay
+    assert delays[0] <= 0.1 and delays[1] > 0.1 and delays[2] <= 0.15
+    assert worker.nb_quick_failure == 3
+
+    supervisor.stop()
+
+
+def test_stop():
+    supervisor = Supervisor(stop_timeout=5)
+    supervisor.add("sleep", _sleep, nb=2)
+    supervisor.start()
+    assert len(supervisor.pids()) == 2
+
+    supervisor.stop()
+    assert all(not w.process.is_alive() for w in supervisor._workers)